@@ -0,0 +1,66 @@
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from rest_framework import status
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+
+def connections_used(**kwargs):
+    """Signal receiver marking when open connections were last used"""
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.last_used_at = now
+
+
+def check_connections(**kwargs):
+    """Signal receiver closing persistent connections that stopped working
+
+    With CONN_MAX_AGE a connection outlives the request, so a restart of
+    the server or of a pooler would break the next request using it. Only
+    connections idle longer than DATABASE_HEALTH_CHECK_IDLE seconds are
+    pinged before the request and reopened on demand, a connection in use
+    costs no query. A connection failing during a request is closed by
+    Django when the request finishes.
+    """
+    if not settings.DATABASE_HEALTH_CHECKS:
+        return
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        last_used_at = getattr(connection, 'last_used_at', None)
+        if last_used_at is not None and (
+            now - last_used_at < settings.DATABASE_HEALTH_CHECK_IDLE
+        ):
+            continue
+        if not connection.is_usable():
+            connection.close()
+
+
+class HealthView(APIView):
+    """Health of the API and its databases for load balancers"""
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        databases = {}
+        for connection in connections.all():
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                databases[connection.alias] = 'ok'
+            except DatabaseError:
+                databases[connection.alias] = 'error'
+
+        healthy = all(value == 'ok' for value in databases.values())
+        return Response(
+            {'status': 'ok' if healthy else 'error', 'databases': databases},
+            status=(
+                status.HTTP_200_OK if healthy
+                else status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        )
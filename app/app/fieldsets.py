@@ -0,0 +1,197 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import ManyRelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+
+FIELDSET_PARAMS = ('fields', 'omit', 'expand')
+
+
+def parse_fieldset(query_params):
+    """Generic function for reading ?fields=, ?omit= and ?expand=
+
+    Each parameter is a list of names separated by commas and may be sent
+    several times. Returns a dict with a set by parameter, None when none
+    of them is sent.
+    """
+    fieldset = {}
+    for param in FIELDSET_PARAMS:
+        names = set()
+        for value in query_params.getlist(param):
+            names.update(name for name in value.split(',') if name)
+        fieldset[param] = names
+    if not any(fieldset.values()):
+        return None
+    return fieldset
+
+
+def expansion_allowed(viewset_class, request):
+    """Generic function for checking a request could list a relation
+
+    The permissions of the viewset of the relation are checked as for its
+    list action, so an expansion shows no more than the viewset itself.
+    """
+    if isinstance(viewset_class, str):
+        viewset_class = import_string(viewset_class)
+    view = viewset_class(
+        action='list',
+        request=request,
+        args=(),
+        kwargs={},
+        format_kwarg=None
+    )
+    return all(
+        permission.has_permission(request, view)
+        for permission in view.get_permissions()
+    )
+
+
+def related_lookups(serializer, model, prefix='', prefetched=False):
+    """Generic function for the relations read by the fields of a serializer
+
+    Many relations sent as ids are prefetched reading only the ids, nested
+    serializers are joined (or prefetched below a many relation) together
+    with their own relations. Relations sent as the id of a foreign key
+    need no query. Returns the lookups for select_related and for
+    prefetch_related.
+    """
+    select, prefetch = [], []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*' or '.' in field.source:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if not model_field.is_relation:
+            continue
+
+        lookup = prefix + field.source
+        many = model_field.one_to_many or model_field.many_to_many
+        if isinstance(field, BaseSerializer):
+            if many or prefetched:
+                prefetch.append(lookup)
+            else:
+                select.append(lookup)
+            nested = field
+            if isinstance(field, ListSerializer):
+                nested = field.child
+            nested_select, nested_prefetch = related_lookups(
+                nested,
+                model_field.related_model,
+                lookup + '__',
+                prefetched or many
+            )
+            select += nested_select
+            prefetch += nested_prefetch
+        elif isinstance(field, ManyRelatedField) and model_field.one_to_many:
+            related = model_field.related_model
+            prefetch.append(Prefetch(lookup, queryset=related.objects.only(
+                'pk', model_field.field.name
+            ).order_by('pk')))
+        elif isinstance(field, ManyRelatedField):
+            prefetch.append(lookup)
+    return select, prefetch
+
+
+class FieldsetMixin:
+    """Mixin choosing the fields of a serializer by the query string
+
+    ?fields= keeps only the given fields, ?omit= removes them and ?expand=
+    sends the serializers of Meta.expandable_fields instead of the ids.
+    Values of expandable_fields are pairs of the serializer and the
+    viewset of the relation (classes or dotted paths); an expansion the
+    user could not list through that viewset is rejected with 403. Only
+    the serializer of a read request is changed, nested and expanded
+    serializers and the responses of writes keep every field.
+    """
+
+    def requested_fieldset(self):
+        """Fieldset of the request, None when it does not apply"""
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+
+        parent = self.parent
+        if isinstance(parent, ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return None
+        return parse_fieldset(request.query_params)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.requested_fieldset()
+        if fieldset is None:
+            return fields
+
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        unknown = (fieldset['fields'] | fieldset['omit']) - set(fields)
+        if unknown:
+            message = 'Campos desconocidos: {}.'
+            raise ValidationError({
+                'fields': message.format(', '.join(sorted(unknown)))
+            })
+        unknown = fieldset['expand'] - set(expandable)
+        if unknown:
+            message = 'Relaciones no expandibles: {}.'
+            raise ValidationError({
+                'expand': message.format(', '.join(sorted(unknown)))
+            })
+
+        request = self.context['request']
+        denied = [
+            name for name in fieldset['expand']
+            if not expansion_allowed(expandable[name][1], request)
+        ]
+        if denied:
+            message = 'No tiene permiso para expandir: {}.'
+            raise PermissionDenied(message.format(', '.join(sorted(denied))))
+
+        for name in fieldset['expand']:
+            fields[name] = self.expanded_field(
+                expandable[name][0],
+                fields[name]
+            )
+        if fieldset['fields']:
+            kept = fieldset['fields'] | fieldset['expand']
+            for name in list(fields):
+                if name not in kept:
+                    del fields[name]
+        for name in fieldset['omit']:
+            fields.pop(name, None)
+        return fields
+
+    def expanded_field(self, serializer_class, field):
+        """Nested serializer replacing a relation sent as ids"""
+        if isinstance(serializer_class, str):
+            serializer_class = import_string(serializer_class)
+        kwargs = {'source': field.source} if field.source else {}
+        return serializer_class(
+            many=isinstance(field, ManyRelatedField),
+            read_only=True,
+            **kwargs
+        )
+
+
+class FieldsetQuerysetMixin:
+    """Mixin loading only the relations sent by the serializer of a view
+
+    Relations left out by ?fields= or ?omit= are not queried and the
+    relations of ?expand= are read in bulk with the objects.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        select, prefetch = related_lookups(
+            self.get_serializer(),
+            queryset.model
+        )
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
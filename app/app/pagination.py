@@ -0,0 +1,21 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """Pagination by cursor over the primary key
+
+    Each page is read with WHERE id > cursor ORDER BY id LIMIT size over
+    the primary key index, so deep pages cost the same as the first one.
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self):
+        return settings.PAGINATION_MAX_PAGE_SIZE
+
+
+class BeginAtCursorPagination(IdCursorPagination):
+    """Pagination by cursor over the begin date of trips"""
+    ordering = ('begin_at', 'id')
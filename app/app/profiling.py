@@ -0,0 +1,177 @@
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from trip.permissions import IsAdminProfile
+
+
+class Histogram:
+    """Counts of observed values by upper bound, with sum and max"""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def observe(self, value):
+        index = 0
+        while index < len(self.bounds) and value > self.bounds[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the fraction of values"""
+        if not self.count:
+            return 0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                if index < len(self.bounds):
+                    return self.bounds[index]
+                return self.max
+        return self.max
+
+    def as_dict(self):
+        buckets = {str(bound): count
+                   for bound, count in zip(self.bounds, self.counts)}
+        buckets['+Inf'] = self.counts[-1]
+        return {
+            'count': self.count,
+            'sum': round(self.total, 3),
+            'max': round(self.max, 3),
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'buckets': buckets,
+        }
+
+
+class ViewMetrics:
+    """Histograms of wall time, DB time and DB queries by view"""
+
+    def __init__(self):
+        self.views = {}
+        self.lock = threading.Lock()
+
+    def observe(self, view, wall_ms, db_ms, queries):
+        with self.lock:
+            histograms = self.views.get(view)
+            if histograms is None:
+                histograms = self.views[view] = {
+                    'wall_ms': Histogram(settings.PROFILING_MS_BUCKETS),
+                    'db_ms': Histogram(settings.PROFILING_MS_BUCKETS),
+                    'queries': Histogram(settings.PROFILING_QUERY_BUCKETS),
+                }
+            histograms['wall_ms'].observe(wall_ms)
+            histograms['db_ms'].observe(db_ms)
+            histograms['queries'].observe(queries)
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                view: {
+                    name: histogram.as_dict()
+                    for name, histogram in histograms.items()
+                }
+                for view, histograms in sorted(self.views.items())
+            }
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+
+
+view_metrics = ViewMetrics()
+
+
+class QueryTimer:
+    """Execute wrapper adding up queries and time spent in the database"""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+def request_view_name(request):
+    """Generic function for naming the view of a request in the metrics"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return '{} {}'.format(request.method, match.view_name)
+
+
+class ProfilingMiddleware:
+    """Middleware measuring wall time, DB queries and DB time by view
+
+    Measures are sent as a Server-Timing header and added to in-process
+    histograms read by the metrics endpoint. When PROFILING_ENABLED is off
+    the middleware removes itself from the chain at startup.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        wall_ms = (time.perf_counter() - started) * 1000
+        db_ms = timer.seconds * 1000
+
+        view_metrics.observe(
+            request_view_name(request),
+            wall_ms,
+            db_ms,
+            timer.queries
+        )
+        response['Server-Timing'] = (
+            'app;dur={:.2f}, db;dur={:.2f};desc="{} queries"'.format(
+                wall_ms,
+                db_ms,
+                timer.queries
+            )
+        )
+        return response
+
+
+class MetricsView(APIView):
+    """Histograms of the profiled views, only for admins"""
+    permission_classes = [IsAdminProfile]
+
+    def get(self, request):
+        data = {
+            'enabled': settings.PROFILING_ENABLED,
+            'views': view_metrics.as_dict(),
+        }
+        return Response(data, status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        view_metrics.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
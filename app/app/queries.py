@@ -0,0 +1,175 @@
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from app.profiling import request_view_name
+
+
+logger = logging.getLogger(__name__)
+
+SQL_STRINGS = re.compile(r"'(?:[^']|'')*'")
+SQL_NUMBERS = re.compile(r'\b\d+(?:\.\d+)?\b')
+SQL_LISTS = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+SQL_SPACES = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """Generic function for removing values of a SQL statement
+
+    Literals become ? and lists of values (?, ?, ...) become (...), so
+    statements only differing by their values are the same.
+    """
+    sql = SQL_STRINGS.sub('?', sql)
+    sql = SQL_NUMBERS.sub('?', sql)
+    sql = SQL_LISTS.sub('(...)', sql)
+    return SQL_SPACES.sub(' ', sql).strip()
+
+
+def sql_fingerprint(sql):
+    """Generic function for a short id of a normalized SQL statement"""
+    return hashlib.sha1(sql.encode()).hexdigest()[:12]
+
+
+class QueryCapture:
+    """Execute wrapper grouping statements by normalized SQL
+
+    Statements repeated at least duplicate_threshold times (N+1) and
+    statements slower than slow_ms are reported.
+    """
+
+    def __init__(self, duplicate_threshold=None, slow_ms=None):
+        self.duplicate_threshold = (
+            duplicate_threshold or settings.QUERY_DUPLICATE_THRESHOLD
+        )
+        self.slow_ms = slow_ms or settings.QUERY_SLOW_MS
+        self.statements = OrderedDict()
+        self.slow = []
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.add(sql, elapsed_ms)
+
+    def add(self, sql, elapsed_ms):
+        normalized = normalize_sql(sql)
+        fingerprint = sql_fingerprint(normalized)
+        statement = self.statements.setdefault(fingerprint, {
+            'sql': normalized,
+            'count': 0,
+            'ms': 0,
+        })
+        statement['count'] += 1
+        statement['ms'] += elapsed_ms
+        self.queries += 1
+        if elapsed_ms >= self.slow_ms:
+            self.slow.append({
+                'fingerprint': fingerprint,
+                'sql': normalized,
+                'ms': elapsed_ms,
+            })
+
+    @property
+    def duplicates(self):
+        return [
+            dict(statement, fingerprint=fingerprint)
+            for fingerprint, statement in self.statements.items()
+            if statement['count'] >= self.duplicate_threshold
+        ]
+
+    @property
+    def has_problems(self):
+        return bool(self.slow or self.duplicates)
+
+    def report(self, width=120):
+        """Compact lines with duplicated and slow statements"""
+        lines = []
+        for statement in self.duplicates:
+            lines.append('  {}x {} {:.1f}ms {}'.format(
+                statement['count'],
+                statement['fingerprint'],
+                statement['ms'],
+                statement['sql'][:width]
+            ))
+        for statement in self.slow:
+            lines.append('  slow {} {:.1f}ms {}'.format(
+                statement['fingerprint'],
+                statement['ms'],
+                statement['sql'][:width]
+            ))
+        return '\n'.join(lines)
+
+
+@contextmanager
+def wrap_connections(wrapper):
+    """Generic function for installing an execute wrapper on connections"""
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        yield wrapper
+
+
+@contextmanager
+def capture_queries(duplicate_threshold=None, slow_ms=None):
+    """Generic function for capturing statements on every connection"""
+    capture = QueryCapture(duplicate_threshold, slow_ms)
+    with wrap_connections(capture):
+        yield capture
+
+
+class QueryInspectorMiddleware:
+    """Middleware logging duplicated and slow statements by view
+
+    Statements of a streamed response run while its body is sent, they
+    are captured during the iteration and logged once it ends. When
+    QUERY_INSPECTOR_ENABLED is off the middleware removes itself from the
+    chain at startup.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSPECTOR_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with capture_queries() as capture:
+            response = self.get_response(request)
+
+        if response.streaming:
+            response.streaming_content = self.streamed(
+                request,
+                response.streaming_content,
+                capture
+            )
+        else:
+            self.log(request, capture)
+        return response
+
+    def streamed(self, request, content, capture):
+        """Body of a streamed response capturing the statements it runs"""
+        try:
+            with wrap_connections(capture):
+                yield from content
+        finally:
+            self.log(request, capture)
+
+    def log(self, request, capture):
+        if capture.has_problems:
+            logger.warning(
+                '%s: %s queries, %s duplicated, %s slow\n%s',
+                request_view_name(request),
+                capture.queries,
+                len(capture.duplicates),
+                len(capture.slow),
+                capture.report()
+            )
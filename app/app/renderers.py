@@ -0,0 +1,46 @@
+import msgpack
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+
+
+def msgpack_default(value):
+    """Generic function for packing values out of the MessagePack types
+
+    Dates, decimals, uuids and lazy strings are packed as the JSON
+    renderer sends them, so both formats carry the same data.
+    """
+    return JSONEncoder().default(value)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Renderer for MessagePack, selected with Accept: application/msgpack
+
+    Smaller than JSON and faster to parse for clients with slow links,
+    the data is the same the JSON renderer sends.
+    """
+    media_type = MSGPACK_MEDIA_TYPE
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=msgpack_default, use_bin_type=True)
+
+
+class MessagePackParser(BaseParser):
+    """Parser for request bodies sent as application/msgpack"""
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            message = 'El cuerpo MessagePack no es válido: {}'
+            raise ParseError(message.format(exc))
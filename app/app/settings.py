@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.profiling.ProfilingMiddleware',
+    'app.queries.QueryInspectorMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -85,20 +89,158 @@ CORS_ORIGIN_WHITELIST = [
 
 REST_FRAMEWORK = {
    'DEFAULT_AUTHENTICATION_CLASSES': (
-   'rest_framework.authentication.TokenAuthentication',
-   )
+   'user.authentication.CachedTokenAuthentication',
+   ),
+   'DEFAULT_PAGINATION_CLASS': 'app.pagination.IdCursorPagination',
+   'PAGE_SIZE': 50,
+   'DEFAULT_RENDERER_CLASSES': (
+   'rest_framework.renderers.JSONRenderer',
+   'rest_framework.renderers.BrowsableAPIRenderer',
+   'app.renderers.MessagePackRenderer',
+   ),
+   'DEFAULT_PARSER_CLASSES': (
+   'rest_framework.parsers.JSONParser',
+   'rest_framework.parsers.FormParser',
+   'rest_framework.parsers.MultiPartParser',
+   'app.renderers.MessagePackParser',
+   ),
 }
 
+PAGINATION_MAX_PAGE_SIZE = 500
+
+# Rows read and encoded at a time by lists sent with ?stream=true
+
+STREAMING_CHUNK_SIZE = 500
+
+# Token to user mapping kept in memory by each process, entries expire after
+# TOKEN_AUTH_CACHE_TTL seconds. TOKEN_AUTH_SHARED_CACHE is an optional alias
+# of CACHES shared by every process.
+
+TOKEN_AUTH_CACHE_SIZE = 10000
+
+TOKEN_AUTH_CACHE_TTL = 60
+
+TOKEN_AUTH_SHARED_CACHE = None
+
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite by default; PostgreSQL with DATABASE_ENGINE=postgresql and the
+# DATABASE_* environment variables. Connections persist CONN_MAX_AGE
+# seconds; with DATABASE_HEALTH_CHECKS=1 a connection idle longer than
+# DATABASE_HEALTH_CHECK_IDLE seconds is pinged before the next request.
+# DATABASE_POOL=pgbouncer disables server side cursors, needed behind a
+# transaction pooler.
+
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'sqlite3')
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DATABASE_NAME', 'trips'),
+            'USER': os.environ.get('DATABASE_USER', 'trips'),
+            'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+            'HOST': os.environ.get('DATABASE_HOST', 'localhost'),
+            'PORT': os.environ.get('DATABASE_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+            'DISABLE_SERVER_SIDE_CURSORS': (
+                os.environ.get('DATABASE_POOL') == 'pgbouncer'
+            ),
+            'OPTIONS': {
+                'connect_timeout': int(
+                    os.environ.get('DATABASE_CONNECT_TIMEOUT', 5)
+                ),
+            },
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+
+DATABASE_HEALTH_CHECKS = os.environ.get('DATABASE_HEALTH_CHECKS', '0') == '1'
+
+DATABASE_HEALTH_CHECK_IDLE = int(
+    os.environ.get('DATABASE_HEALTH_CHECK_IDLE', 30)
+)
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+# Cached responses and seat maps are culled in their own alias, sized with
+# RESPONSE_CACHE_MAX_ENTRIES. Generations of models and objects live in an
+# alias never culled, evicting one would invalidate unrelated responses.
+# Idempotency records use their own alias so responses and seat maps do not
+# cull them. The local memory default only deduplicates retries reaching the
+# same process; production needs a shared backend (memcached, Redis) set with
+# IDEMPOTENCY_CACHE_BACKEND and IDEMPOTENCY_CACHE_LOCATION.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': os.environ.get(
+            'RESPONSE_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('RESPONSE_CACHE_LOCATION', 'responses'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(
+                os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 10000)
+            ),
+        },
+    },
+    'generations': {
+        'BACKEND': os.environ.get(
+            'GENERATIONS_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('GENERATIONS_CACHE_LOCATION', 'generations'),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': sys.maxsize,
+        },
+    },
+    'idempotency': {
+        'BACKEND': os.environ.get(
+            'IDEMPOTENCY_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('IDEMPOTENCY_CACHE_LOCATION', 'idempotency'),
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(
+                os.environ.get('IDEMPOTENCY_CACHE_MAX_ENTRIES', 100000)
+            ),
+        },
+    },
 }
 
+# Responses of route and trip reads are cached until a write moves the
+# generation of their model; the local memory cache invalidates only its
+# own process, use a shared cache with several workers
+
+RESPONSE_CACHE = 'responses'
+
+RESPONSE_GENERATIONS_CACHE = 'generations'
+
+RESPONSE_CACHE_TTL = 60
+
+# Responses stored for requests sent with an Idempotency-Key header, in the
+# alias of CACHES named by the environment variable IDEMPOTENCY_CACHE
+
+IDEMPOTENCY_CACHE = os.environ.get('IDEMPOTENCY_CACHE', 'idempotency')
+
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+
+IDEMPOTENCY_LOCK_TTL = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -139,3 +281,58 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 AUTH_USER_MODEL = 'main.User'
+
+# Ticket holds during checkout
+
+TICKET_HOLD_MINUTES = 10
+
+TICKET_HOLD_MAX_MINUTES = 30
+
+# Background sweeper for expired holds, it could also run as a separated
+# process with: python manage.py release_expired_holds --interval 60
+TICKET_HOLD_SWEEPER = os.environ.get('TICKET_HOLD_SWEEPER') == '1'
+
+TICKET_HOLD_SWEEP_INTERVAL = 60
+
+TICKET_HOLD_SWEEP_BATCH = 1000
+
+# Seat maps of trips are cached until a ticket of the trip changes
+
+SEAT_MAP_CACHE = 'responses'
+
+SEAT_MAP_CACHE_TTL = 60 * 5
+
+# Seats counters of trips are repaired in batches with:
+# python manage.py sync_trip_counters
+
+TRIP_COUNTERS_SYNC_BATCH = 1000
+
+# Rollup of trips and tickets by route, bus and day, rebuilt with:
+# python manage.py rebuild_route_stats --recount
+
+ROUTE_STATS_REBUILD_BATCH = 1000
+
+# Profiling of views with Server-Timing headers and histograms read at
+# /api/metrics/, enabled with the environment variable PROFILING=1
+
+PROFILING_ENABLED = os.environ.get('PROFILING') == '1'
+
+PROFILING_MS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+PROFILING_QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+# Log of duplicated (N+1) and slow statements by view, enabled with the
+# environment variable QUERY_INSPECTOR=1
+
+QUERY_INSPECTOR_ENABLED = os.environ.get('QUERY_INSPECTOR') == '1'
+
+QUERY_DUPLICATE_THRESHOLD = 3
+
+QUERY_SLOW_MS = 100
+
+# Baseline of the benchmark command, regressions over tolerance fail with:
+# python manage.py benchmark
+
+BENCHMARK_BASELINE = os.path.join(BASE_DIR, 'benchmarks', 'baseline.json')
+
+BENCHMARK_TOLERANCE = 0.5
@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+
+STREAM_VALUES = ('1', 'true', 'True')
+
+
+def stream_requested(request):
+    """Generic function for checking a list is requested with ?stream=true"""
+    return request.query_params.get('stream') in STREAM_VALUES
+
+
+def queryset_chunks(queryset, chunk_size):
+    """Generic function for reading a queryset in chunks by primary key
+
+    Each chunk is read with WHERE pk > last ORDER BY pk LIMIT chunk_size,
+    so prefetches run by chunk and only one chunk is kept in memory.
+    """
+    queryset = queryset.order_by('pk')
+    last = None
+    while True:
+        chunk = queryset if last is None else queryset.filter(pk__gt=last)
+        chunk = list(chunk[:chunk_size])
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1].pk
+
+
+def stream_json(rows, chunk_size=None):
+    """Generic function for encoding rows as a JSON array piece by piece
+
+    Rows are encoded as the JSON renderer does and sent chunk_size rows at
+    a time, the array is never built in memory.
+    """
+    chunk_size = chunk_size or settings.STREAMING_CHUNK_SIZE
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    separator = '['
+    pieces = []
+    for row in rows:
+        pieces.append(separator)
+        pieces.append(encoder.encode(row))
+        separator = ','
+        if len(pieces) >= chunk_size * 2:
+            yield ''.join(pieces).encode()
+            pieces = []
+    pieces.append('[]' if separator == '[' else ']')
+    yield ''.join(pieces).encode()
+
+
+def streaming_response(rows):
+    """Generic function for sending rows as a streamed JSON array"""
+    return StreamingHttpResponse(
+        stream_json(rows),
+        content_type='application/json'
+    )
+
+
+class StreamingListMixin:
+    """Mixin sending the list of a view as a streamed JSON array
+
+    With ?stream=true the list is not paginated, the queryset is read and
+    serialized in chunks of STREAMING_CHUNK_SIZE while the response is
+    sent, so memory does not grow with the number of rows. Streamed lists
+    are not cached.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not stream_requested(request):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        # Fields are checked before the response starts
+        self.get_serializer().fields
+
+        def rows():
+            chunks = queryset_chunks(queryset, settings.STREAMING_CHUNK_SIZE)
+            for chunk in chunks:
+                yield from self.get_serializer(chunk, many=True).data
+
+        return streaming_response(rows())
@@ -16,10 +16,15 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from app.database import HealthView
+from app.profiling import MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/trip/', include('trip.urls')),
     path('api/user/', include('user.urls')),
+    path('api/metrics/', MetricsView.as_view(), name='metrics'),
+    path('api/health/', HealthView.as_view(), name='health'),
 ]
 
 urlpatterns += [
@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.core.signals import request_finished, request_started
 
 
 class MainConfig(AppConfig):
     name = 'main'
+
+    def ready(self):
+        from app.database import check_connections, connections_used
+
+        request_started.connect(check_connections)
+        request_finished.connect(connections_used)
@@ -0,0 +1,37 @@
+# Generated by Django 3.1.6 on 2026-10-18 11:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_auto_20210211_1355'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seat',
+            name='seat_class',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'Standard'), (2, 'Premium')], default=1),
+        ),
+        migrations.CreateModel(
+            name='SeatLayout',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=120)),
+                ('capacity', models.PositiveSmallIntegerField()),
+                ('rows', models.PositiveSmallIntegerField()),
+                ('premium_rows', models.PositiveSmallIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='layouts', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='bus',
+            name='layout',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='buses', to='main.seatlayout'),
+        ),
+    ]
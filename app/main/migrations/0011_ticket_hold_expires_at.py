@@ -0,0 +1,18 @@
+# Generated by Django 3.1.6 on 2026-10-18 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_auto_20261018_0801'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='hold_expires_at',
+            field=models.DateTimeField(db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.1.6 on 2026-10-18 11:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_ticket_hold_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['origin', 'destination'], name='main_route_origin_cfba17_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['route', 'begin_at'], name='main_trip_route_i_cae9b3_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.1.6 on 2026-10-18 11:10
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_seats(apps, schema_editor):
+    Trip = apps.get_model('main', 'Trip')
+    Ticket = apps.get_model('main', 'Ticket')
+
+    def tickets_count(**filters):
+        tickets = Ticket.objects.filter(
+            trip=OuterRef('pk'),
+            **filters
+        ).order_by().values('trip').annotate(count=Count('id'))
+        return Coalesce(
+            Subquery(tickets.values('count'), output_field=IntegerField()),
+            0
+        )
+
+    Trip.objects.update(
+        seats_total=tickets_count(),
+        seats_reserved=tickets_count(reserved=True),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_auto_20261018_0808'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='seats_reserved',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='seats_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_seats, migrations.RunPython.noop),
+    ]
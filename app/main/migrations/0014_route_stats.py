@@ -0,0 +1,56 @@
+# Generated by Django 3.1.6 on 2026-10-18 11:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def build_stats(apps, schema_editor):
+    Trip = apps.get_model('main', 'Trip')
+    RouteStats = apps.get_model('main', 'RouteStats')
+
+    rows = Trip.objects.annotate(day=TruncDate('begin_at')).values(
+        'route', 'bus', 'day'
+    ).annotate(
+        trips_count=Count('id'),
+        tickets_count=Sum('seats_total'),
+        reserved_count=Sum('seats_reserved'),
+    ).order_by()
+    RouteStats.objects.bulk_create([
+        RouteStats(
+            route_id=row['route'],
+            bus_id=row['bus'],
+            day=row['day'],
+            trips=row['trips_count'],
+            tickets=row['tickets_count'],
+            reserved=row['reserved_count'],
+        )
+        for row in rows.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_trip_seats_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('trips', models.PositiveIntegerField(default=0)),
+                ('tickets', models.PositiveIntegerField(default=0)),
+                ('reserved', models.PositiveIntegerField(default=0)),
+                ('bus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats_bus', to='main.bus')),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats_route', to='main.route')),
+            ],
+            options={
+                'unique_together': {('route', 'bus', 'day')},
+            },
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
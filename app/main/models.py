@@ -25,9 +25,47 @@ class Route(models.Model):
         related_name='routes',
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['origin', 'destination']),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class SeatLayout(models.Model):
+    """Seat layout to be used for generate seats of buses"""
+    name = models.CharField(max_length=120)
+    capacity = models.PositiveSmallIntegerField()
+    rows = models.PositiveSmallIntegerField()
+    premium_rows = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='layouts',
+    )
+
     def __str__(self):
         return self.name
 
+    @property
+    def seats_per_row(self):
+        """Quantity of seats by row, the last row could be incomplete"""
+        return -(-self.capacity // self.rows)
+
+    @property
+    def premium_seats(self):
+        """Quantity of seats in premium rows, numbered from the front"""
+        return min(self.premium_rows * self.seats_per_row, self.capacity)
+
+    def seat_class(self, number):
+        """Seat class for the seat number in this layout"""
+        if number <= self.premium_seats:
+            return Seat.PREMIUM
+        return Seat.STANDARD
+
 
 class Bus(models.Model):
     """Bus to be used to travel a route with passengers"""
@@ -43,6 +81,12 @@ class Bus(models.Model):
         on_delete=models.CASCADE,
         null=True,
     )
+    layout = models.ForeignKey(
+        'SeatLayout',
+        on_delete=models.SET_NULL,
+        related_name='buses',
+        null=True,
+    )
 
     def __str__(self):
         return self.num_plate
@@ -50,7 +94,17 @@ class Bus(models.Model):
 
 class Seat(models.Model):
     """Seat to be used in bus"""
+    STANDARD = 1
+    PREMIUM = 2
+    CLASSES = (
+        (STANDARD, 'Standard'),
+        (PREMIUM, 'Premium'),
+    )
     number = models.PositiveSmallIntegerField()
+    seat_class = models.PositiveSmallIntegerField(
+        choices=CLASSES,
+        default=STANDARD,
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -69,6 +123,8 @@ class Trip(models.Model):
     begin_at = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
     name = models.CharField(max_length=120)
+    seats_total = models.PositiveIntegerField(default=0)
+    seats_reserved = models.PositiveIntegerField(default=0)
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -85,14 +141,41 @@ class Trip(models.Model):
         related_name='trips_bus',
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['route', 'begin_at']),
+        ]
+
     def __str__(self):
         return self.name
 
 
+class RouteStats(models.Model):
+    """Rollup of trips and tickets of a route by bus and day"""
+    day = models.DateField()
+    trips = models.PositiveIntegerField(default=0)
+    tickets = models.PositiveIntegerField(default=0)
+    reserved = models.PositiveIntegerField(default=0)
+    route = models.ForeignKey(
+        'Route',
+        on_delete=models.CASCADE,
+        related_name='stats_route',
+    )
+    bus = models.ForeignKey(
+        'Bus',
+        on_delete=models.CASCADE,
+        related_name='stats_bus',
+    )
+
+    class Meta:
+        unique_together = ('route', 'bus', 'day')
+
+
 class Ticket(models.Model):
     """Ticket to be used in trip"""
     created_at = models.DateTimeField(auto_now_add=True)
     reserved = models.BooleanField(default=False)
+    hold_expires_at = models.DateTimeField(null=True, db_index=True)
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
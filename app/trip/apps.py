@@ -1,5 +1,17 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import post_delete
 
 
 class TripConfig(AppConfig):
     name = 'trip'
+
+    def ready(self):
+        from main.models import Trip
+        from trip.route_stats import trip_deleted
+
+        post_delete.connect(trip_deleted, sender=Trip)
+
+        if settings.TICKET_HOLD_SWEEPER:
+            from trip.reservations import start_hold_sweeper
+            start_hold_sweeper()
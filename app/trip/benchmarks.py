@@ -0,0 +1,270 @@
+import json
+import time
+from contextlib import contextmanager
+from io import BytesIO
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, \
+                             setup_test_environment, \
+                             teardown_test_environment
+from django.urls import reverse
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from app.renderers import MessagePackParser, MessagePackRenderer
+from main import models
+from trip.dataset import generate_dataset
+from trip.response_cache import response_cache
+
+
+@contextmanager
+def benchmark_database():
+    """Generic function for running a benchmark in a test database
+
+    The test environment accepts the host of the test client, the test
+    database is destroyed when the benchmark ends.
+    """
+    old_name = connection.settings_dict['NAME']
+    setup_test_environment()
+    connection.creation.create_test_db(
+        verbosity=0,
+        autoclobber=True,
+        serialize=False
+    )
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def percentile(values, fraction):
+    """Generic function for the nearest rank percentile of sorted values"""
+    if not values:
+        return 0
+    index = max(int(round(fraction * len(values) + 0.5)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def seed_dataset(routes=100, buses=20, seats=40, trips=10000,
+                 reserved_ratio=0.5, days=30, seed=1):
+    """Generic function for inserting the dataset of the benchmark
+
+    Returns the users and the route used by the scenarios.
+    """
+    dataset = generate_dataset(
+        {1: 1, 2: 100, 3: 0},
+        routes,
+        buses,
+        seats,
+        trips,
+        reserved_ratio,
+        days,
+        seed=seed,
+        prefix='bench'
+    )
+
+    route = models.Route.objects.order_by('id').first()
+    return {
+        'admin': models.User.objects.get(id=dataset['admins'][0]),
+        'passenger': models.User.objects.get(id=dataset['users'][2][0]),
+        'origin': route.origin if route else '',
+        'destination': route.destination if route else '',
+    }
+
+
+def scenarios(context):
+    """Generic function for the requests measured by the benchmark
+
+    Each scenario is a name, the user sending the request, a function
+    sending it with a client and whether cached responses are kept between
+    requests; only the _cached scenarios measure hits of the response
+    cache, the others measure the views.
+    """
+    free = models.Ticket.objects.filter(passenger__isnull=True).order_by('?')
+    free_ids = iter(free.values_list('id', flat=True)[:10000])
+    tickets_url = reverse('trip:ticket-list')
+    search = {
+        'origin': context['origin'],
+        'destination': context['destination'],
+    }
+
+    def reserve(client):
+        ticket_id = next(free_ids)
+        return client.post('{}{}/reserve/'.format(tickets_url, ticket_id))
+
+    return [
+        ('trip_list', context['admin'],
+         lambda client: client.get(reverse('trip:trip-list')), False),
+        ('trip_list_cached', context['admin'],
+         lambda client: client.get(reverse('trip:trip-list')), True),
+        ('trip_search', context['admin'],
+         lambda client: client.get(reverse('trip:trip-search'), search),
+         False),
+        ('ticket_list', context['passenger'],
+         lambda client: client.get(tickets_url), False),
+        ('ticket_reserve', context['passenger'], reserve, False),
+        ('average_passengers', context['admin'],
+         lambda client: client.get(reverse('trip:route-average-passengers')),
+         False),
+        ('use_by_route', context['admin'],
+         lambda client: client.get(reverse('trip:bus-use-by-route')), False),
+    ]
+
+
+def run_scenario(client, request, requests, cached=False):
+    """Generic function for measuring latency and queries of a request
+
+    Unless cached, the response cache is cleared before each request, out
+    of the measured time. Cached scenarios send a first request out of the
+    measure as well, so only hits are measured.
+    """
+    timings = []
+    queries = 0
+    failures = 0
+    elapsed = 0
+    if cached:
+        request(client)
+    for index in range(requests):
+        if not cached:
+            response_cache().clear()
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as captured:
+            before = time.perf_counter()
+            response = request(client)
+            timings.append((time.perf_counter() - before) * 1000)
+        elapsed += time.perf_counter() - started
+        queries = max(queries, len(captured))
+        if response.status_code >= 400:
+            failures += 1
+
+    timings.sort()
+    return {
+        'requests': requests,
+        'failures': failures,
+        'rps': round(requests / elapsed, 1) if elapsed else 0,
+        'p50': round(percentile(timings, 0.50), 3),
+        'p95': round(percentile(timings, 0.95), 3),
+        'p99': round(percentile(timings, 0.99), 3),
+        'queries': queries,
+    }
+
+
+def run_benchmarks(context, requests=200, only=None):
+    """Generic function for running every scenario over the dataset"""
+    results = {}
+    for name, user, request, cached in scenarios(context):
+        if only and name not in only:
+            continue
+        client = APIClient()
+        client.force_authenticate(user)
+        results[name] = run_scenario(client, request, requests, cached)
+    return results
+
+
+def compare_baseline(results, baseline, tolerance):
+    """Generic function for listing regressions against a baseline
+
+    A scenario regresses when its p95 grows more than tolerance (a
+    fraction), its throughput drops more than tolerance, it runs more
+    queries or it has failures.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['failures']:
+            regressions.append('{}: {} failed requests'.format(
+                name, result['failures']
+            ))
+        if result['queries'] > base['queries']:
+            regressions.append('{}: queries {} > {}'.format(
+                name, result['queries'], base['queries']
+            ))
+        if result['p95'] > base['p95'] * (1 + tolerance):
+            regressions.append('{}: p95 {:.2f}ms > {:.2f}ms'.format(
+                name, result['p95'], base['p95']
+            ))
+        if result['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append('{}: rps {:.1f} < {:.1f}'.format(
+                name, result['rps'], base['rps']
+            ))
+    return regressions
+
+
+def load_baseline(path):
+    """Generic function for reading a baseline file, None when missing"""
+    try:
+        with open(path) as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(path, dataset, results):
+    """Generic function for writing the results as the new baseline"""
+    with open(path, 'w') as baseline_file:
+        json.dump(
+            {'dataset': dataset, 'results': results},
+            baseline_file,
+            indent=2,
+            sort_keys=True
+        )
+        baseline_file.write('\n')
+
+
+def renderer_payloads(context, page_size=500):
+    """Generic function for the responses compared by the renderer benchmark
+
+    Each payload is the data of a list view over the seeded dataset, as
+    the renderers receive it.
+    """
+    payloads = [
+        ('trip_list', context['admin'], reverse('trip:trip-list')),
+        ('seat_list', context['passenger'], reverse('trip:seat-list')),
+        ('ticket_list', context['passenger'], reverse('trip:ticket-list')),
+    ]
+
+    data = {}
+    for name, user, url in payloads:
+        client = APIClient()
+        client.force_authenticate(user)
+        data[name] = client.get(url, {'page_size': page_size}).data
+    return data
+
+
+def run_renderer_benchmark(payloads, rounds=50):
+    """Generic function for comparing JSON and MessagePack over payloads
+
+    Returns by payload and format the size in bytes and the p50 of the
+    time to encode with the renderer and to decode with the parser.
+    """
+    formats = [
+        ('json', JSONRenderer(), JSONParser()),
+        ('msgpack', MessagePackRenderer(), MessagePackParser()),
+    ]
+
+    results = {}
+    for name, data in payloads.items():
+        results[name] = {}
+        for format_name, renderer, parser in formats:
+            encode, decode = [], []
+            for index in range(rounds):
+                before = time.perf_counter()
+                content = renderer.render(data, renderer.media_type, {})
+                encode.append((time.perf_counter() - before) * 1000)
+
+                before = time.perf_counter()
+                parser.parse(BytesIO(content))
+                decode.append((time.perf_counter() - before) * 1000)
+
+            encode.sort()
+            decode.sort()
+            results[name][format_name] = {
+                'bytes': len(content),
+                'encode': round(percentile(encode, 0.50), 3),
+                'decode': round(percentile(decode, 0.50), 3),
+            }
+    return results
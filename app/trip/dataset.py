@@ -0,0 +1,179 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from main import models
+from trip.reservations import tickets_count
+from trip.response_cache import bump_generations
+from trip.route_stats import rebuild_route_stats
+
+
+DATASET_BATCH_SIZE = 5000
+
+
+def batches(rows, batch_size):
+    """Generic function for splitting an iterable in lists of batch_size"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate_users(users, prefix, password=None):
+    """Generic function for inserting users of each type
+
+    Users maps each value of User.TYPES to a quantity. All users share one
+    password hash, so the hasher runs once. Returns the ids by type.
+    """
+    password = make_password(password)
+    models.User.objects.bulk_create([
+        models.User(
+            username='{}-{}-{}'.format(prefix, user_type, index),
+            password=password,
+            user_type=user_type
+        )
+        for user_type, quantity in users.items()
+        for index in range(quantity)
+    ], batch_size=DATASET_BATCH_SIZE)
+
+    ids = {user_type: [] for user_type in users}
+    rows = models.User.objects.filter(
+        username__startswith=prefix + '-'
+    ).order_by('id').values_list('id', 'user_type')
+    for user_id, user_type in rows:
+        if user_type in ids:
+            ids[user_type].append(user_id)
+    return ids
+
+
+def generate_dataset(users, routes, buses, seats, trips, reserved_ratio,
+                     days, seed=1, start=None, prefix='gen',
+                     batch_size=None):
+    """Generic function for inserting a synthetic dataset in batches
+
+    The same seed and start produce the same rows. Every trip gets a
+    ticket by seat of its bus and reserved_ratio of them are reserved by
+    random passengers. Seats counters and the route rollup are filled at
+    the end. Returns the ids of the users by type and the created rows.
+    """
+    rng = random.Random(seed)
+    batch_size = batch_size or DATASET_BATCH_SIZE
+    start = start or timezone.now().replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+    with transaction.atomic():
+        user_ids = generate_users(users, prefix)
+        admin_ids = user_ids.get(1) or [models.User.objects.create(
+            username=prefix + '-admin',
+            user_type=1
+        ).id]
+        driver_ids = user_ids.get(3, [])
+        passenger_ids = user_ids.get(2, [])
+
+        first_route = models.Route.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        models.Route.objects.bulk_create([
+            models.Route(
+                name='{}-route-{}'.format(prefix, index),
+                origin='origin-{}'.format(index % max(routes // 10, 1)),
+                destination='destination-{}'.format(index),
+                created_by_id=rng.choice(admin_ids)
+            )
+            for index in range(routes)
+        ], batch_size=batch_size)
+        route_ids = list(models.Route.objects.filter(
+            id__gt=first_route
+        ).values_list('id', flat=True))
+
+        first_bus = models.Bus.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        drivers = driver_ids + [None] * max(buses - len(driver_ids), 0)
+        models.Bus.objects.bulk_create([
+            models.Bus(
+                num_plate='G{}'.format(index)[:10],
+                created_by_id=rng.choice(admin_ids),
+                driver_id=drivers[index]
+            )
+            for index in range(buses)
+        ], batch_size=batch_size)
+        bus_ids = list(models.Bus.objects.filter(
+            id__gt=first_bus
+        ).values_list('id', flat=True))
+
+        models.Seat.objects.bulk_create([
+            models.Seat(number=number, created_by_id=admin_ids[0], bus_id=bus)
+            for bus in bus_ids
+            for number in range(1, seats + 1)
+        ], batch_size=batch_size)
+        seats_by_bus = {}
+        for seat_id, bus_id in models.Seat.objects.filter(
+            bus_id__in=bus_ids
+        ).order_by('id').values_list('id', 'bus_id'):
+            seats_by_bus.setdefault(bus_id, []).append(seat_id)
+
+        first_trip = models.Trip.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        minutes = days * 24 * 60
+        for batch in batches(range(trips), batch_size):
+            models.Trip.objects.bulk_create([
+                models.Trip(
+                    name='{}-trip-{}'.format(prefix, index),
+                    begin_at=start + timedelta(minutes=rng.randrange(minutes)),
+                    created_by_id=rng.choice(admin_ids),
+                    route_id=rng.choice(route_ids),
+                    bus_id=rng.choice(bus_ids)
+                )
+                for index in batch
+            ])
+        new_trips = models.Trip.objects.filter(id__gt=first_trip)
+
+        def tickets():
+            for trip_id, bus_id in new_trips.order_by('id').values_list(
+                'id', 'bus_id'
+            ).iterator():
+                for seat_id in seats_by_bus.get(bus_id, []):
+                    reserved = (
+                        bool(passenger_ids) and rng.random() < reserved_ratio
+                    )
+                    yield models.Ticket(
+                        created_by_id=admin_ids[0],
+                        trip_id=trip_id,
+                        seat_id=seat_id,
+                        reserved=reserved,
+                        passenger_id=(
+                            rng.choice(passenger_ids) if reserved else None
+                        )
+                    )
+
+        created_tickets = 0
+        for batch in batches(tickets(), batch_size):
+            models.Ticket.objects.bulk_create(batch)
+            created_tickets += len(batch)
+
+        new_trips.update(
+            seats_total=tickets_count(),
+            seats_reserved=tickets_count(reserved=True)
+        )
+        rebuild_route_stats()
+
+    bump_generations('route', 'trip', 'seat')
+    return {
+        'users': user_ids,
+        'admins': admin_ids,
+        'routes': len(route_ids),
+        'buses': len(bus_ids),
+        'seats': sum(len(seat_ids) for seat_ids in seats_by_bus.values()),
+        'trips': trips,
+        'tickets': created_tickets,
+    }
@@ -0,0 +1,107 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+def request_fingerprint(request):
+    """Generic function for hashing the body of a request"""
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    body = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()[:32]
+
+
+def idempotent(func):
+    """Decorator for replaying responses of writes sent with the same key
+
+    The first successful response is stored by user, method, path and key
+    with the fingerprint of the request body, and returned again for any
+    retry without running the view. Entries expire after
+    IDEMPOTENCY_KEY_TTL seconds.
+    """
+    @wraps(func)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return func(self, request, *args, **kwargs)
+
+        if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            message = 'La llave de idempotencia es demasiado larga.'
+            return Response(
+                {'detail': message},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cache = caches[settings.IDEMPOTENCY_CACHE]
+        cache_key = 'idempotency:{}:{}:{}:{}'.format(
+            request.user.pk,
+            request.method,
+            request.path,
+            hashlib.sha256(key.encode()).hexdigest()
+        )
+        fingerprint = request_fingerprint(request)
+
+        stored = cache.get(cache_key)
+        if stored is not None:
+            return replay_response(stored, fingerprint)
+
+        lock_key = cache_key + ':lock'
+        if not cache.add(lock_key, fingerprint, settings.IDEMPOTENCY_LOCK_TTL):
+            message = 'Una solicitud con esta llave está en proceso.'
+            return Response(
+                {'detail': message},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        try:
+            response = func(self, request, *args, **kwargs)
+            if status.is_success(response.status_code):
+                cache.set(cache_key, {
+                    'fingerprint': fingerprint,
+                    'status': response.status_code,
+                    'data': response.data,
+                }, settings.IDEMPOTENCY_KEY_TTL)
+        finally:
+            cache.delete(lock_key)
+
+        return response
+
+    return wrapper
+
+
+def replay_response(stored, fingerprint):
+    """Generic function for building the stored response of a key"""
+    if stored['fingerprint'] != fingerprint:
+        message = 'La llave de idempotencia fue usada con otra solicitud.'
+        return Response(
+            {'detail': message},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+
+    return Response(
+        stored['data'],
+        status=stored['status'],
+        headers={'Idempotent-Replayed': 'true'}
+    )
+
+
+class IdempotentMixin:
+    """Mixin for accepting Idempotency-Key on the write actions of a view"""
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    @idempotent
+    def update(self, request, *args, **kwargs):
+        return super().update(request, *args, **kwargs)
@@ -0,0 +1,115 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from trip.benchmarks import benchmark_database, seed_dataset, \
+                            run_benchmarks, compare_baseline, \
+                            load_baseline, save_baseline
+
+
+class Command(BaseCommand):
+    """Command for measuring the hot paths against a stored baseline"""
+    help = ('Benchmark reservation, listing, search and analytics endpoints '
+            'over a synthetic dataset in a test database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--routes', type=int, default=100)
+        parser.add_argument('--buses', type=int, default=20)
+        parser.add_argument('--seats', type=int, default=40)
+        parser.add_argument('--trips', type=int, default=10000)
+        parser.add_argument('--reserved-ratio', type=float, default=0.5)
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            help='Run only this scenario, it could be repeated',
+        )
+        parser.add_argument(
+            '--baseline',
+            default=settings.BENCHMARK_BASELINE,
+            help='Baseline file compared with the results',
+        )
+        parser.add_argument(
+            '--save-baseline',
+            action='store_true',
+            help='Write the results as the new baseline',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=settings.BENCHMARK_TOLERANCE,
+            help='Fraction p95 and throughput could move before failing',
+        )
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            results, dataset = self.run_benchmark(options)
+
+        if options['save_baseline']:
+            save_baseline(options['baseline'], dataset, results)
+            self.stdout.write('Baseline saved in ' + options['baseline'])
+            return
+
+        baseline = load_baseline(options['baseline'])
+        if baseline is None:
+            self.stdout.write('No baseline in ' + options['baseline'])
+            return
+        if baseline['dataset'] != dataset:
+            raise CommandError(
+                'The baseline was measured with another dataset: {}'.format(
+                    baseline['dataset']
+                )
+            )
+
+        regressions = compare_baseline(
+            results,
+            baseline['results'],
+            options['tolerance']
+        )
+        if regressions:
+            raise CommandError(
+                'Regressions against the baseline:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write('No regressions against the baseline')
+
+    def run_benchmark(self, options):
+        """Seed the dataset and run the scenarios"""
+        dataset = {
+            key: options[key]
+            for key in ('routes', 'buses', 'seats', 'trips',
+                        'reserved_ratio', 'days', 'seed', 'requests')
+        }
+        started = time.perf_counter()
+        context = seed_dataset(**{
+            key: value for key, value in dataset.items()
+            if key != 'requests'
+        })
+        self.stdout.write('Seeded {} trips in {:.1f}s'.format(
+            options['trips'],
+            time.perf_counter() - started
+        ))
+
+        results = run_benchmarks(
+            context,
+            options['requests'],
+            options['scenario']
+        )
+        self.stdout.write('{:<20}{:>8}{:>10}{:>10}{:>10}{:>9}{:>7}'.format(
+            'scenario', 'rps', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'fail'
+        ))
+        for name, result in results.items():
+            self.stdout.write(
+                '{:<20}{:>8.1f}{:>10.2f}{:>10.2f}{:>10.2f}{:>9}{:>7}'.format(
+                    name,
+                    result['rps'],
+                    result['p50'],
+                    result['p95'],
+                    result['p99'],
+                    result['queries'],
+                    result['failures']
+                )
+            )
+        return results, dataset
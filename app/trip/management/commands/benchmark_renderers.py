@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from trip.benchmarks import benchmark_database, seed_dataset, \
+                            renderer_payloads, run_renderer_benchmark
+
+
+class Command(BaseCommand):
+    """Command for comparing JSON and MessagePack responses"""
+    help = ('Benchmark size, encode and decode time of JSON and MessagePack '
+            'over list responses of a synthetic dataset in a test database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--routes', type=int, default=100)
+        parser.add_argument('--buses', type=int, default=20)
+        parser.add_argument('--seats', type=int, default=40)
+        parser.add_argument('--trips', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--page-size', type=int, default=500)
+        parser.add_argument('--rounds', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            context = seed_dataset(
+                routes=options['routes'],
+                buses=options['buses'],
+                seats=options['seats'],
+                trips=options['trips'],
+                seed=options['seed']
+            )
+            payloads = renderer_payloads(context, options['page_size'])
+            results = run_renderer_benchmark(payloads, options['rounds'])
+
+        self.stdout.write('{:<14}{:<10}{:>10}{:>8}{:>12}{:>12}'.format(
+            'payload', 'format', 'bytes', 'size', 'encode ms', 'decode ms'
+        ))
+        for name, formats in results.items():
+            json_bytes = formats['json']['bytes']
+            for format_name, result in formats.items():
+                self.stdout.write(
+                    '{:<14}{:<10}{:>10}{:>7.0%}{:>12.3f}{:>12.3f}'.format(
+                        name,
+                        format_name,
+                        result['bytes'],
+                        result['bytes'] / json_bytes,
+                        result['encode'],
+                        result['decode']
+                    )
+                )
@@ -0,0 +1,96 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main import models
+from trip.benchmarks import benchmark_database
+from trip.dataset import generate_dataset
+from trip.views import search_trips
+
+
+class Command(BaseCommand):
+    """Command for measuring trip search over a synthetic dataset"""
+    help = 'Benchmark trip search over a synthetic dataset in a test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trips', type=int, default=1000000)
+        parser.add_argument('--routes', type=int, default=1000)
+        parser.add_argument('--buses', type=int, default=20)
+        parser.add_argument('--tickets-per-trip', type=int, default=2)
+        parser.add_argument('--passengers', type=int, default=100)
+        parser.add_argument('--reserved-ratio', type=float, default=0.5)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.run_benchmark(options)
+
+    def run_benchmark(self, options):
+        """Seed the dataset, show the query plan and measure searches"""
+        random.seed(options['seed'])
+        start = timezone.now().replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        started = time.perf_counter()
+        generate_dataset(
+            {1: 1, 2: options['passengers'], 3: 0},
+            options['routes'],
+            options['buses'],
+            options['tickets_per_trip'],
+            options['trips'],
+            options['reserved_ratio'],
+            options['days'],
+            seed=options['seed'],
+            start=start,
+            prefix='search'
+        )
+        self.stdout.write('Seeded {} trips in {:.1f}s'.format(
+            options['trips'],
+            time.perf_counter() - started
+        ))
+
+        routes = list(models.Route.objects.order_by('id').values_list(
+            'origin',
+            'destination'
+        ))
+        origin, destination = routes[0]
+        plan = search_trips(
+            origin,
+            destination,
+            True,
+            start,
+            start + timedelta(days=1)
+        ).explain()
+        self.stdout.write('Query plan:\n' + plan)
+
+        timings = []
+        for index in range(options['queries']):
+            origin, destination = random.choice(routes)
+            begin_from = start + timedelta(
+                days=random.randrange(options['days'])
+            )
+            started = time.perf_counter()
+            list(search_trips(
+                origin,
+                destination,
+                True,
+                begin_from,
+                begin_from + timedelta(days=1)
+            )[:50])
+            timings.append((time.perf_counter() - started) * 1000)
+
+        timings.sort()
+        self.stdout.write(
+            'Searches: {} p50={:.2f}ms p95={:.2f}ms max={:.2f}ms'.format(
+                len(timings),
+                statistics.median(timings),
+                timings[int(len(timings) * 0.95) - 1],
+                timings[-1]
+            )
+        )
@@ -0,0 +1,108 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from main.models import User
+from trip.dataset import generate_dataset
+
+
+def user_type_option(label):
+    """Complementary function for naming the option of a user type"""
+    return label.lower() + 's'
+
+
+class Command(BaseCommand):
+    """Command for inserting a synthetic dataset with batched inserts"""
+    help = ('Generate users of each type, routes, buses, seats, trips and '
+            'tickets with a deterministic seed')
+
+    def add_arguments(self, parser):
+        for user_type, label in User.TYPES:
+            parser.add_argument(
+                '--' + user_type_option(label),
+                type=int,
+                default=10,
+                help='Users of type {}'.format(label),
+            )
+        parser.add_argument('--routes', type=int, default=100)
+        parser.add_argument('--buses', type=int, default=50)
+        parser.add_argument('--seats', type=int, default=40)
+        parser.add_argument('--trips', type=int, default=10000)
+        parser.add_argument(
+            '--reserved-ratio',
+            type=float,
+            default=0.5,
+            help='Fraction of tickets reserved by passengers',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Trips begin in this quantity of days after start',
+        )
+        parser.add_argument(
+            '--start',
+            default=None,
+            help='First day of trips as YYYY-MM-DD, today by default',
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--prefix',
+            default='gen',
+            help='Prefix of usernames and names, it must be unique by run',
+        )
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        if options['routes'] < 1 or options['buses'] < 1:
+            raise CommandError('At least one route and one bus are needed.')
+        if not 0 <= options['reserved_ratio'] <= 1:
+            raise CommandError('The reserved ratio must be between 0 and 1.')
+        if User.objects.filter(
+            username__startswith=options['prefix'] + '-'
+        ).exists():
+            raise CommandError(
+                'A dataset with prefix {} already exists.'.format(
+                    options['prefix']
+                )
+            )
+
+        start = None
+        if options['start']:
+            start = timezone.make_aware(
+                datetime.strptime(options['start'], '%Y-%m-%d')
+            )
+
+        started = time.perf_counter()
+        dataset = generate_dataset(
+            {
+                user_type: options[user_type_option(label)]
+                for user_type, label in User.TYPES
+            },
+            options['routes'],
+            options['buses'],
+            options['seats'],
+            options['trips'],
+            options['reserved_ratio'],
+            options['days'],
+            seed=options['seed'],
+            start=start,
+            prefix=options['prefix'],
+            batch_size=options['batch_size']
+        )
+
+        users = sum(len(ids) for ids in dataset['users'].values())
+        self.stdout.write(
+            'Generated {} users, {} routes, {} buses, {} seats, {} trips and '
+            '{} tickets in {:.1f}s'.format(
+                users,
+                dataset['routes'],
+                dataset['buses'],
+                dataset['seats'],
+                dataset['trips'],
+                dataset['tickets'],
+                time.perf_counter() - started
+            )
+        )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from trip.reservations import sync_trip_counters
+from trip.route_stats import rebuild_route_stats
+
+
+class Command(BaseCommand):
+    """Command for rebuilding the route rollup from the trips"""
+    help = 'Rebuild trips, tickets and reserved tickets by route and day'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Rows inserted by statement',
+        )
+        parser.add_argument(
+            '--recount',
+            action='store_true',
+            help='Repair seats counters of trips before the rebuild',
+        )
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            drifted = sync_trip_counters()
+            self.stdout.write('Repaired {} drifted trips'.format(len(drifted)))
+
+        rows = rebuild_route_stats(options['batch_size'])
+        self.stdout.write('Rebuilt {} route stats rows'.format(rows))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from trip.reservations import release_expired_holds
+
+
+class Command(BaseCommand):
+    """Command for releasing tickets with expired holds"""
+    help = 'Release tickets whose hold has expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Tickets released by UPDATE statement',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Repeat the sweep every interval seconds (0 runs once)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired_holds(options['batch_size'])
+            self.stdout.write('Released {} expired holds'.format(released))
+
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from trip.reservations import sync_trip_counters
+
+
+class Command(BaseCommand):
+    """Command for repairing seats counters of trips"""
+    help = 'Recount seats counters of trips that drifted from their tickets'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Trips compared by query',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the drifted trips',
+        )
+
+    def handle(self, *args, **options):
+        drifted = sync_trip_counters(
+            options['batch_size'],
+            options['dry_run']
+        )
+        verb = 'Found' if options['dry_run'] else 'Repaired'
+        self.stdout.write('{} {} drifted trips'.format(verb, len(drifted)))
+        for trip_id in drifted:
+            self.stdout.write('  trip {}'.format(trip_id))
@@ -5,7 +5,10 @@ class IsAdminRoute(permissions.BasePermission):
     """Permission for actions in route view"""
     def has_permission(self, request, view):
         admin_type = 1
-        actions_admin = ['create', 'update', 'partial_update', 'destroy']
+        actions_admin = [
+            'create', 'update', 'partial_update',
+            'destroy', 'bulk_create'
+        ]
 
         if view.action in actions_admin:
             return (request.user.is_authenticated and
@@ -20,7 +23,7 @@ class IsAdminBus(permissions.BasePermission):
         admin_type = 1
         actions_admin = [
             'create', 'list', 'update',
-            'partial_update', 'destroy'
+            'partial_update', 'destroy', 'bulk_create'
         ]
 
         if view.action in actions_admin:
@@ -34,7 +37,11 @@ class IsPassengerTicket(permissions.BasePermission):
     """Permission for actions in ticket view"""
     def has_permission(self, request, view):
         passenger_type = 2
-        actions_passenger = ['list', 'retrieve', 'update', 'partial_update']
+        actions_passenger = [
+            'list', 'retrieve', 'update',
+            'partial_update', 'reserve', 'reserve_batch',
+            'hold', 'confirm', 'release'
+        ]
 
         if view.action in actions_passenger:
             return (request.user.is_authenticated and
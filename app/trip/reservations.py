@@ -0,0 +1,427 @@
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, OperationalError, \
+                      close_old_connections, transaction
+from django.db.models import F, Q, Count, IntegerField, OuterRef, \
+                             Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from main import models
+from trip.response_cache import bump_generations, bump_objects
+from trip.route_stats import reserved_stats_changed
+from trip.seat_map import invalidate_seat_maps
+
+
+logger = logging.getLogger(__name__)
+
+INVALIDATE_BATCH_SIZE = 1000
+
+# SQLSTATE of deadlocks and serialization failures in PostgreSQL
+
+LOCK_CONFLICT_CODES = ('40P01', '40001')
+
+
+class TicketConflict(APIException):
+    """Exception for tickets already taken by another passenger"""
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'El ticket ya fue reservado.'
+    default_code = 'conflict'
+
+
+def free_tickets(tickets, now=None):
+    """Generic function for filter tickets without passenger or expired hold"""
+    now = now or timezone.now()
+    return tickets.filter(
+        Q(passenger__isnull=True) |
+        Q(reserved=False, hold_expires_at__lte=now)
+    )
+
+
+def claim_tickets(tickets, user):
+    """Generic function for reserving free tickets with a conditional UPDATE
+
+    Only free rows are written, so two concurrent claims can not both win
+    and no row is locked longer than the UPDATE itself. Returns the
+    quantity of tickets claimed.
+    """
+    return free_tickets(tickets).update(
+        passenger=user,
+        reserved=True,
+        hold_expires_at=None
+    )
+
+
+def invalidate_trips(trip_ids):
+    """Generic function for invalidating cached seat maps and trip responses
+
+    Runs once the transaction commits, so a concurrent read can not cache
+    the old state again.
+    """
+    trip_ids = set(trip_ids)
+
+    def invalidate():
+        invalidate_seat_maps(trip_ids)
+        bump_objects('trip', trip_ids)
+
+    transaction.on_commit(invalidate)
+
+
+def invalidate_buses_trips(bus_ids):
+    """Generic function for invalidating every trip of buses
+
+    Runs once the transaction commits; seat maps are removed by chunks of
+    trip ids and responses of trips move with the epoch of the model.
+    """
+    bus_ids = list(bus_ids)
+
+    def invalidate():
+        trip_ids = models.Trip.objects.filter(
+            bus__in=bus_ids
+        ).values_list('id', flat=True)
+        chunk = []
+        for trip_id in trip_ids.iterator(INVALIDATE_BATCH_SIZE):
+            chunk.append(trip_id)
+            if len(chunk) >= INVALIDATE_BATCH_SIZE:
+                invalidate_seat_maps(chunk)
+                chunk = []
+        invalidate_seat_maps(chunk)
+        bump_generations('trip')
+
+    transaction.on_commit(invalidate)
+
+
+def route_stats_changed(trips, reserved):
+    """Generic function for moving reserved tickets of the rollup on commit
+
+    The rows of the rollup are shared by every trip of a route, bus and
+    day, so they are moved in their own short transaction once the
+    reservation commits instead of being locked by it. A failure is only
+    logged, rebuild_route_stats repairs the drift.
+    """
+    def changed():
+        try:
+            with transaction.atomic():
+                reserved_stats_changed(trips, reserved)
+        except DatabaseError:
+            logger.exception('Error moving the route rollup')
+
+    transaction.on_commit(changed)
+
+
+def tickets_changed(tickets, reserved=0):
+    """Generic function for refreshing data derived from changed tickets
+
+    The reserved counter of the trips moves by reserved, it must run in
+    the same transaction as the change of the tickets; their route rollup
+    follows on commit. Any change of the tickets (holds included)
+    invalidates the cached seat maps and responses of their trips.
+    """
+    trips = set(tickets.values_list(
+        'trip_id', 'trip__route_id', 'trip__bus_id', 'trip__begin_at'
+    ))
+    trip_ids = {trip[0] for trip in trips}
+    if reserved:
+        models.Trip.objects.filter(id__in=trip_ids).update(
+            seats_reserved=Greatest(F('seats_reserved') + reserved, 0)
+        )
+        route_stats_changed([trip[1:] for trip in trips], reserved)
+    invalidate_trips(trip_ids)
+
+
+def reserve_ticket(ticket_id, user):
+    """Generic function for reserving one ticket, False when it is taken"""
+    tickets = models.Ticket.objects.filter(id=ticket_id)
+    with transaction.atomic():
+        if claim_tickets(tickets, user) != 1:
+            return False
+        tickets_changed(tickets, reserved=1)
+
+    return True
+
+
+def is_free(ticket, now):
+    """Generic function for check a ticket row is free at the given time"""
+    return ticket['passenger_id'] is None or (
+        not ticket['reserved'] and
+        ticket['hold_expires_at'] is not None and
+        ticket['hold_expires_at'] <= now
+    )
+
+
+def lock_conflict(exc):
+    """Generic function for check a database error is a lock conflict
+
+    Deadlocks and serialization failures of PostgreSQL are lost races
+    with another transaction, not errors of the request.
+    """
+    return getattr(exc.__cause__, 'pgcode', None) in LOCK_CONFLICT_CODES
+
+
+def claim_trip_tickets(queryset, user, key, requested, now):
+    """Generic function for claiming the requested tickets of a batch
+
+    Rows are locked in order of id, so batches sharing seats lock them in
+    the same order and do not deadlock. The transaction is rolled back
+    when any ticket is missing or taken. Returns the locked tickets by
+    key, whether the batch was reserved and the ids lost to another
+    passenger.
+    """
+    with transaction.atomic():
+        locked = queryset.order_by('id').select_for_update(of=('self',))
+        found = {
+            ticket[key]: ticket
+            for ticket in locked.values(
+                'id', 'seat__number', 'passenger_id', 'reserved',
+                'hold_expires_at'
+            )
+        }
+        free = [
+            found[item]['id'] for item in requested
+            if item in found and is_free(found[item], now)
+        ]
+        claimed = 0
+        if free:
+            claimed = claim_tickets(
+                models.Ticket.objects.filter(id__in=free),
+                user
+            )
+
+        reserved = claimed == len(requested)
+        lost = set()
+        if not reserved:
+            if claimed != len(free):
+                lost = set(free) - set(models.Ticket.objects.filter(
+                    id__in=free,
+                    passenger=user
+                ).values_list('id', flat=True))
+            transaction.set_rollback(True)
+        else:
+            tickets_changed(queryset, reserved=claimed)
+
+    return found, reserved, lost
+
+
+def reserve_trip_tickets(trip, user, seats=None, tickets=None):
+    """Generic function for reserving several tickets of a trip at once
+
+    Tickets are requested by seat number or by id. All of them are claimed
+    in one conditional UPDATE inside a transaction; when any of them is
+    missing or taken the whole batch is rolled back, a batch losing a
+    lock race raises TicketConflict. Returns whether the batch was
+    reserved and the status of each requested seat or ticket.
+    """
+    if seats is not None:
+        key, requested = 'seat__number', list(dict.fromkeys(seats))
+        queryset = models.Ticket.objects.filter(
+            trip=trip,
+            seat__number__in=requested
+        )
+    else:
+        key, requested = 'id', list(dict.fromkeys(tickets))
+        queryset = models.Ticket.objects.filter(trip=trip, id__in=requested)
+
+    now = timezone.now()
+    try:
+        found, reserved, lost = claim_trip_tickets(
+            queryset,
+            user,
+            key,
+            requested,
+            now
+        )
+    except OperationalError as exc:
+        if not lock_conflict(exc):
+            raise
+        raise TicketConflict(
+            'Los asientos están siendo reservados, intente nuevamente.'
+        )
+
+    by_seat = key == 'seat__number'
+    results = []
+    for item in requested:
+        ticket = found.get(item)
+        if ticket is None:
+            item_status = 'not_found'
+            ticket = {'id': None if by_seat else item,
+                      'seat__number': item if by_seat else None}
+        elif not is_free(ticket, now) or ticket['id'] in lost:
+            item_status = 'conflict'
+        elif reserved:
+            item_status = 'reserved'
+        else:
+            item_status = 'available'
+        results.append({
+            'ticket': ticket['id'],
+            'seat': ticket['seat__number'],
+            'status': item_status,
+        })
+
+    return reserved, results
+
+
+def hold_ticket(ticket_id, user, minutes=None):
+    """Generic function for holding a free ticket during some minutes"""
+    minutes = minutes or settings.TICKET_HOLD_MINUTES
+    tickets = models.Ticket.objects.filter(id=ticket_id)
+    held = free_tickets(tickets).update(
+        passenger=user,
+        reserved=False,
+        hold_expires_at=timezone.now() + timedelta(minutes=minutes)
+    )
+    if held != 1:
+        return False
+
+    tickets_changed(tickets)
+    return True
+
+
+def confirm_ticket(ticket_id, user):
+    """Generic function for reserving a ticket held by the passenger"""
+    tickets = models.Ticket.objects.filter(id=ticket_id)
+    with transaction.atomic():
+        confirmed = tickets.filter(
+            passenger=user,
+            reserved=False,
+            hold_expires_at__gt=timezone.now()
+        ).update(reserved=True, hold_expires_at=None)
+        if confirmed != 1:
+            return False
+        tickets_changed(tickets, reserved=1)
+
+    return True
+
+
+def release_ticket(ticket_id, user):
+    """Generic function for freeing a ticket held or reserved by passenger"""
+    tickets = models.Ticket.objects.filter(id=ticket_id)
+    with transaction.atomic():
+        for reserved in (True, False):
+            released = tickets.filter(
+                passenger=user,
+                reserved=reserved
+            ).update(passenger=None, reserved=False, hold_expires_at=None)
+            if released:
+                tickets_changed(tickets, reserved=-1 if reserved else 0)
+                return True
+
+    return False
+
+
+def release_expired_holds(batch_size=None, now=None):
+    """Generic function for freeing expired holds in batches
+
+    Only held tickets have an expiry, so the indexed range over
+    hold_expires_at reads expired holds without scanning other tickets.
+    Returns the quantity of tickets released.
+    """
+    batch_size = batch_size or settings.TICKET_HOLD_SWEEP_BATCH
+    now = now or timezone.now()
+    expired = models.Ticket.objects.filter(hold_expires_at__lte=now)
+    released = 0
+
+    while True:
+        batch = list(expired.values_list('id', 'trip_id')[:batch_size])
+        if not batch:
+            return released
+        released += expired.filter(id__in=[row[0] for row in batch]).update(
+            passenger=None,
+            reserved=False,
+            hold_expires_at=None
+        )
+        invalidate_trips(row[1] for row in batch)
+
+
+def tickets_count(**filters):
+    """Generic function for counting tickets of the outer trip in a query"""
+    tickets = models.Ticket.objects.filter(
+        trip=OuterRef('pk'),
+        **filters
+    ).order_by().values('trip').annotate(count=Count('id'))
+    return Coalesce(
+        Subquery(tickets.values('count'), output_field=IntegerField()),
+        0
+    )
+
+
+def sync_trip_counters(batch_size=None, dry_run=False):
+    """Generic function for repairing seats counters drifted from tickets
+
+    Trips are walked by ranges of ids, each range compares the counters
+    with the tickets in one query and rewrites only the drifted trips.
+    Returns the ids of the drifted trips.
+    """
+    batch_size = batch_size or settings.TRIP_COUNTERS_SYNC_BATCH
+    trips = models.Trip.objects.order_by('id')
+    drifted = []
+    last_id = 0
+
+    while True:
+        ids = list(trips.filter(id__gt=last_id).values_list(
+            'id',
+            flat=True
+        )[:batch_size])
+        if not ids:
+            return drifted
+        last_id = ids[-1]
+
+        batch = models.Trip.objects.filter(
+            id__gte=ids[0],
+            id__lte=last_id
+        ).annotate(
+            tickets_total=tickets_count(),
+            tickets_reserved=tickets_count(reserved=True),
+        ).filter(
+            ~Q(seats_total=F('tickets_total')) |
+            ~Q(seats_reserved=F('tickets_reserved'))
+        ).values_list('id', flat=True)
+        batch = list(batch)
+        drifted += batch
+
+        if batch and not dry_run:
+            models.Trip.objects.filter(id__in=batch).update(
+                seats_total=tickets_count(),
+                seats_reserved=tickets_count(reserved=True),
+            )
+            bump_objects('trip', batch)
+
+
+class HoldSweeper(threading.Thread):
+    """Background thread releasing expired holds every interval"""
+
+    def __init__(self, interval):
+        super().__init__(name='hold-sweeper', daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            close_old_connections()
+            try:
+                released = release_expired_holds()
+                if released:
+                    logger.info('Released %s expired holds', released)
+            except Exception:
+                logger.exception('Error releasing expired holds')
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self.stopped.set()
+
+
+hold_sweeper = None
+
+
+def start_hold_sweeper():
+    """Generic function for starting the background sweeper once"""
+    global hold_sweeper
+    if hold_sweeper is None:
+        hold_sweeper = HoldSweeper(settings.TICKET_HOLD_SWEEP_INTERVAL)
+        hold_sweeper.start()
+    return hold_sweeper
@@ -0,0 +1,218 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe, \
+                             parse_etags
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+
+def response_cache():
+    """Generic function for getting the cache of responses"""
+    return caches[settings.RESPONSE_CACHE]
+
+
+def generations_cache():
+    """Generic function for getting the cache of generations
+
+    Kept apart from the responses, so culling responses never evicts a
+    generation and invalidates unrelated responses.
+    """
+    return caches[settings.RESPONSE_GENERATIONS_CACHE]
+
+
+def generation_key(name):
+    """Generic function for naming the generation of a model in the cache
+
+    Names are a model for its collection ('trip'), a model and an id for
+    one object ('trip:5') or a model and * for the epoch of its objects
+    ('trip:*'), moved when unknown objects change.
+    """
+    return 'generation:' + name
+
+
+def modified_key(name):
+    """Generic function for naming the last change of a generation"""
+    return 'modified:' + name
+
+
+def get_generations(names):
+    """Generic function for reading generations and their last change
+
+    A missing generation (first read, restart, clear or eviction of the
+    cache) starts at a unique value and its last change at the time it is
+    read, so versions and ETags given before are not repeated. Returns
+    (generation, timestamp) pairs.
+    """
+    cache = generations_cache()
+    keys = [key for name in names
+            for key in (generation_key(name), modified_key(name))]
+    values = cache.get_many(keys)
+    now = int(timezone.now().timestamp())
+    for key in keys:
+        if key not in values:
+            initial = time.time_ns() if key.startswith('generation:') else now
+            cache.add(key, initial, None)
+            values[key] = cache.get(key, initial)
+    return [
+        (values[generation_key(name)], values[modified_key(name)])
+        for name in names
+    ]
+
+
+def bump(names):
+    """Generic function for moving generations forward
+
+    Last changes are in whole seconds, as Last-Modified, and always move
+    forward, so two changes in the same second are not the same date.
+    """
+    cache = generations_cache()
+    now = int(timezone.now().timestamp())
+    modified = cache.get_many([modified_key(name) for name in names])
+    for name in names:
+        key = generation_key(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+        cache.set(
+            modified_key(name),
+            max(now, modified.get(modified_key(name), 0) + 1),
+            None
+        )
+
+
+def bump_generations(*models):
+    """Generic function for invalidating every cached response of models
+
+    Used when unknown objects of the models change (cascades, bulk
+    updates), the collection and the epoch of their objects move forward.
+    """
+    bump([key for model in models for key in (model, model + ':*')])
+
+
+def bump_objects(model, ids):
+    """Generic function for invalidating responses of known objects
+
+    The collection and each object move forward, other objects of the
+    model keep their cached responses and ETags.
+    """
+    bump([model] + ['{}:{}'.format(model, pk) for pk in ids])
+
+
+def get_version(model, pk=None):
+    """Generic function for the version of a collection or of an object
+
+    Returns the version as text and the time of its last change.
+    """
+    if pk is None:
+        names = [model]
+    else:
+        names = [model + ':*', '{}:{}'.format(model, pk)]
+    generations = get_generations(names)
+    version = '.'.join(str(generation) for generation, _ in generations)
+    modified = max(modified for _, modified in generations)
+    return version, modified
+
+
+class CachedResponseMixin:
+    """Mixin caching list and retrieve responses of a view
+
+    Responses are cached by URL under the version of cache_model, of its
+    collection for list and of the object for retrieve. ETag and
+    Last-Modified come from the same version, so conditional requests get
+    a 304 before the cache, the ORM or the serializers are read. Views
+    without cache_model are not cached. Any successful write through the
+    view moves the version of cache_model (only the written object when
+    it is known) and invalidates_models forward.
+    """
+    cache_model = None
+    invalidates_models = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve,
+            request,
+            *args,
+            **kwargs
+        )
+
+    def lookup_value(self):
+        """Value of the object in the URL, None for collection routes"""
+        return self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        """Getting a 304, the cached response or storing a new one"""
+        if not self.cache_model:
+            return handler(request, *args, **kwargs)
+
+        # Fields and expansions of the request are checked before a cached
+        # response of another user is sent
+        self.get_serializer().fields
+
+        version, modified = get_version(self.cache_model, self.lookup_value())
+        uri = request.build_absolute_uri()
+        etag = '"{}"'.format(hashlib.sha256('{}:{}:{}:{}'.format(
+            self.cache_model,
+            version,
+            request.accepted_renderer.format,
+            uri
+        ).encode()).hexdigest()[:32])
+        headers = {'ETag': etag, 'Last-Modified': http_date(modified)}
+
+        if not_modified(request, etag, modified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED,
+                            headers=headers)
+
+        cache = response_cache()
+        key = 'response:{}:{}:{}'.format(
+            self.cache_model,
+            version,
+            hashlib.sha256(uri.encode()).hexdigest()
+        )
+        data = cache.get(key)
+        if data is not None:
+            return Response(data, status=status.HTTP_200_OK, headers=headers)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TTL)
+            for header, value in headers.items():
+                response[header] = value
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (request.method not in SAFE_METHODS and
+                status.is_success(response.status_code)):
+            if self.cache_model:
+                lookup = self.lookup_value()
+                bump_objects(self.cache_model, [lookup] if lookup else [])
+            bump_generations(*self.invalidates_models)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+def not_modified(request, etag, modified):
+    """Generic function for checking the validators sent by the client
+
+    If-None-Match wins over If-Modified-Since when both are sent.
+    """
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        etags = [
+            value[2:] if value.startswith('W/') else value
+            for value in parse_etags(if_none_match)
+        ]
+        return '*' in etags or etag in etags
+
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since:
+        since = parse_http_date_safe(if_modified_since)
+        return since is not None and modified <= since
+    return False
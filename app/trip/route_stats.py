@@ -0,0 +1,140 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Count, IntegerField, OuterRef, Subquery, \
+                             Sum
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+
+from main import models
+
+
+def stats_day(begin_at):
+    """Generic function for the day of a trip in the rollup"""
+    if timezone.is_aware(begin_at):
+        return timezone.localtime(begin_at).date()
+    return begin_at.date()
+
+
+def update_route_stats(changes):
+    """Generic function for moving rows of the route rollup
+
+    Changes map (route_id, bus_id, day) to deltas of (trips, tickets,
+    reserved). Each row is moved with one conditional UPDATE and only
+    created when it is missing and something is added, a row removed by a
+    cascade is not created again. It must run in the same transaction as
+    the change of the trips or tickets.
+    """
+    for (route_id, bus_id, day), deltas in changes.items():
+        if not any(deltas):
+            continue
+        trips, tickets, reserved = deltas
+        stats = models.RouteStats.objects.filter(
+            route_id=route_id,
+            bus_id=bus_id,
+            day=day
+        )
+        values = {
+            'trips': Greatest(F('trips') + trips, 0),
+            'tickets': Greatest(F('tickets') + tickets, 0),
+            'reserved': Greatest(F('reserved') + reserved, 0),
+        }
+        if stats.update(**values) or max(deltas) <= 0:
+            continue
+
+        try:
+            with transaction.atomic():
+                models.RouteStats.objects.create(
+                    route_id=route_id,
+                    bus_id=bus_id,
+                    day=day,
+                    trips=max(trips, 0),
+                    tickets=max(tickets, 0),
+                    reserved=max(reserved, 0)
+                )
+        except IntegrityError:
+            stats.update(**values)
+
+
+def trips_stats_changed(trips, sign=1):
+    """Generic function for adding or removing trips from the rollup"""
+    changes = defaultdict(lambda: [0, 0, 0])
+    for trip in trips:
+        key = (trip.route_id, trip.bus_id, stats_day(trip.begin_at))
+        deltas = changes[key]
+        deltas[0] += sign
+        deltas[1] += sign * trip.seats_total
+        deltas[2] += sign * trip.seats_reserved
+    update_route_stats(changes)
+
+
+def reserved_stats_changed(trips, reserved):
+    """Generic function for moving reserved tickets of trips in the rollup
+
+    Trips are (route_id, bus_id, begin_at) rows of the changed trips.
+    """
+    changes = defaultdict(lambda: [0, 0, 0])
+    for route_id, bus_id, begin_at in trips:
+        changes[(route_id, bus_id, stats_day(begin_at))][2] += reserved
+    update_route_stats(changes)
+
+
+def buses_stats_changed(bus_ids):
+    """Generic function for recounting tickets of buses in the rollup
+
+    The rows of the buses are rewritten from the counters of their trips
+    with one UPDATE, used when the seats of every trip of the buses change.
+    """
+    trips = models.Trip.objects.filter(
+        route=OuterRef('route'),
+        bus=OuterRef('bus'),
+        begin_at__date=OuterRef('day')
+    ).order_by().values('bus')
+    models.RouteStats.objects.filter(bus__in=bus_ids).update(
+        tickets=Coalesce(Subquery(
+            trips.annotate(total=Sum('seats_total')).values('total'),
+            output_field=IntegerField()
+        ), 0),
+        reserved=Coalesce(Subquery(
+            trips.annotate(total=Sum('seats_reserved')).values('total'),
+            output_field=IntegerField()
+        ), 0)
+    )
+
+
+def trip_deleted(sender, instance, **kwargs):
+    """Signal receiver removing a deleted trip from the rollup"""
+    trips_stats_changed([instance], sign=-1)
+
+
+def rebuild_route_stats(batch_size=None):
+    """Generic function for rebuilding the route rollup from the trips
+
+    Trips are grouped by (route, bus, day) in the database and the rollup
+    is replaced in one transaction. Returns the quantity of rows.
+    """
+    batch_size = batch_size or settings.ROUTE_STATS_REBUILD_BATCH
+    rows = models.Trip.objects.annotate(day=TruncDate('begin_at')).values(
+        'route', 'bus', 'day'
+    ).annotate(
+        trips_count=Count('id'),
+        tickets_count=Sum('seats_total'),
+        reserved_count=Sum('seats_reserved'),
+    ).order_by()
+
+    with transaction.atomic():
+        models.RouteStats.objects.all().delete()
+        stats = models.RouteStats.objects.bulk_create([
+            models.RouteStats(
+                route_id=row['route'],
+                bus_id=row['bus'],
+                day=row['day'],
+                trips=row['trips_count'],
+                tickets=row['tickets_count'],
+                reserved=row['reserved_count']
+            )
+            for row in rows.iterator()
+        ], batch_size=batch_size)
+
+    return len(stats)
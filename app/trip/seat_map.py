@@ -0,0 +1,91 @@
+import base64
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from main import models
+
+
+def seat_map_cache():
+    """Generic function for getting the cache of seat maps"""
+    return caches[settings.SEAT_MAP_CACHE]
+
+
+def seat_map_cache_key(trip_id):
+    """Generic function for naming the seat map of a trip in the cache"""
+    return 'seat-map:{}'.format(trip_id)
+
+
+def build_seat_map(trip_id):
+    """Generic function for building the seat availability of a trip
+
+    Seats are read in one query over the tickets of the trip. The bitmap
+    is base64 encoded, bit n (least significant bit first) is set when
+    seat number n + 1 is taken; free_ranges lists the free seat numbers
+    as [first, last] runs. Returns the map and the seconds it is valid.
+    """
+    now = timezone.now()
+    tickets = models.Ticket.objects.filter(trip__id=trip_id).values_list(
+        'seat__number',
+        'passenger_id',
+        'reserved',
+        'hold_expires_at'
+    )
+
+    free = set()
+    seats = 0
+    timeout = settings.SEAT_MAP_CACHE_TTL
+    for number, passenger_id, reserved, hold_expires_at in tickets:
+        seats = max(seats, number)
+        if passenger_id is None or (
+            not reserved and hold_expires_at and hold_expires_at <= now
+        ):
+            free.add(number)
+        elif not reserved and hold_expires_at:
+            expires_in = (hold_expires_at - now).total_seconds()
+            timeout = min(timeout, int(expires_in) + 1)
+
+    bitmap = bytearray((seats + 7) // 8)
+    free_ranges = []
+    for number in range(1, seats + 1):
+        if number not in free:
+            bitmap[(number - 1) // 8] |= 1 << ((number - 1) % 8)
+        elif free_ranges and free_ranges[-1][1] == number - 1:
+            free_ranges[-1][1] = number
+        else:
+            free_ranges.append([number, number])
+
+    seat_map = {
+        'trip': int(trip_id),
+        'seats': seats,
+        'free': len(free),
+        'bitmap': base64.b64encode(bytes(bitmap)).decode(),
+        'free_ranges': free_ranges,
+    }
+    return seat_map, timeout
+
+
+def get_seat_map(trip_id):
+    """Generic function for getting the seat map of a trip from the cache
+
+    Returns None when the trip does not exist.
+    """
+    key = seat_map_cache_key(trip_id)
+    seat_map = seat_map_cache().get(key)
+    if seat_map is not None:
+        return seat_map
+
+    seat_map, timeout = build_seat_map(trip_id)
+    if not seat_map['seats']:
+        if not models.Trip.objects.filter(id=trip_id).exists():
+            return None
+    seat_map_cache().set(key, seat_map, timeout)
+    return seat_map
+
+
+def invalidate_seat_maps(trip_ids):
+    """Generic function for removing seat maps of trips from the cache"""
+    seat_map_cache().delete_many([
+        seat_map_cache_key(trip_id) for trip_id in trip_ids
+    ])
@@ -1,8 +1,147 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, When, Value
+from django.utils import timezone
 from rest_framework import serializers
+from app.fieldsets import FieldsetMixin
+from app.streaming import queryset_chunks
 from main import models
+from trip.reservations import tickets_count, invalidate_buses_trips
+from trip.route_stats import trips_stats_changed, buses_stats_changed
+
+
+TICKETS_BATCH_SIZE = 500
+SEATS_BATCH_SIZE = 500
+TRIPS_BULK_MAX = 200
+TICKETS_RESERVE_MAX = 20
+BUSES_BULK_MAX = 200
+DEFAULT_BUS_CAPACITY = 10
+LAYOUT_SEATS_FIELDS = ('capacity', 'rows', 'premium_rows')
+
+
+def layout_seats(bus, layout, user, numbers):
+    """Generic function for building seats of a bus from a layout"""
+    return [
+        models.Seat(
+            number=number,
+            seat_class=(
+                layout.seat_class(number) if layout
+                else models.Seat.STANDARD
+            ),
+            created_by=user,
+            bus=bus
+        )
+        for number in numbers
+    ]
+
+
+def create_buses_seats(buses, user):
+    """Generic function for creating seats of new buses in batched inserts"""
+    seats = []
+    for bus in buses:
+        capacity = bus.layout.capacity if bus.layout else DEFAULT_BUS_CAPACITY
+        seats += layout_seats(bus, bus.layout, user, range(1, capacity + 1))
+    models.Seat.objects.bulk_create(seats, batch_size=SEATS_BATCH_SIZE)
+    return seats
+
+
+def regenerate_layout_seats(layout, buses, user):
+    """Generic function for adapting seats of buses to their layout
+
+    Seats over the capacity are deleted with their tickets, seat classes
+    are rewritten with a single UPDATE and missing seats are added with a
+    batched insert, with their tickets for the trips of the buses yet to
+    depart. Seats with tickets held or reserved can not be removed. Seats
+    counters and the route rollup are recounted with set based UPDATEs
+    and cached trips of the buses follow.
+    """
+    capacity = layout.capacity if layout else DEFAULT_BUS_CAPACITY
+    premium_seats = layout.premium_seats if layout else 0
+    buses = list(buses)
+    bus_ids = [bus.id for bus in buses]
+    seats = models.Seat.objects.filter(bus__in=bus_ids)
+
+    with transaction.atomic():
+        removed = models.Ticket.objects.filter(
+            seat__in=seats.filter(number__gt=capacity)
+        ).select_for_update()
+        if any(passenger for passenger in removed.values_list(
+            'passenger_id',
+            flat=True
+        )):
+            message = ('No puede quitar asientos con tickets retenidos o '
+                       'reservados.')
+            raise serializers.ValidationError(message)
 
+        seats.filter(number__gt=capacity).delete()
+        seats.update(seat_class=Case(
+            When(number__lte=premium_seats, then=Value(models.Seat.PREMIUM)),
+            default=Value(models.Seat.STANDARD),
+        ))
 
-class RouteSerializer(serializers.ModelSerializer):
+        existing = {}
+        for bus_id, number in seats.values_list('bus_id', 'number'):
+            existing.setdefault(bus_id, set()).add(number)
+
+        missing = []
+        for bus in buses:
+            numbers = [
+                number for number in range(1, capacity + 1)
+                if number not in existing.get(bus.id, ())
+            ]
+            missing += layout_seats(bus, layout, user, numbers)
+        last_seat = models.Seat.objects.order_by('-id').values_list(
+            'id',
+            flat=True
+        ).first() or 0
+        models.Seat.objects.bulk_create(missing, batch_size=SEATS_BATCH_SIZE)
+
+        trips = models.Trip.objects.filter(bus__in=bus_ids)
+        if missing:
+            seats_by_bus = {}
+            for seat_id, bus_id in seats.filter(
+                id__gt=last_seat
+            ).order_by('number').values_list('id', 'bus_id'):
+                seats_by_bus.setdefault(bus_id, []).append(seat_id)
+            upcoming = trips.filter(
+                begin_at__gte=timezone.now()
+            ).only('id', 'bus_id')
+            for chunk in queryset_chunks(upcoming, TICKETS_BATCH_SIZE):
+                create_trips_tickets(chunk, user, seats_by_bus)
+
+        trips.update(
+            seats_total=tickets_count(),
+            seats_reserved=tickets_count(reserved=True)
+        )
+        buses_stats_changed(bus_ids)
+        invalidate_buses_trips(bus_ids)
+
+
+def buses_seats(bus_ids):
+    """Generic function for getting seat ids of buses in one query"""
+    seats_by_bus = {}
+    seats = models.Seat.objects.filter(
+        bus__id__in=bus_ids
+    ).order_by('number').values_list('id', 'bus_id')
+    for seat_id, bus_id in seats:
+        seats_by_bus.setdefault(bus_id, []).append(seat_id)
+    return seats_by_bus
+
+
+def create_trips_tickets(trips, user, seats_by_bus):
+    """Generic function for creating tickets of trips in batched inserts"""
+    tickets = [
+        models.Ticket(created_by=user, seat_id=seat_id, trip=trip)
+        for trip in trips
+        for seat_id in seats_by_bus.get(trip.bus_id, [])
+    ]
+    models.Ticket.objects.bulk_create(tickets, batch_size=TICKETS_BATCH_SIZE)
+    return tickets
+
+
+class RouteSerializer(FieldsetMixin, serializers.ModelSerializer):
     """Serializer for Route object"""
     class Meta:
         model = models.Route
@@ -10,12 +149,106 @@ class RouteSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class BusSerializer(serializers.ModelSerializer):
+class SeatLayoutSerializer(FieldsetMixin, serializers.ModelSerializer):
+    """Serializer for SeatLayout object"""
+    class Meta:
+        model = models.SeatLayout
+        fields = ('id', 'name', 'capacity', 'rows', 'premium_rows',)
+        read_only_fields = ('id',)
+
+    def validate(self, data):
+        """Validate rows are consistent with capacity"""
+        capacity = data.get('capacity', getattr(self.instance, 'capacity', 0))
+        rows = data.get('rows', getattr(self.instance, 'rows', 0))
+        premium_rows = data.get(
+            'premium_rows',
+            getattr(self.instance, 'premium_rows', 0)
+        )
+
+        if not 0 < rows <= capacity:
+            message = 'Las filas deben estar entre 1 y la capacidad.'
+            raise serializers.ValidationError(message)
+        if premium_rows > rows:
+            message = 'Las filas premium no pueden superar las filas.'
+            raise serializers.ValidationError(message)
+
+        return data
+
+    def update(self, instance, data):
+        """Update a layout, regenerating seats of buses when seats change"""
+        seats_changed = any(
+            name in data and data[name] != getattr(instance, name)
+            for name in LAYOUT_SEATS_FIELDS
+        )
+
+        with transaction.atomic():
+            layout = super().update(instance, data)
+            if seats_changed:
+                user = self.context['request'].user
+                regenerate_layout_seats(layout, layout.buses.all(), user)
+
+        return layout
+
+
+class BusListSerializer(serializers.ListSerializer):
+    """Serializer for creating several Bus objects at once"""
+
+    def validate(self, data):
+        """Validate quantity of buses in one request"""
+        if not data:
+            message = 'Debe enviar al menos un bus.'
+            raise serializers.ValidationError(message)
+        if len(data) > BUSES_BULK_MAX:
+            message = 'No puede crear más de {} buses a la vez.'
+            raise serializers.ValidationError(message.format(BUSES_BULK_MAX))
+        return data
+
+    def to_internal_value(self, data):
+        """Validate drivers are not repeated nor assigned, by item"""
+        data = super().to_internal_value(data)
+        drivers = [item.get('driver') for item in data]
+        assigned = set(models.Bus.objects.filter(
+            driver__in=[driver for driver in drivers if driver]
+        ).values_list('driver_id', flat=True))
+        errors, seen = [], set()
+        for driver in drivers:
+            if driver and (driver.id in assigned or driver.id in seen):
+                message = 'El conductor ya tiene un bus asignado.'
+                errors.append({'driver': [message]})
+            else:
+                errors.append({})
+            if driver:
+                seen.add(driver.id)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return data
+
+    def create(self, data):
+        """Custom creation function, seats of all buses in a few inserts"""
+        with transaction.atomic():
+            buses = [models.Bus(**item) for item in data]
+            if connection.features.can_return_rows_from_bulk_insert:
+                models.Bus.objects.bulk_create(buses)
+            else:
+                for bus in buses:
+                    bus.save()
+
+            create_buses_seats(buses, data[0].get('created_by'))
+
+        return buses
+
+
+class BusSerializer(FieldsetMixin, serializers.ModelSerializer):
     """Serializer for Bus object"""
     driver = serializers.PrimaryKeyRelatedField(
         queryset=models.User.objects.filter(user_type=3),
         allow_null=True
     )
+    layout = serializers.PrimaryKeyRelatedField(
+        queryset=models.SeatLayout.objects.all(),
+        allow_null=True,
+        required=False
+    )
     seats_bus = serializers.PrimaryKeyRelatedField(
         many=True,
         read_only=True
@@ -23,23 +256,58 @@ class BusSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = models.Bus
-        fields = ('id', 'num_plate', 'driver', 'seats_bus')
+        fields = ('id', 'num_plate', 'driver', 'layout', 'seats_bus')
         read_only_fields = ('id', 'seats_bus',)
+        list_serializer_class = BusListSerializer
+        expandable_fields = {
+            'driver': (
+                'user.serializers.UserSerializer',
+                'user.views.DriverViewSet'
+            ),
+            'layout': (SeatLayoutSerializer, 'trip.views.SeatLayoutViewSet'),
+            'seats_bus': (
+                'trip.serializers.SeatSerializer',
+                'trip.views.SeatViewSet'
+            ),
+        }
+
+    def validate_driver(self, driver):
+        """Validate the driver has no other bus, checked by the list in bulk"""
+        if driver is None or isinstance(self.parent, BusListSerializer):
+            return driver
+
+        buses = models.Bus.objects.filter(driver=driver)
+        if self.instance is not None:
+            buses = buses.exclude(id=self.instance.id)
+        if buses.exists():
+            message = 'El conductor ya tiene un bus asignado.'
+            raise serializers.ValidationError(message)
+        return driver
 
     def create(self, data):
         """Custom creation function, added seats related bus in creation"""
-        bus = models.Bus.objects.create(**data)
-        user = data.get('created_by')
-        for index in range(1, 11):
-            models.Seat.objects.create(
-                number=index,
-                created_by=user,
-                bus=bus
-            )
+        with transaction.atomic():
+            bus = models.Bus.objects.create(**data)
+            create_buses_seats([bus], data.get('created_by'))
+
         return bus
 
+    def update(self, instance, data):
+        """Update a bus, regenerating seats when the layout changes"""
+        layout_changed = (
+            'layout' in data and data['layout'] != instance.layout
+        )
 
-class SeatSerializer(serializers.ModelSerializer):
+        with transaction.atomic():
+            bus = super().update(instance, data)
+            if layout_changed:
+                user = self.context['request'].user
+                regenerate_layout_seats(bus.layout, [bus], user)
+
+        return bus
+
+
+class SeatSerializer(FieldsetMixin, serializers.ModelSerializer):
     """Serializer for Seat object"""
     bus = serializers.PrimaryKeyRelatedField(
         read_only=True
@@ -47,11 +315,52 @@ class SeatSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = models.Seat
-        fields = ('id', 'number', 'bus')
-        read_only_fields = ('id', 'bus', 'number',)
+        fields = ('id', 'number', 'seat_class', 'bus')
+        read_only_fields = ('id', 'bus', 'number', 'seat_class',)
+        expandable_fields = {
+            'bus': (BusSerializer, 'trip.views.BusViewSet'),
+        }
+
+
+class TripListSerializer(serializers.ListSerializer):
+    """Serializer for creating several Trip objects at once"""
+
+    def validate(self, data):
+        """Validate quantity of trips in one request"""
+        if not data:
+            message = 'Debe enviar al menos un viaje.'
+            raise serializers.ValidationError(message)
+        if len(data) > TRIPS_BULK_MAX:
+            message = 'No puede crear más de {} viajes a la vez.'
+            raise serializers.ValidationError(message.format(TRIPS_BULK_MAX))
+        return data
+
+    def create(self, data):
+        """Custom creation function, tickets of all trips in a few inserts"""
+        seats_by_bus = buses_seats({item['bus'].id for item in data})
+        trips = [
+            models.Trip(
+                seats_total=len(seats_by_bus.get(item['bus'].id, [])),
+                **item
+            )
+            for item in data
+        ]
+
+        with transaction.atomic():
+            if connection.features.can_return_rows_from_bulk_insert:
+                models.Trip.objects.bulk_create(trips)
+            else:
+                for trip in trips:
+                    trip.save()
 
+            user = data[0].get('created_by')
+            create_trips_tickets(trips, user, seats_by_bus)
+            trips_stats_changed(trips)
 
-class TripSerializer(serializers.ModelSerializer):
+        return trips
+
+
+class TripSerializer(FieldsetMixin, serializers.ModelSerializer):
     """Serializer for Trip object"""
     route = serializers.PrimaryKeyRelatedField(
         queryset=models.Route.objects.all()
@@ -66,26 +375,94 @@ class TripSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = models.Trip
-        fields = ('id', 'name', 'begin_at', 'route', 'bus', 'tickets_trip',)
-        read_only_fields = ('id', 'tickets_trip',)
+        fields = (
+            'id', 'name', 'begin_at', 'route', 'bus',
+            'seats_total', 'seats_reserved', 'tickets_trip',
+        )
+        read_only_fields = (
+            'id', 'seats_total', 'seats_reserved', 'tickets_trip',
+        )
+        list_serializer_class = TripListSerializer
+        expandable_fields = {
+            'route': (RouteSerializer, 'trip.views.RouteViewSet'),
+            'bus': (BusSerializer, 'trip.views.BusViewSet'),
+            'tickets_trip': (
+                'trip.serializers.TicketSerializer',
+                'trip.views.TicketViewSet'
+            ),
+        }
 
     def create(self, data):
         """Custom creation function, added tickets related trip in creation"""
-        trip = models.Trip.objects.create(**data)
-        bus = data.get('bus')
-        user = data.get('created_by')
-
-        for seat in models.Seat.objects.filter(bus__id=bus.id):
-            models.Ticket.objects.create(
-                created_by=user,
-                seat=seat,
-                trip=trip
-            )
+        seats_by_bus = buses_seats([data['bus'].id])
+        seats_total = len(seats_by_bus.get(data['bus'].id, []))
+
+        with transaction.atomic():
+            trip = models.Trip.objects.create(seats_total=seats_total, **data)
+            create_trips_tickets([trip], data.get('created_by'), seats_by_bus)
+            trips_stats_changed([trip])
 
         return trip
 
+    def update(self, instance, data):
+        """Custom update function, moving the trip in the route rollup"""
+        moved = any(
+            field in data and data[field] != getattr(instance, field)
+            for field in ('route', 'bus', 'begin_at')
+        )
+        if not moved:
+            return super().update(instance, data)
+
+        with transaction.atomic():
+            trips_stats_changed([instance], sign=-1)
+            trip = super().update(instance, data)
+            trips_stats_changed([trip])
 
-class TicketSerializer(serializers.ModelSerializer):
+        return trip
+
+
+class TripSearchSerializer(serializers.Serializer):
+    """Serializer for search trips between two places"""
+    origin = serializers.CharField(max_length=255)
+    destination = serializers.CharField(max_length=255)
+    date = serializers.DateField(required=False)
+    begin_from = serializers.DateTimeField(required=False)
+    begin_to = serializers.DateTimeField(required=False)
+    available = serializers.BooleanField(default=True)
+
+    def validate(self, data):
+        """Validate date is not mixed with a range, building the range"""
+        date = data.pop('date', None)
+
+        if date and ('begin_from' in data or 'begin_to' in data):
+            message = 'Debe buscar por fecha o por rango, no ambos.'
+            raise serializers.ValidationError(message)
+        if date:
+            begin_from = timezone.make_aware(
+                datetime.combine(date, time.min)
+            )
+            data['begin_from'] = begin_from
+            data['begin_to'] = begin_from + timedelta(days=1)
+
+        return data
+
+
+class TripSearchResultSerializer(FieldsetMixin, serializers.ModelSerializer):
+    """Serializer for Trip object found by search"""
+    origin = serializers.CharField(source='route.origin')
+    destination = serializers.CharField(source='route.destination')
+    free_seats = serializers.IntegerField()
+
+    class Meta:
+        model = models.Trip
+        fields = (
+            'id', 'name', 'begin_at', 'route', 'bus',
+            'origin', 'destination', 'free_seats',
+        )
+        read_only_fields = fields
+
+
+class TicketSerializer(FieldsetMixin, serializers.ModelSerializer):
     """Serializer for Ticket object"""
     trip = serializers.PrimaryKeyRelatedField(
         read_only=True
@@ -96,5 +473,48 @@ class TicketSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = models.Ticket
-        fields = ('id', 'reserved', 'trip', 'seat',)
-        read_only_fields = ('id', 'trip', 'seat',)
+        fields = ('id', 'reserved', 'hold_expires_at', 'trip', 'seat',)
+        read_only_fields = ('id', 'hold_expires_at', 'trip', 'seat',)
+        expandable_fields = {
+            'trip': (TripSerializer, 'trip.views.TripViewSet'),
+            'seat': (SeatSerializer, 'trip.views.SeatViewSet'),
+        }
+
+
+class TicketHoldSerializer(serializers.Serializer):
+    """Serializer for hold a ticket during checkout"""
+    minutes = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.TICKET_HOLD_MAX_MINUTES,
+        required=False
+    )
+
+
+class TicketBatchReserveSerializer(serializers.Serializer):
+    """Serializer for reserve several tickets of a trip"""
+    trip = serializers.PrimaryKeyRelatedField(
+        queryset=models.Trip.objects.all()
+    )
+    seats = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False
+    )
+    tickets = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False
+    )
+
+    def validate(self, data):
+        """Validate seats or tickets are requested, but not both"""
+        requested = [data[key] for key in ('seats', 'tickets') if key in data]
+
+        if len(requested) != 1:
+            message = 'Debe enviar asientos o tickets.'
+            raise serializers.ValidationError(message)
+        if not 0 < len(requested[0]) <= TICKETS_RESERVE_MAX:
+            message = 'Puede reservar entre 1 y {} tickets a la vez.'
+            raise serializers.ValidationError(
+                message.format(TICKETS_RESERVE_MAX)
+            )
+
+        return data
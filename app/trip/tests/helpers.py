@@ -0,0 +1,78 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from app.queries import capture_queries
+
+
+def clear_caches():
+    """Clear every cache alias, responses, generations and seat maps"""
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+@contextmanager
+def on_commit_callbacks():
+    """Run the on_commit callbacks registered inside the block
+
+    TestCase never commits its transaction, so callbacks waiting for the
+    commit are run by hand when the block ends.
+    """
+    start = len(connection.run_on_commit)
+    yield
+    callbacks = connection.run_on_commit[start:]
+    del connection.run_on_commit[start:]
+    for savepoint_ids, callback in callbacks:
+        callback()
+
+
+class QueryBoundMixin:
+    """Mixin for test cases asserting bounds on queries per request"""
+
+    def assertQueriesBounded(self, request, grow, max_queries, steps=3):
+        """Assert a request runs at most max_queries while rows grow
+
+        The request is repeated after each call to grow, so a query by
+        row (N+1) is detected when the count changes between steps. Cached
+        responses are cleared, rows grow without invalidating them.
+        """
+        counts = []
+        for step in range(steps):
+            grow(step)
+            clear_caches()
+            with CaptureQueriesContext(connection) as queries:
+                response = request()
+            counts.append(len(queries))
+            self.assertLessEqual(
+                len(queries),
+                max_queries,
+                'Request ran {} queries at step {}:\n{}'.format(
+                    len(queries),
+                    step,
+                    '\n'.join(query['sql'] for query in queries)
+                )
+            )
+
+        self.assertEqual(
+            len(set(counts)),
+            1,
+            'Queries grow with the rows: {}'.format(counts)
+        )
+        return response
+
+    def assertNoDuplicateQueries(self, request, threshold=2, slow_ms=None):
+        """Assert a request repeats no statement and runs no slow one
+
+        Statements are compared with their values removed, so the same
+        query run by row (N+1) is reported once with its count.
+        """
+        with capture_queries(threshold, slow_ms) as capture:
+            response = request()
+        self.assertFalse(
+            capture.has_problems,
+            'Duplicated or slow queries:\n' + capture.report()
+        )
+        return response
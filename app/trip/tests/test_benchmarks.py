@@ -0,0 +1,68 @@
+from django.test import TestCase
+
+from main.models import Trip, Ticket, RouteStats
+from trip.benchmarks import seed_dataset, run_benchmarks, \
+                            compare_baseline, renderer_payloads, \
+                            run_renderer_benchmark
+from trip.tests.helpers import clear_caches
+
+
+class BenchmarkTest(TestCase):
+    """Test the benchmark suite over a small dataset"""
+
+    def test_seed_dataset(self):
+        """Test trips get a ticket by seat, counters and rollup"""
+        seed_dataset(routes=3, buses=2, seats=4, trips=10, days=2)
+
+        self.assertEqual(Trip.objects.count(), 10)
+        self.assertEqual(Ticket.objects.count(), 40)
+        self.assertFalse(Trip.objects.exclude(seats_total=4).exists())
+        self.assertEqual(
+            sum(RouteStats.objects.values_list('trips', flat=True)),
+            10
+        )
+
+    def test_run_benchmarks(self):
+        """Test every scenario runs without failures"""
+        context = seed_dataset(routes=3, buses=2, seats=4, trips=10, days=2)
+        results = run_benchmarks(context, requests=2)
+
+        self.assertIn('ticket_reserve', results)
+        for name, result in results.items():
+            self.assertEqual(result['failures'], 0)
+            if name.endswith('_cached'):
+                self.assertEqual(result['queries'], 0)
+            else:
+                self.assertGreater(result['queries'], 0)
+
+    def test_compare_baseline(self):
+        """Test slower, chattier or failing scenarios are regressions"""
+        base = {'p95': 10, 'rps': 100, 'queries': 2, 'failures': 0}
+        results = {
+            'same': dict(base, p95=12),
+            'slow': dict(base, p95=20),
+            'chatty': dict(base, queries=3),
+            'failing': dict(base, failures=1),
+        }
+        baseline = {name: base for name in results}
+
+        regressions = compare_baseline(results, baseline, tolerance=0.5)
+        self.assertEqual(
+            sorted(line.split(':')[0] for line in regressions),
+            ['chatty', 'failing', 'slow']
+        )
+
+    def test_run_renderer_benchmark(self):
+        """Test MessagePack payloads are measured against JSON"""
+        clear_caches()
+        context = seed_dataset(routes=3, buses=2, seats=4, trips=10, days=2)
+        payloads = renderer_payloads(context, page_size=5)
+        results = run_renderer_benchmark(payloads, rounds=2)
+
+        self.assertEqual(len(payloads['trip_list']['results']), 5)
+        for formats in results.values():
+            self.assertEqual(set(formats), {'json', 'msgpack'})
+            self.assertLess(
+                formats['msgpack']['bytes'],
+                formats['json']['bytes']
+            )
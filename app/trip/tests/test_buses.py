@@ -1,14 +1,21 @@
+import json
+
 from django.urls import reverse
 from django.test import TestCase
+from django.utils import timezone
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from main.models import User, Bus
+from main.models import User, Bus, Route, Seat, Trip, Ticket
 from trip.serializers import BusSerializer
+from trip.route_stats import trips_stats_changed
+from trip.tests.helpers import QueryBoundMixin
 
 
 BUSES_URL = reverse('trip:bus-list')
+BUSES_BULK_URL = reverse('trip:bus-bulk-create')
+USE_BY_ROUTE_URL = reverse('trip:bus-use-by-route')
 
 
 class PublicBusTest(TestCase):
@@ -112,8 +119,8 @@ class PrivateBusTest(TestCase):
         buses = Bus.objects.all()
         serializer = BusSerializer(buses, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data['results'], serializer.data)
+        self.assertEqual(len(response.data['results']), 2)
 
     def test_bus_detail_by_passenger(self):
         """Test logged passenger access to detail bus"""
@@ -191,6 +198,51 @@ class PrivateBusTest(TestCase):
         response = self.client.post(BUSES_URL, payload)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_bus_create_with_assigned_driver(self):
+        """Test a driver with a bus can not get another one"""
+        Bus.objects.create(
+            num_plate='NNNN11',
+            driver=self.user_driver,
+            created_by=self.user_admin
+        )
+        payload = {
+            'num_plate': 'NNNN22',
+            'driver': self.user_driver.id
+        }
+        self.client.force_authenticate(self.user_admin)
+        response = self.client.post(BUSES_URL, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('driver', response.data)
+
+    def test_bus_bulk_create_with_repeated_drivers(self):
+        """Test bulk buses reject repeated or assigned drivers by item"""
+        other_driver = User.objects.create(
+            username='usernamedriver2',
+            password='testpass',
+            user_type=3,
+        )
+        Bus.objects.create(
+            num_plate='NNNN11',
+            driver=other_driver,
+            created_by=self.user_admin
+        )
+        payload = [
+            {'num_plate': 'NNNN22', 'driver': self.user_driver.id},
+            {'num_plate': 'NNNN33', 'driver': self.user_driver.id},
+            {'num_plate': 'NNNN44', 'driver': other_driver.id},
+            {'num_plate': 'NNNN55', 'driver': None},
+        ]
+        self.client.force_authenticate(self.user_admin)
+        response = self.client.post(BUSES_BULK_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            ['driver' in item for item in response.data],
+            [False, True, True, False]
+        )
+        self.assertEqual(Bus.objects.count(), 1)
+
     def test_bus_update_by_passenger(self):
         """Test logged passenger access to update bus"""
         payload = {
@@ -277,3 +329,160 @@ class PrivateBusTest(TestCase):
         self.client.force_authenticate(self.user_admin)
         response = self.client.delete(BUSES_URL+'1/')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class UseByRouteBusTest(TestCase):
+    """Test use percentage of buses by route requested by admin"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.route_test_1 = self.create_route('route-test-1')
+        self.route_test_2 = self.create_route('route-test-2')
+        self.bus_test_1 = self.create_bus('NNNN11-test')
+        self.bus_test_2 = self.create_bus('NNNN22-test')
+        self.client.force_authenticate(self.user_admin)
+
+    def create_route(self, name):
+        """Create a route for tests"""
+        return Route.objects.create(
+            name=name,
+            origin='origin-test',
+            destination='destination-test',
+            created_by=self.user_admin
+        )
+
+    def create_bus(self, num_plate):
+        """Create a bus with four seats for tests"""
+        bus = Bus.objects.create(
+            num_plate=num_plate,
+            created_by=self.user_admin
+        )
+        for index in range(1, 5):
+            Seat.objects.create(
+                number=index,
+                created_by=self.user_admin,
+                bus=bus
+            )
+        return bus
+
+    def create_trip(self, route, bus, reserved):
+        """Create a trip with a ticket by seat and reserved tickets"""
+        trip = Trip.objects.create(
+            name='trip-test',
+            begin_at=timezone.now(),
+            created_by=self.user_admin,
+            route=route,
+            bus=bus,
+            seats_total=bus.seats_bus.count(),
+            seats_reserved=reserved
+        )
+        trips_stats_changed([trip])
+        for index, seat in enumerate(bus.seats_bus.all()):
+            Ticket.objects.create(
+                created_by=self.user_admin,
+                trip=trip,
+                seat=seat,
+                reserved=index < reserved
+            )
+        return trip
+
+    def test_use_by_route_groups_bus_and_route(self):
+        """Test percentage is computed by bus and route pair"""
+        self.create_trip(self.route_test_1, self.bus_test_1, 4)
+        self.create_trip(self.route_test_1, self.bus_test_1, 2)
+        self.create_trip(self.route_test_1, self.bus_test_2, 1)
+        self.create_trip(self.route_test_2, self.bus_test_1, 0)
+
+        response = self.client.get(
+            USE_BY_ROUTE_URL,
+            {'route_id': self.route_test_1.id, 'percentage': 50}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['id'], self.bus_test_1.id)
+        self.assertEqual(response.data[0]['route'], self.route_test_1.id)
+        self.assertEqual(response.data[0]['use_percentage'], 75)
+
+    def test_use_by_several_routes(self):
+        """Test several route ids are accepted in one request"""
+        self.create_trip(self.route_test_1, self.bus_test_1, 4)
+        self.create_trip(self.route_test_2, self.bus_test_2, 2)
+
+        route_ids = '{},{}'.format(self.route_test_1.id, self.route_test_2.id)
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                USE_BY_ROUTE_URL,
+                {'route_id': route_ids, 'percentage': 10}
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(bus['route'], bus['use_percentage']) for bus in response.data],
+            [(self.route_test_1.id, 100), (self.route_test_2.id, 50)]
+        )
+
+    def test_use_by_route_streamed(self):
+        """Test the streamed export sends the same buses"""
+        self.create_trip(self.route_test_1, self.bus_test_1, 4)
+        self.create_trip(self.route_test_2, self.bus_test_2, 2)
+
+        data = self.client.get(USE_BY_ROUTE_URL).data
+        response = self.client.get(USE_BY_ROUTE_URL, {'stream': 'true'})
+
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content)
+        self.assertEqual(json.loads(content), json.loads(json.dumps(data)))
+
+    def test_invalid_use_by_route(self):
+        """Test invalid route ids are rejected"""
+        response = self.client.get(USE_BY_ROUTE_URL, {'route_id': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class QueriesBusTest(QueryBoundMixin, TestCase):
+    """Test queries of bus requests do not grow with the rows"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.client.force_authenticate(self.user_admin)
+
+    def create_buses(self, step):
+        """Create five buses with seats"""
+        for index in range(5):
+            bus = Bus.objects.create(
+                num_plate='NN-{}-{}'.format(step, index),
+                created_by=self.user_admin
+            )
+            Seat.objects.create(
+                number=1,
+                created_by=self.user_admin,
+                bus=bus
+            )
+
+    def test_bus_list_queries_bounded(self):
+        """Test bus list loads seats of every bus in bulk"""
+        response = self.assertQueriesBounded(
+            lambda: self.client.get(BUSES_URL),
+            self.create_buses,
+            max_queries=2
+        )
+        self.assertEqual(len(response.data['results']), 15)
+
+    def test_bus_reports_no_duplicate_queries(self):
+        """Test bus list and use by route run no query by row"""
+        self.create_buses(0)
+        self.assertNoDuplicateQueries(lambda: self.client.get(BUSES_URL))
+        self.assertNoDuplicateQueries(
+            lambda: self.client.get(USE_BY_ROUTE_URL)
+        )
@@ -0,0 +1,73 @@
+import time
+from unittest.mock import Mock, patch
+
+from django.urls import reverse
+from django.test import TestCase, override_settings
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from app.database import check_connections, connections_used
+
+
+HEALTH_URL = reverse('health')
+
+
+class DatabaseHealthTest(TestCase):
+    """Test health checks of database connections"""
+
+    def test_health_endpoint(self):
+        """Test health is public and checks every database"""
+        response = APIClient().get(HEALTH_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['databases'], {'default': 'ok'})
+
+    def mock_connection(self, usable=True, idle=None):
+        """Open connection idle some seconds, never used when idle is None"""
+        connection = Mock(
+            connection=object(),
+            in_atomic_block=False,
+            last_used_at=None if idle is None else time.monotonic() - idle
+        )
+        connection.is_usable.return_value = usable
+        return connection
+
+    @override_settings(DATABASE_HEALTH_CHECKS=True)
+    def test_check_connections_closes_broken(self):
+        """Test persistent connections not usable are closed"""
+        broken = self.mock_connection(usable=False)
+        working = self.mock_connection()
+        closed = Mock(connection=None)
+
+        with patch('app.database.connections') as connections:
+            connections.all.return_value = [broken, working, closed]
+            check_connections()
+
+        broken.close.assert_called_once_with()
+        working.close.assert_not_called()
+        closed.is_usable.assert_not_called()
+
+    @override_settings(DATABASE_HEALTH_CHECKS=True)
+    def test_check_connections_only_idle(self):
+        """Test a warm connection runs no query, an idle one is pinged"""
+        warm = self.mock_connection()
+        idle = self.mock_connection(usable=False, idle=60)
+        with patch('app.database.connections') as connections:
+            connections.all.return_value = [warm]
+            connections_used()
+            connections.all.return_value = [warm, idle]
+            check_connections()
+
+        warm.is_usable.assert_not_called()
+        warm.close.assert_not_called()
+        idle.close.assert_called_once_with()
+
+    def test_check_connections_disabled(self):
+        """Test connections are not pinged unless checks are enabled"""
+        connection = self.mock_connection()
+        with patch('app.database.connections') as connections:
+            connections.all.return_value = [connection]
+            check_connections()
+
+        connection.is_usable.assert_not_called()
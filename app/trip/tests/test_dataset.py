@@ -0,0 +1,63 @@
+from datetime import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils import timezone
+
+from main.models import User, Route, Bus, Seat, Trip, Ticket, RouteStats
+from trip.dataset import generate_dataset
+
+
+class GenerateDatasetTest(TestCase):
+    """Test generation of synthetic datasets"""
+
+    def test_generate_dataset_command(self):
+        """Test users of each type and rows are generated"""
+        out = StringIO()
+        call_command(
+            'generate_dataset',
+            '--admins', '1', '--passengers', '5', '--drivers', '2',
+            '--routes', '3', '--buses', '2', '--seats', '4',
+            '--trips', '10', '--reserved-ratio', '0.5',
+            stdout=out
+        )
+
+        self.assertIn('10 trips and 40 tickets', out.getvalue())
+        self.assertEqual(User.objects.filter(user_type=2).count(), 5)
+        self.assertEqual(User.objects.filter(user_type=3).count(), 2)
+        self.assertEqual(Route.objects.count(), 3)
+        self.assertEqual(Bus.objects.exclude(driver=None).count(), 2)
+        self.assertEqual(Seat.objects.count(), 8)
+        self.assertEqual(Ticket.objects.count(), 40)
+        self.assertEqual(
+            Ticket.objects.filter(reserved=True).count(),
+            sum(Trip.objects.values_list('seats_reserved', flat=True))
+        )
+        self.assertTrue(RouteStats.objects.exists())
+
+    def test_generate_dataset_deterministic(self):
+        """Test the same seed and start generate the same rows"""
+        start = timezone.make_aware(datetime(2021, 1, 1))
+
+        def generate(prefix):
+            generate_dataset(
+                {1: 1, 2: 3, 3: 0}, 3, 2, 4, 10, 0.5, 5,
+                seed=7, start=start, prefix=prefix
+            )
+            trips = Trip.objects.filter(name__startswith=prefix + '-')
+            return (
+                list(trips.order_by('id').values_list('begin_at', flat=True)),
+                list(Ticket.objects.filter(trip__in=trips).order_by(
+                    'id'
+                ).values_list('reserved', flat=True)),
+            )
+
+        self.assertEqual(generate('first'), generate('second'))
+
+    def test_generate_dataset_prefix_exists(self):
+        """Test a prefix could not be generated twice"""
+        call_command('generate_dataset', '--trips', '1', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', '--trips', '1')
@@ -0,0 +1,217 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from main.models import User, Route, Bus, Seat, Trip, Ticket
+from trip.tests.helpers import clear_caches
+
+
+TRIPS_URL = reverse('trip:trip-list')
+BUSES_URL = reverse('trip:bus-list')
+TICKETS_URL = reverse('trip:ticket-list')
+PASSENGERS_URL = '/api/user/passengers/'
+
+
+class FieldsetTest(TestCase):
+    """Test ?fields=, ?omit= and ?expand= of the serializers"""
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.user_passenger = User.objects.create(
+            username='usernamepassenger',
+            password='testpass',
+            user_type=2,
+        )
+        self.client.force_authenticate(self.user_admin)
+
+    def create_trips(self, quantity):
+        """Create trips of new routes and buses with one ticket each"""
+        for index in range(quantity):
+            route = Route.objects.create(
+                name='route-test',
+                origin='origin-test',
+                destination='destination-test',
+                created_by=self.user_admin
+            )
+            bus = Bus.objects.create(
+                num_plate='NNNN{}'.format(index),
+                created_by=self.user_admin
+            )
+            seat = Seat.objects.create(
+                number=1,
+                created_by=self.user_admin,
+                bus=bus
+            )
+            trip = Trip.objects.create(
+                name='trip-test',
+                begin_at=timezone.now(),
+                created_by=self.user_admin,
+                route=route,
+                bus=bus,
+                seats_total=1
+            )
+            Ticket.objects.create(
+                created_by=self.user_admin,
+                trip=trip,
+                seat=seat
+            )
+
+    def get_captured(self, path, params):
+        """Send a request without cached responses capturing its queries"""
+        clear_caches()
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(path, params)
+        return response, [query['sql'] for query in captured]
+
+    def test_fields_and_omit(self):
+        """Test only the requested fields are sent"""
+        self.create_trips(1)
+
+        response = self.client.get(TRIPS_URL, {'fields': 'id,name'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name'})
+
+        response = self.client.get(TRIPS_URL, {'omit': 'tickets_trip,bus'})
+        trip = response.data['results'][0]
+        self.assertNotIn('tickets_trip', trip)
+        self.assertNotIn('bus', trip)
+        self.assertIn('route', trip)
+
+    def test_omitted_relation_not_queried(self):
+        """Test relations left out are not read from the database"""
+        self.create_trips(2)
+
+        response, queries = self.get_captured(TRIPS_URL, {})
+        self.assertEqual(len(response.data['results'][0]['tickets_trip']), 1)
+        self.assertTrue(any('main_ticket' in sql for sql in queries))
+
+        for params in ({'omit': 'tickets_trip'}, {'fields': 'id,name'}):
+            response, queries = self.get_captured(TRIPS_URL, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertFalse(any('main_ticket' in sql for sql in queries))
+
+    def test_expand_in_bulk(self):
+        """Test expanded relations are nested without a query by row"""
+        self.create_trips(1)
+        params = {'expand': 'route,bus'}
+        response, queries = self.get_captured(TRIPS_URL, params)
+        trip = response.data['results'][0]
+        self.assertEqual(trip['route']['name'], 'route-test')
+        self.assertEqual(trip['bus']['num_plate'], 'NNNN0')
+        self.assertEqual(len(trip['bus']['seats_bus']), 1)
+
+        self.create_trips(4)
+        response, more_queries = self.get_captured(TRIPS_URL, params)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(len(more_queries), len(queries))
+
+    def test_expand_many_in_bulk(self):
+        """Test expanded many relations are prefetched once"""
+        self.create_trips(1)
+        self.client.force_authenticate(self.user_passenger)
+        params = {'expand': 'route,tickets_trip'}
+        response, queries = self.get_captured(TRIPS_URL, params)
+        trip = response.data['results'][0]
+        self.assertEqual(trip['tickets_trip'][0]['reserved'], False)
+
+        self.create_trips(4)
+        response, more_queries = self.get_captured(TRIPS_URL, params)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(len(more_queries), len(queries))
+
+    def test_expand_permissions(self):
+        """Test relations are expanded only for users able to list them"""
+        self.create_trips(1)
+        trip_path = TRIPS_URL + str(Trip.objects.get().id) + '/'
+        bus_path = BUSES_URL + str(Bus.objects.get().id) + '/'
+        denied = [
+            (None, trip_path, 'tickets_trip'),
+            (None, trip_path, 'bus'),
+            (None, bus_path, 'driver'),
+            (None, bus_path, 'seats_bus'),
+            (self.user_passenger, trip_path, 'bus'),
+            (self.user_passenger, bus_path, 'driver'),
+            (self.user_admin, trip_path, 'tickets_trip'),
+        ]
+        for user, path, expand in denied:
+            self.client.force_authenticate(user)
+            response = self.client.get(path, {'expand': expand})
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_403_FORBIDDEN,
+                (user, path, expand)
+            )
+            self.assertIn(expand, response.data['detail'])
+
+        self.client.force_authenticate(None)
+        response = self.client.get(trip_path, {'expand': 'route'})
+        self.assertEqual(response.data['route']['name'], 'route-test')
+
+    def test_expand_denied_with_cached_response(self):
+        """Test expansions are checked before cached responses are sent"""
+        self.create_trips(1)
+        path = TRIPS_URL + str(Trip.objects.get().id) + '/'
+        self.client.get(path, {'expand': 'bus'})
+
+        self.client.force_authenticate(None)
+        response = self.client.get(path, {'expand': 'bus'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_expand_with_fields(self):
+        """Test expanded relations are kept when fields are chosen"""
+        self.create_trips(1)
+        self.client.force_authenticate(self.user_passenger)
+
+        response = self.client.get(TICKETS_URL, {
+            'fields': 'id',
+            'expand': 'seat',
+        })
+        ticket = response.data['results'][0]
+        self.assertEqual(set(ticket), {'id', 'seat'})
+        self.assertEqual(ticket['seat']['number'], 1)
+
+    def test_unknown_fields(self):
+        """Test unknown fields and relations are rejected"""
+        self.create_trips(1)
+
+        response = self.client.get(TRIPS_URL, {'fields': 'id,other'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('other', response.data['fields'])
+
+        response = self.client.get(BUSES_URL, {'expand': 'num_plate'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('expand', response.data)
+
+    def test_writes_send_every_field(self):
+        """Test the fieldset does not apply to writes"""
+        self.create_trips(1)
+        route = Route.objects.first()
+        bus = Bus.objects.first()
+
+        response = self.client.post(TRIPS_URL + '?fields=id', {
+            'name': 'trip-created',
+            'begin_at': '2021-01-01T10:00:00',
+            'route': route.id,
+            'bus': bus.id,
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['name'], 'trip-created')
+        self.assertEqual(len(response.data['tickets_trip']), 1)
+
+    def test_user_fields(self):
+        """Test fields of users are chosen as well"""
+        self.client.force_authenticate(self.user_passenger)
+        path = PASSENGERS_URL + str(self.user_passenger.id) + '/'
+
+        response = self.client.get(path, {'fields': 'username'})
+        self.assertEqual(response.data, {'username': 'usernamepassenger'})
@@ -0,0 +1,136 @@
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.urls import reverse
+from django.test import TestCase
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from main.models import User, Route, Bus, Seat, Trip, Ticket
+
+
+TRIPS_URL = reverse('trip:trip-list')
+TICKETS_URL = reverse('trip:ticket-list')
+
+
+class IdempotencyKeyTest(TestCase):
+    """Test writes retried with the same Idempotency-Key"""
+
+    def setUp(self):
+        cache.clear()
+        caches[settings.IDEMPOTENCY_CACHE].clear()
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.user_passenger = User.objects.create(
+            username='usernamepassenger',
+            password='testpass',
+            user_type=2,
+        )
+        self.route_test = Route.objects.create(
+            name='route-test',
+            origin='origin-test',
+            destination='destination-test',
+            created_by=self.user_admin
+        )
+        self.bus_test = Bus.objects.create(
+            num_plate='NNNN11',
+            created_by=self.user_admin
+        )
+        self.seat_test = Seat.objects.create(
+            number=1,
+            created_by=self.user_admin,
+            bus=self.bus_test
+        )
+        self.payload = {
+            'name': 'triptest',
+            'begin_at': '2021-01-01T10:00:00',
+            'route': self.route_test.id,
+            'bus': self.bus_test.id,
+        }
+
+    def test_trip_create_retry_replayed(self):
+        """Test a retried creation returns the first trip"""
+        self.client.force_authenticate(self.user_admin)
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'trip-key-1'}
+        response_1 = self.client.post(TRIPS_URL, self.payload, **headers)
+        response_2 = self.client.post(TRIPS_URL, self.payload, **headers)
+
+        self.assertEqual(response_2.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response_1.data, response_2.data)
+        self.assertEqual(response_2['Idempotent-Replayed'], 'true')
+        self.assertEqual(Trip.objects.count(), 1)
+        self.assertEqual(Ticket.objects.count(), 1)
+
+    def test_trip_create_retry_after_default_cache_cleared(self):
+        """Test records are kept apart from cached responses"""
+        self.client.force_authenticate(self.user_admin)
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'trip-key-1'}
+        self.client.post(TRIPS_URL, self.payload, **headers)
+        cache.clear()
+        response = self.client.post(TRIPS_URL, self.payload, **headers)
+
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(Trip.objects.count(), 1)
+
+    def test_trip_create_without_key(self):
+        """Test creations without key are not replayed"""
+        self.client.force_authenticate(self.user_admin)
+        self.client.post(TRIPS_URL, self.payload)
+        self.client.post(TRIPS_URL, self.payload)
+        self.assertEqual(Trip.objects.count(), 2)
+
+    def test_trip_create_key_other_payload(self):
+        """Test a key reused with another payload is rejected"""
+        self.client.force_authenticate(self.user_admin)
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'trip-key-1'}
+        self.client.post(TRIPS_URL, self.payload, **headers)
+        self.payload['name'] = 'triptest-2'
+        response = self.client.post(TRIPS_URL, self.payload, **headers)
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+        self.assertEqual(Trip.objects.count(), 1)
+
+    def test_trip_create_key_by_user(self):
+        """Test keys of different users do not collide"""
+        user_admin_2 = User.objects.create(
+            username='usernameadmin2',
+            password='testpass',
+            user_type=1,
+        )
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'trip-key-1'}
+        self.client.force_authenticate(self.user_admin)
+        self.client.post(TRIPS_URL, self.payload, **headers)
+        self.client.force_authenticate(user_admin_2)
+        self.client.post(TRIPS_URL, self.payload, **headers)
+        self.assertEqual(Trip.objects.count(), 2)
+
+    def test_ticket_reserve_retry_replayed(self):
+        """Test a retried reservation returns the first response"""
+        trip = Trip.objects.create(
+            name='trip-test',
+            begin_at=timezone.now(),
+            created_by=self.user_admin,
+            route=self.route_test,
+            bus=self.bus_test
+        )
+        ticket = Ticket.objects.create(
+            created_by=self.user_admin,
+            trip=trip,
+            seat=self.seat_test
+        )
+        path = TICKETS_URL+str(ticket.id)+'/reserve/'
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'ticket-key-1'}
+
+        self.client.force_authenticate(self.user_passenger)
+        self.client.post(path, **headers)
+        response = self.client.post(path, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['reserved'])
@@ -0,0 +1,317 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.urls import reverse
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from main.models import User, Route, Bus, Seat, SeatLayout, Trip, \
+                        Ticket, RouteStats
+from trip.reservations import reserve_ticket, sync_trip_counters
+from trip.seat_map import get_seat_map
+from trip.tests.helpers import clear_caches, on_commit_callbacks
+
+
+LAYOUTS_URL = reverse('trip:seatlayout-list')
+BUSES_URL = reverse('trip:bus-list')
+BUSES_BULK_URL = reverse('trip:bus-bulk-create')
+TRIPS_URL = reverse('trip:trip-list')
+
+
+class PrivateSeatLayoutTest(TestCase):
+    """Test available seat layout request by logged user"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.user_passenger = User.objects.create(
+            username='usernamepassenger',
+            password='testpass',
+            user_type=2,
+        )
+        self.layout_test = SeatLayout.objects.create(
+            name='layout-test',
+            capacity=40,
+            rows=10,
+            premium_rows=2,
+            created_by=self.user_admin
+        )
+
+    def test_layout_list_by_passenger(self):
+        """Test logged passenger access to list layout"""
+        self.client.force_authenticate(self.user_passenger)
+        response = self.client.get(LAYOUTS_URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_layout_create_by_admin(self):
+        """Test logged admin access to create correctly layout"""
+        payload = {
+            'name': 'layout-test',
+            'capacity': 45,
+            'rows': 12,
+            'premium_rows': 1
+        }
+
+        self.client.force_authenticate(self.user_admin)
+        response = self.client.post(LAYOUTS_URL, payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_invalid_layout_create_by_admin(self):
+        """Test logged admin access to create invalid layout"""
+        payload = {
+            'name': 'layout-test',
+            'capacity': 10,
+            'rows': 12,
+            'premium_rows': 1
+        }
+
+        self.client.force_authenticate(self.user_admin)
+        response = self.client.post(LAYOUTS_URL, payload)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bus_create_with_layout(self):
+        """Test seats of a new bus are generated from its layout"""
+        payload = {
+            'num_plate': 'NNNN11',
+            'driver': None,
+            'layout': self.layout_test.id
+        }
+
+        self.client.force_authenticate(self.user_admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(BUSES_URL, payload, format='json')
+
+        inserts = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('INSERT INTO "main_seat"')
+        ]
+        self.assertEqual(len(inserts), 1)
+
+        seats = Seat.objects.filter(bus__id=response.data['id'])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(seats.count(), 40)
+        self.assertEqual(seats.filter(seat_class=Seat.PREMIUM).count(), 8)
+
+    def test_bus_create_without_layout(self):
+        """Test a bus without layout keeps the default capacity"""
+        payload = {
+            'num_plate': 'NNNN11',
+            'driver': None
+        }
+
+        self.client.force_authenticate(self.user_admin)
+        response = self.client.post(BUSES_URL, payload, format='json')
+
+        seats = Seat.objects.filter(bus__id=response.data['id'])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(seats.count(), 10)
+
+    def test_bus_bulk_create_with_layout(self):
+        """Test a fleet of buses is created with seats in one request"""
+        payload = [
+            {
+                'num_plate': 'NNNN-'+str(index),
+                'driver': None,
+                'layout': self.layout_test.id
+            }
+            for index in range(5)
+        ]
+
+        self.client.force_authenticate(self.user_admin)
+        response = self.client.post(BUSES_BULK_URL, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Bus.objects.count(), 5)
+        self.assertEqual(Seat.objects.count(), 200)
+
+    def test_layout_update_regenerates_seats(self):
+        """Test seats of buses follow changes of their layout"""
+        self.client.force_authenticate(self.user_admin)
+        payload = [
+            {
+                'num_plate': 'NNNN-'+str(index),
+                'driver': None,
+                'layout': self.layout_test.id
+            }
+            for index in range(3)
+        ]
+        self.client.post(BUSES_BULK_URL, payload, format='json')
+
+        path = LAYOUTS_URL+str(self.layout_test.id)+'/'
+        payload = {'capacity': 44, 'rows': 11, 'premium_rows': 1}
+        response = self.client.patch(path, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Seat.objects.count(), 132)
+        premium = Seat.objects.filter(seat_class=Seat.PREMIUM)
+        self.assertEqual(premium.count(), 12)
+
+        payload = {'capacity': 20, 'rows': 5, 'premium_rows': 0}
+        response = self.client.patch(path, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Seat.objects.count(), 60)
+        self.assertFalse(premium.exists())
+
+    def test_bus_update_layout_regenerates_seats(self):
+        """Test seats of a bus follow a change of layout"""
+        bus = Bus.objects.create(
+            num_plate='NNNN11-test',
+            created_by=self.user_admin
+        )
+        payload = {'layout': self.layout_test.id}
+
+        self.client.force_authenticate(self.user_admin)
+        path = BUSES_URL+str(bus.id)+'/'
+        response = self.client.patch(path, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['seats_bus']), 40)
+
+
+class LayoutTicketsTest(TestCase):
+    """Test tickets of trips follow changes of the layout of their bus"""
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.user_passenger = User.objects.create(
+            username='usernamepassenger',
+            password='testpass',
+            user_type=2,
+        )
+        self.layout_test = SeatLayout.objects.create(
+            name='layout-test',
+            capacity=40,
+            rows=10,
+            premium_rows=2,
+            created_by=self.user_admin
+        )
+        route_test = Route.objects.create(
+            name='route-test',
+            origin='origin-test',
+            destination='destination-test',
+            created_by=self.user_admin
+        )
+        self.client.force_authenticate(self.user_admin)
+        response = self.client.post(BUSES_URL, {
+            'num_plate': 'NNNN11',
+            'driver': '',
+            'layout': self.layout_test.id,
+        })
+        self.bus_id = response.data['id']
+        self.route_id = route_test.id
+        self.trip_test = self.create_trip(timezone.now() + timedelta(days=1))
+        self.path = LAYOUTS_URL+str(self.layout_test.id)+'/'
+
+    def create_trip(self, begin_at):
+        """Create a trip of the bus through the API"""
+        response = self.client.post(TRIPS_URL, {
+            'name': 'trip-test',
+            'begin_at': begin_at.isoformat(),
+            'route': self.route_id,
+            'bus': self.bus_id,
+        })
+        return Trip.objects.get(id=response.data['id'])
+
+    def reserve(self, number):
+        """Reserve the ticket of a seat number for the passenger"""
+        ticket = Ticket.objects.get(seat__number=number)
+        with on_commit_callbacks():
+            reserve_ticket(ticket.id, self.user_passenger)
+
+    def assertTripSeats(self, total, reserved):
+        """Assert tickets, counters, rollup and seat map of the trip"""
+        self.trip_test.refresh_from_db()
+        stats = RouteStats.objects.get(
+            day=timezone.localtime(self.trip_test.begin_at).date()
+        )
+        seat_map = get_seat_map(self.trip_test.id)
+
+        self.assertEqual(self.trip_test.tickets_trip.count(), total)
+        self.assertEqual(self.trip_test.seats_total, total)
+        self.assertEqual(self.trip_test.seats_reserved, reserved)
+        self.assertEqual((stats.tickets, stats.reserved), (total, reserved))
+        self.assertEqual(seat_map['seats'], total)
+        self.assertEqual(seat_map['free'], total - reserved)
+        self.assertEqual(sync_trip_counters(dry_run=True), [])
+
+    def test_shrink_with_reserved_tickets(self):
+        """Test seats with reserved tickets can not be removed"""
+        self.reserve(1)
+        self.reserve(30)
+        get_seat_map(self.trip_test.id)
+
+        payload = {'capacity': 20, 'rows': 5, 'premium_rows': 0}
+        response = self.client.patch(self.path, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Seat.objects.count(), 40)
+        self.assertTripSeats(40, 2)
+
+    def test_shrink_and_grow_layout(self):
+        """Test free seats are removed and new seats get tickets"""
+        self.reserve(1)
+        get_seat_map(self.trip_test.id)
+
+        with on_commit_callbacks():
+            response = self.client.patch(self.path, {
+                'capacity': 20, 'rows': 5, 'premium_rows': 0,
+            })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTripSeats(20, 1)
+
+        with on_commit_callbacks():
+            response = self.client.patch(self.path, {
+                'capacity': 44, 'rows': 11, 'premium_rows': 1,
+            })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTripSeats(44, 1)
+        self.assertEqual(
+            Ticket.objects.filter(reserved=True).get().seat.number,
+            1
+        )
+
+    def test_grow_skips_departed_trips(self):
+        """Test trips already departed get no tickets of new seats"""
+        departed = self.create_trip(timezone.now() - timedelta(days=1))
+
+        with on_commit_callbacks():
+            response = self.client.patch(self.path, {
+                'capacity': 44, 'rows': 11, 'premium_rows': 1,
+            })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTripSeats(44, 0)
+
+        departed.refresh_from_db()
+        self.assertEqual(departed.tickets_trip.count(), 40)
+        self.assertEqual(departed.seats_total, 40)
+        stats = RouteStats.objects.get(
+            day=timezone.localtime(departed.begin_at).date()
+        )
+        self.assertEqual(stats.tickets, 40)
+
+    def test_rename_keeps_seats(self):
+        """Test changes not moving seats do not touch seats nor tickets"""
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.patch(self.path, {'name': 'renamed'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any(
+            '"main_seat"' in query['sql'] or
+            '"main_ticket"' in query['sql']
+            for query in captured
+        ))
+        self.assertTripSeats(40, 0)
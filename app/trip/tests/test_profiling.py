@@ -0,0 +1,180 @@
+from django.urls import reverse
+from django.test import TestCase, override_settings
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from app.profiling import Histogram, view_metrics
+from app.queries import capture_queries, normalize_sql
+from main.models import User, Route, Bus, Seat
+from trip.tests.helpers import clear_caches
+
+
+ROUTES_URL = reverse('trip:route-list')
+METRICS_URL = reverse('metrics')
+SEATS_URL = reverse('trip:seat-list')
+
+
+@override_settings(PROFILING_ENABLED=True)
+class ProfilingTest(TestCase):
+    """Test profiling of views when it is enabled"""
+
+    def setUp(self):
+        clear_caches()
+        view_metrics.clear()
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        Route.objects.create(
+            name='route-test',
+            origin='origin-test',
+            destination='destination-test',
+            created_by=self.user_admin
+        )
+
+    def test_server_timing_header(self):
+        """Test wall time, DB time and queries are sent by response"""
+        response = self.client.get(ROUTES_URL)
+
+        timing = response['Server-Timing']
+        self.assertIn('app;dur=', timing)
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="1 queries"', timing)
+
+    def test_metrics_by_view(self):
+        """Test requests are added to the histograms of their view"""
+        self.client.get(ROUTES_URL)
+        self.client.get(ROUTES_URL)
+
+        self.client.force_authenticate(self.user_admin)
+        response = self.client.get(METRICS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['enabled'])
+        metrics = response.data['views']['GET trip:route-list']
+        self.assertEqual(metrics['wall_ms']['count'], 2)
+        self.assertEqual(metrics['queries']['max'], 1)
+
+    def test_metrics_by_passenger(self):
+        """Test only admins read the metrics"""
+        user_passenger = User.objects.create(
+            username='usernamepassenger',
+            password='testpass',
+            user_type=2,
+        )
+        self.client.force_authenticate(user_passenger)
+        response = self.client.get(METRICS_URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_histogram_percentiles(self):
+        """Test percentiles are the bounds of the buckets"""
+        histogram = Histogram((1, 10, 100))
+        for value in (0.5, 5, 5, 50, 500):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.percentile(0.5), 10)
+        self.assertEqual(histogram.percentile(0.99), 500)
+        self.assertEqual(histogram.as_dict()['buckets']['+Inf'], 1)
+
+
+class DisabledProfilingTest(TestCase):
+    """Test profiling is left out of requests when it is disabled"""
+
+    def test_no_server_timing_header(self):
+        """Test responses have no Server-Timing header"""
+        view_metrics.clear()
+        response = APIClient().get(ROUTES_URL)
+
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(view_metrics.as_dict(), {})
+
+
+class QueryInspectorTest(TestCase):
+    """Test detection of duplicated and slow statements"""
+
+    def setUp(self):
+        clear_caches()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        for index in range(3):
+            Route.objects.create(
+                name='route-test-'+str(index),
+                origin='origin-test',
+                destination='destination-test',
+                created_by=self.user_admin
+            )
+
+    def test_normalize_sql(self):
+        """Test statements differing by their values are the same"""
+        self.assertEqual(
+            normalize_sql('SELECT * FROM t WHERE a = 1 AND b IN (%s, %s)'),
+            normalize_sql('SELECT *  FROM t WHERE a = 25 AND b IN (%s, %s)')
+        )
+        self.assertEqual(
+            normalize_sql("SELECT 'x''y', 1.5"),
+            'SELECT ?, ?'
+        )
+
+    def test_capture_duplicate_queries(self):
+        """Test a query by row is reported with its count"""
+        with capture_queries(duplicate_threshold=3) as capture:
+            for route in Route.objects.all():
+                route.created_by.username
+
+        self.assertEqual(len(capture.duplicates), 1)
+        self.assertEqual(capture.duplicates[0]['count'], 3)
+        self.assertIn('3x', capture.report())
+
+    def test_capture_slow_queries(self):
+        """Test statements over the latency threshold are reported"""
+        with capture_queries(slow_ms=0.000001) as capture:
+            list(Route.objects.all())
+
+        self.assertEqual(len(capture.slow), 1)
+        self.assertTrue(capture.has_problems)
+
+    @override_settings(QUERY_INSPECTOR_ENABLED=True)
+    def test_inspector_logs_offending_view(self):
+        """Test the middleware logs duplicated statements by view"""
+        client = APIClient()
+        client.force_authenticate(self.user_admin)
+        with override_settings(QUERY_DUPLICATE_THRESHOLD=1):
+            with self.assertLogs('app.queries', level='WARNING') as logs:
+                client.get(ROUTES_URL)
+
+        self.assertIn('GET trip:route-list', logs.output[0])
+
+    @override_settings(QUERY_INSPECTOR_ENABLED=True, STREAMING_CHUNK_SIZE=1)
+    def test_inspector_logs_streamed_response(self):
+        """Test statements of a streamed body are logged when it ends"""
+        bus = Bus.objects.create(
+            num_plate='NNNN11',
+            created_by=self.user_admin
+        )
+        for number in range(1, 4):
+            Seat.objects.create(
+                number=number,
+                created_by=self.user_admin,
+                bus=bus
+            )
+        client = APIClient()
+        client.force_authenticate(User.objects.create(
+            username='usernamepassenger',
+            password='testpass',
+            user_type=2,
+        ))
+        with override_settings(QUERY_DUPLICATE_THRESHOLD=3):
+            with self.assertLogs('app.queries', level='WARNING') as logs:
+                response = client.get(SEATS_URL, {'stream': 'true'})
+                self.assertEqual(logs.output, [])
+                b''.join(response.streaming_content)
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('GET trip:seat-list', logs.output[0])
+        self.assertIn('3x', logs.output[0])
@@ -0,0 +1,119 @@
+import msgpack
+
+from django.urls import reverse
+from django.test import TestCase
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from main.models import User, Route, Bus, Seat, Trip
+from trip.tests.helpers import clear_caches
+
+
+TRIPS_URL = reverse('trip:trip-list')
+ROUTES_URL = reverse('trip:route-list')
+SEATS_URL = reverse('trip:seat-list')
+PASSENGERS_URL = '/api/user/passengers/'
+MSGPACK = 'application/msgpack'
+
+
+class MessagePackTest(TestCase):
+    """Test responses and requests sent as MessagePack"""
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.user_passenger = User.objects.create(
+            username='usernamepassenger',
+            password='testpass',
+            user_type=2,
+        )
+        self.route_test = Route.objects.create(
+            name='route-test',
+            origin='origin-test',
+            destination='destination-test',
+            created_by=self.user_admin
+        )
+        self.bus_test = Bus.objects.create(
+            num_plate='NNNN11',
+            created_by=self.user_admin
+        )
+        Seat.objects.create(
+            number=1,
+            created_by=self.user_admin,
+            bus=self.bus_test
+        )
+        Trip.objects.create(
+            name='trip-test',
+            begin_at=timezone.now(),
+            created_by=self.user_admin,
+            route=self.route_test,
+            bus=self.bus_test
+        )
+
+    def test_trip_list_msgpack(self):
+        """Test Accept selects MessagePack with the same data as JSON"""
+        data = self.client.get(TRIPS_URL, HTTP_ACCEPT='application/json')
+        response = self.client.get(TRIPS_URL, HTTP_ACCEPT=MSGPACK)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], MSGPACK)
+        self.assertEqual(msgpack.unpackb(response.content), data.json())
+        self.assertNotEqual(response['ETag'], data['ETag'])
+
+        response = self.client.get(
+            TRIPS_URL,
+            HTTP_ACCEPT=MSGPACK,
+            HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_format_override(self):
+        """Test ?format=msgpack selects MessagePack for seats and users"""
+        self.client.force_authenticate(self.user_passenger)
+
+        response = self.client.get(SEATS_URL, {'format': 'msgpack'})
+        seats = msgpack.unpackb(response.content)['results']
+        self.assertEqual(seats[0]['number'], 1)
+
+        path = PASSENGERS_URL + str(self.user_passenger.id) + '/'
+        response = self.client.get(path, {'format': 'msgpack'})
+        user = msgpack.unpackb(response.content)
+        self.assertEqual(user['username'], 'usernamepassenger')
+
+    def test_create_msgpack(self):
+        """Test bodies sent as MessagePack are parsed"""
+        self.client.force_authenticate(self.user_admin)
+        response = self.client.post(
+            TRIPS_URL,
+            msgpack.packb({
+                'name': 'trip-msgpack',
+                'begin_at': '2021-01-01T10:00:00',
+                'route': self.route_test.id,
+                'bus': self.bus_test.id,
+            }),
+            content_type=MSGPACK,
+            HTTP_ACCEPT=MSGPACK
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        trip = msgpack.unpackb(response.content)
+        self.assertEqual(trip['name'], 'trip-msgpack')
+        self.assertEqual(len(trip['tickets_trip']), 1)
+
+    def test_invalid_msgpack(self):
+        """Test invalid MessagePack bodies are rejected"""
+        self.client.force_authenticate(self.user_admin)
+        response = self.client.post(
+            ROUTES_URL,
+            b'\xc1',
+            content_type=MSGPACK
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
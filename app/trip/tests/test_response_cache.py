@@ -0,0 +1,284 @@
+from datetime import timedelta
+
+from django.urls import reverse
+from django.test import TestCase
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from main.models import User, Route, Bus, Seat, Trip, Ticket
+from trip.reservations import release_expired_holds
+from trip.response_cache import generations_cache, response_cache
+from trip.tests.helpers import clear_caches, on_commit_callbacks
+
+
+ROUTES_URL = reverse('trip:route-list')
+BUSES_URL = reverse('trip:bus-list')
+TRIPS_URL = reverse('trip:trip-list')
+TICKETS_URL = reverse('trip:ticket-list')
+SEATS_URL = reverse('trip:seat-list')
+
+
+class ResponseCacheTest(TestCase):
+    """Test cached responses of route and trip reads"""
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.user_passenger = User.objects.create(
+            username='usernamepassenger',
+            password='testpass',
+            user_type=2,
+        )
+        self.route_test = Route.objects.create(
+            name='route-test',
+            origin='origin-test',
+            destination='destination-test',
+            created_by=self.user_admin
+        )
+        self.bus_test = Bus.objects.create(
+            num_plate='NNNN11',
+            created_by=self.user_admin
+        )
+        self.trip_test = Trip.objects.create(
+            name='trip-test',
+            begin_at=timezone.now(),
+            created_by=self.user_admin,
+            route=self.route_test,
+            bus=self.bus_test,
+            seats_total=1
+        )
+        self.ticket_test = Ticket.objects.create(
+            created_by=self.user_admin,
+            trip=self.trip_test,
+            seat=Seat.objects.create(
+                number=1,
+                created_by=self.user_admin,
+                bus=self.bus_test
+            )
+        )
+
+    def test_cached_reads_skip_database(self):
+        """Test repeated list and retrieve run no queries"""
+        trip_path = TRIPS_URL+str(self.trip_test.id)+'/'
+        for path in (ROUTES_URL, TRIPS_URL, trip_path):
+            first = self.client.get(path)
+            with self.assertNumQueries(0):
+                second = self.client.get(path)
+            self.assertEqual(first.data, second.data)
+
+    def test_route_write_invalidates_routes_and_trips(self):
+        """Test route writes invalidate cached routes and trips"""
+        self.client.get(ROUTES_URL)
+        self.client.get(TRIPS_URL)
+
+        self.client.force_authenticate(self.user_admin)
+        self.client.post(ROUTES_URL, {
+            'name': 'route-new',
+            'origin': 'origin-new',
+            'destination': 'destination-new',
+        })
+        response = self.client.get(ROUTES_URL)
+        self.assertEqual(len(response.data['results']), 2)
+
+        self.client.delete(ROUTES_URL+str(self.route_test.id)+'/')
+        response = self.client.get(TRIPS_URL)
+        self.assertEqual(response.data['results'], [])
+
+    def test_bus_destroy_invalidates_trips(self):
+        """Test deleting a bus invalidates its cascaded trips"""
+        self.client.get(TRIPS_URL)
+
+        self.client.force_authenticate(self.user_admin)
+        response = self.client.delete(BUSES_URL+str(self.bus_test.id)+'/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        response = self.client.get(TRIPS_URL)
+        self.assertEqual(response.data['results'], [])
+
+    def test_reservation_invalidates_trips(self):
+        """Test a reservation invalidates the reserved seats of trips"""
+        trip_path = TRIPS_URL+str(self.trip_test.id)+'/'
+        self.client.get(trip_path)
+
+        self.client.force_authenticate(self.user_passenger)
+        with on_commit_callbacks():
+            self.client.post(
+                TICKETS_URL+str(self.ticket_test.id)+'/reserve/'
+            )
+
+        response = self.client.get(trip_path)
+        self.assertEqual(response.data['seats_reserved'], 1)
+
+
+class ConditionalRequestTest(TestCase):
+    """Test ETag and Last-Modified of route, trip and seat reads"""
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.user_passenger = User.objects.create(
+            username='usernamepassenger',
+            password='testpass',
+            user_type=2,
+        )
+        route_test = Route.objects.create(
+            name='route-test',
+            origin='origin-test',
+            destination='destination-test',
+            created_by=self.user_admin
+        )
+        self.bus_test = Bus.objects.create(
+            num_plate='NNNN11',
+            created_by=self.user_admin
+        )
+        seat_test = Seat.objects.create(
+            number=1,
+            created_by=self.user_admin,
+            bus=self.bus_test
+        )
+        self.trips = []
+        for index in range(2):
+            trip = Trip.objects.create(
+                name='trip-test-'+str(index),
+                begin_at=timezone.now(),
+                created_by=self.user_admin,
+                route=route_test,
+                bus=self.bus_test,
+                seats_total=1
+            )
+            Ticket.objects.create(
+                created_by=self.user_admin,
+                trip=trip,
+                seat=seat_test
+            )
+            self.trips.append(TRIPS_URL+str(trip.id)+'/')
+
+    def test_if_none_match_not_modified(self):
+        """Test a matching ETag gets a 304 without queries"""
+        response = self.client.get(self.trips[0])
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.trips[0], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        response = self.client.get(ROUTES_URL)
+        response = self.client.get(
+            ROUTES_URL,
+            HTTP_IF_NONE_MATCH='"other", W/' + response['ETag']
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_not_repeated_after_cache_lost(self):
+        """Test old ETags do not match after the cache is cleared or culled"""
+        etag = self.client.get(self.trips[0])['ETag']
+        clear_caches()
+        response = self.client.get(self.trips[0], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        etag = response['ETag']
+        trip_id = self.trips[0].rstrip('/').rsplit('/', 1)[1]
+        generations_cache().delete('generation:trip:' + trip_id)
+        response = self.client.get(self.trips[0], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_etag_kept_when_responses_culled(self):
+        """Test losing cached responses keeps the generations and ETags"""
+        etag = self.client.get(self.trips[0])['ETag']
+        response_cache().clear()
+        response = self.client.get(self.trips[0], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_if_modified_since_not_modified(self):
+        """Test a date not older than the last change gets a 304"""
+        response = self.client.get(TRIPS_URL)
+        response = self.client.get(
+            TRIPS_URL,
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.force_authenticate(self.user_admin)
+        self.client.patch(self.trips[0], {'name': 'trip-changed'})
+        response = self.client.get(
+            TRIPS_URL,
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_reservation_changes_only_its_trip(self):
+        """Test a reservation changes the ETag of its trip and the list"""
+        etags = [self.client.get(path)['ETag'] for path in self.trips]
+        list_etag = self.client.get(TRIPS_URL)['ETag']
+
+        self.client.force_authenticate(self.user_passenger)
+        ticket = Ticket.objects.filter(trip__name='trip-test-0').get()
+        with on_commit_callbacks():
+            self.client.post(TICKETS_URL+str(ticket.id)+'/reserve/')
+        self.client.force_authenticate(None)
+
+        changed = self.client.get(self.trips[0], HTTP_IF_NONE_MATCH=etags[0])
+        same = self.client.get(self.trips[1], HTTP_IF_NONE_MATCH=etags[1])
+        listed = self.client.get(TRIPS_URL, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertEqual(changed.data['seats_reserved'], 1)
+        self.assertEqual(same.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(listed.status_code, status.HTTP_200_OK)
+
+    def test_holds_change_their_trip(self):
+        """Test holding a ticket and expiring the hold change the ETag"""
+        path = self.trips[0] + '?expand=tickets_trip'
+        self.client.force_authenticate(self.user_passenger)
+        etag = self.client.get(path)['ETag']
+
+        ticket = Ticket.objects.filter(trip__name='trip-test-0').get()
+        with on_commit_callbacks():
+            self.client.post(TICKETS_URL+str(ticket.id)+'/hold/')
+
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        hold = response.data['tickets_trip'][0]['hold_expires_at']
+        self.assertIsNotNone(hold)
+        etag = response['ETag']
+
+        Ticket.objects.filter(id=ticket.id).update(
+            hold_expires_at=timezone.now() - timedelta(minutes=1)
+        )
+        with on_commit_callbacks():
+            release_expired_holds()
+
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        hold = response.data['tickets_trip'][0]['hold_expires_at']
+        self.assertIsNone(hold)
+
+    def test_bus_write_changes_seats_and_trips(self):
+        """Test bus writes change the ETags of seats and of every trip"""
+        self.client.force_authenticate(self.user_passenger)
+        seats_etag = self.client.get(SEATS_URL)['ETag']
+        trip_etag = self.client.get(self.trips[1])['ETag']
+
+        self.client.force_authenticate(self.user_admin)
+        self.client.patch(BUSES_URL+str(self.bus_test.id)+'/', {
+            'num_plate': 'NNNN22',
+        })
+
+        self.client.force_authenticate(self.user_passenger)
+        seats = self.client.get(SEATS_URL, HTTP_IF_NONE_MATCH=seats_etag)
+        trip = self.client.get(self.trips[1], HTTP_IF_NONE_MATCH=trip_etag)
+        self.assertEqual(seats.status_code, status.HTTP_200_OK)
+        self.assertEqual(trip.status_code, status.HTTP_200_OK)
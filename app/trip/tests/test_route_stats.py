@@ -0,0 +1,127 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework.test import APIClient
+
+from main.models import User, Route, Bus, Seat, Trip, Ticket, RouteStats
+from trip.tests.helpers import on_commit_callbacks
+
+
+TRIPS_URL = reverse('trip:trip-list')
+TICKETS_URL = reverse('trip:ticket-list')
+
+
+class RouteStatsTest(TestCase):
+    """Test the route rollup follows trips and reservations"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.user_passenger = User.objects.create(
+            username='usernamepassenger',
+            password='testpass',
+            user_type=2,
+        )
+        self.route_test = Route.objects.create(
+            name='route-test',
+            origin='origin-test',
+            destination='destination-test',
+            created_by=self.user_admin
+        )
+        self.bus_test = Bus.objects.create(
+            num_plate='NNNN11',
+            created_by=self.user_admin
+        )
+        Seat.objects.bulk_create([
+            Seat(number=index, created_by=self.user_admin, bus=self.bus_test)
+            for index in range(1, 5)
+        ])
+
+    def create_trip(self, begin_at='2021-01-01T10:00:00'):
+        """Create a trip with its tickets as admin"""
+        self.client.force_authenticate(self.user_admin)
+        response = self.client.post(TRIPS_URL, {
+            'name': 'trip-test',
+            'begin_at': begin_at,
+            'route': self.route_test.id,
+            'bus': self.bus_test.id,
+        })
+        return Trip.objects.get(id=response.data['id'])
+
+    def stats(self):
+        """Rows of the rollup as tuples"""
+        return list(RouteStats.objects.order_by('day').values_list(
+            'day', 'trips', 'tickets', 'reserved'
+        ))
+
+    def test_route_stats_trip_created(self):
+        """Test trips created are added to the rollup of their day"""
+        self.create_trip()
+        self.create_trip('2021-01-01T18:00:00')
+        self.create_trip('2021-01-02T10:00:00')
+
+        stats = self.stats()
+        self.assertEqual(len(stats), 2)
+        self.assertEqual(stats[0][1:], (2, 8, 0))
+        self.assertEqual(stats[1][1:], (1, 4, 0))
+
+    def test_route_stats_reservations(self):
+        """Test reserving and releasing tickets move the rollup"""
+        trip = self.create_trip()
+        ticket = Ticket.objects.filter(trip=trip).first()
+        path = TICKETS_URL+str(ticket.id)+'/'
+
+        self.client.force_authenticate(self.user_passenger)
+        with on_commit_callbacks():
+            self.client.post(path+'reserve/')
+            self.assertEqual(self.stats()[0][1:], (1, 4, 0))
+        self.assertEqual(self.stats()[0][1:], (1, 4, 1))
+
+        with on_commit_callbacks():
+            self.client.post(path+'release/')
+        self.assertEqual(self.stats()[0][1:], (1, 4, 0))
+
+    def test_route_stats_trip_moved_and_deleted(self):
+        """Test changing the day of a trip or deleting it moves the rollup"""
+        trip = self.create_trip()
+        path = TRIPS_URL+str(trip.id)+'/'
+
+        self.client.patch(path, {'begin_at': '2021-01-05T10:00:00'})
+        stats = self.stats()
+        self.assertEqual(stats[0][1:], (0, 0, 0))
+        self.assertEqual(stats[1][1:], (1, 4, 0))
+
+        self.client.delete(path)
+        self.assertEqual(self.stats()[1][1:], (0, 0, 0))
+
+    def test_rebuild_route_stats_command(self):
+        """Test the rebuild matches the rollup kept incrementally"""
+        self.create_trip()
+        self.create_trip('2021-01-02T10:00:00')
+        ticket = Ticket.objects.first()
+        self.client.force_authenticate(self.user_passenger)
+        with on_commit_callbacks():
+            self.client.post(TICKETS_URL+str(ticket.id)+'/reserve/')
+        incremental = self.stats()
+
+        RouteStats.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_route_stats', '--recount', stdout=out)
+
+        self.assertIn('Rebuilt 2 route stats rows', out.getvalue())
+        self.assertEqual(self.stats(), incremental)
+
+    def test_route_stats_bus_deleted(self):
+        """Test deleting a bus removes its rows without creating them again"""
+        self.create_trip()
+        self.client.delete(reverse('trip:bus-list')+str(self.bus_test.id)+'/')
+
+        self.assertFalse(Trip.objects.exists())
+        self.assertFalse(RouteStats.objects.exists())
@@ -1,20 +1,25 @@
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils import timezone
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from main.models import User, Route
+from main.models import User, Route, Bus, Seat, Trip, Ticket
 from trip.serializers import RouteSerializer
+from trip.route_stats import trips_stats_changed
+from trip.tests.helpers import clear_caches
 
 
 ROUTES_URL = reverse('trip:route-list')
+AVERAGE_URL = reverse('trip:route-average-passengers')
 
 
 class PublicRouteTest(TestCase):
     """Tests public available routes requests"""
 
     def setUp(self):
+        clear_caches()
         self.client = APIClient()
         self.user_admin = User.objects.create(
             username='usernameadmin',
@@ -29,7 +34,7 @@ class PublicRouteTest(TestCase):
         routes = Route.objects.all()
         serializer = RouteSerializer(routes, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data['results'], serializer.data)
 
     def test_login_not_required_route_detail(self):
         """Test login is not required to access detail route"""
@@ -76,6 +81,7 @@ class PrivateRouteTest(TestCase):
     """Test available route request by logged user"""
 
     def setUp(self):
+        clear_caches()
         self.client = APIClient()
         self.user_admin = User.objects.create(
             username='usernameadmin',
@@ -114,8 +120,8 @@ class PrivateRouteTest(TestCase):
         routes = Route.objects.all()
         serializer = RouteSerializer(routes, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data['results'], serializer.data)
+        self.assertEqual(len(response.data['results']), 2)
 
     def test_route_list_by_driver(self):
         """Test logged driver access to list route"""
@@ -138,8 +144,8 @@ class PrivateRouteTest(TestCase):
         routes = Route.objects.all()
         serializer = RouteSerializer(routes, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data['results'], serializer.data)
+        self.assertEqual(len(response.data['results']), 2)
 
     def test_route_list_by_admin(self):
         """Test logged admin access to list route"""
@@ -162,8 +168,8 @@ class PrivateRouteTest(TestCase):
         routes = Route.objects.all()
         serializer = RouteSerializer(routes, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data['results'], serializer.data)
+        self.assertEqual(len(response.data['results']), 2)
 
     def test_route_detail_by_passenger(self):
         """Test logged passenger access to detail route"""
@@ -351,3 +357,137 @@ class PrivateRouteTest(TestCase):
         self.client.force_authenticate(self.user_admin)
         response = self.client.delete(ROUTES_URL+'1/')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AveragePassengersRouteTest(TestCase):
+    """Test average passengers by route requested by admin"""
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.bus_test = Bus.objects.create(
+            num_plate='NNNN11-test',
+            created_by=self.user_admin
+        )
+        self.seat_test = Seat.objects.create(
+            number=1,
+            created_by=self.user_admin,
+            bus=self.bus_test
+        )
+
+    def create_route_with_trips(self, name, trips, reserved):
+        """Create a route with trips and reserved tickets for each trip"""
+        route = Route.objects.create(
+            name=name,
+            origin='origin-test',
+            destination='destination-test',
+            created_by=self.user_admin
+        )
+        for index in range(trips):
+            trip = Trip.objects.create(
+                name=name+'-trip-'+str(index),
+                begin_at=timezone.now(),
+                created_by=self.user_admin,
+                route=route,
+                bus=self.bus_test,
+                seats_total=reserved + 1,
+                seats_reserved=reserved
+            )
+            trips_stats_changed([trip])
+            for ticket_index in range(reserved + 1):
+                Ticket.objects.create(
+                    created_by=self.user_admin,
+                    trip=trip,
+                    seat=self.seat_test,
+                    reserved=ticket_index < reserved
+                )
+        return route
+
+    def test_average_passengers_by_route(self):
+        """Test average only counts reserved tickets of the same route"""
+        route_test_1 = self.create_route_with_trips('route-test-1', 2, 3)
+        route_test_2 = self.create_route_with_trips('route-test-2', 1, 1)
+        route_test_3 = self.create_route_with_trips('route-test-3', 0, 0)
+
+        self.client.force_authenticate(self.user_admin)
+        response = self.client.get(AVERAGE_URL)
+
+        averages = {route['id']: route['average'] for route in response.data}
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(averages[route_test_1.id], 3)
+        self.assertEqual(averages[route_test_2.id], 1)
+        self.assertEqual(averages[route_test_3.id], 0)
+
+    def test_average_passengers_constant_queries(self):
+        """Test average queries do not grow with the number of routes"""
+        self.create_route_with_trips('route-test-1', 1, 1)
+        self.client.force_authenticate(self.user_admin)
+        with self.assertNumQueries(1):
+            self.client.get(AVERAGE_URL)
+
+        for index in range(10):
+            self.create_route_with_trips('route-test-'+str(index), 2, 1)
+        with self.assertNumQueries(1):
+            response = self.client.get(AVERAGE_URL)
+        self.assertEqual(len(response.data), 11)
+
+    def test_average_passengers_by_passenger(self):
+        """Test logged passenger can not access average passengers"""
+        user_passenger = User.objects.create(
+            username='usernamepassenger',
+            password='testpass',
+            user_type=2,
+        )
+        self.client.force_authenticate(user_passenger)
+        response = self.client.get(AVERAGE_URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class PaginationRouteTest(TestCase):
+    """Test cursor pagination of route list"""
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        Route.objects.bulk_create([
+            Route(
+                name='route-test-'+str(index),
+                origin='origin-test',
+                destination='destination-test',
+                created_by=user_admin
+            )
+            for index in range(7)
+        ])
+
+    def test_route_list_pages(self):
+        """Test every route is listed once following the cursors"""
+        names = []
+        url = ROUTES_URL+'?page_size=3'
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 3)
+            names += [route['name'] for route in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(
+            names,
+            ['route-test-'+str(index) for index in range(7)]
+        )
+
+    @override_settings(PAGINATION_MAX_PAGE_SIZE=5)
+    def test_route_list_max_page_size(self):
+        """Test page size is limited by the max page size"""
+        response = self.client.get(ROUTES_URL+'?page_size=1000')
+        self.assertEqual(len(response.data['results']), 5)
@@ -0,0 +1,154 @@
+import base64
+from datetime import timedelta
+
+from django.urls import reverse
+from django.test import TestCase
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from main.models import User, Route, Bus, Seat, Trip, Ticket
+from trip.reservations import release_expired_holds, reserve_ticket
+from trip.tests.helpers import clear_caches, on_commit_callbacks
+
+
+TRIPS_URL = reverse('trip:trip-list')
+TICKETS_URL = reverse('trip:ticket-list')
+
+
+class SeatMapTripTest(TestCase):
+    """Test seat availability map of trips"""
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.user_passenger = User.objects.create(
+            username='usernamepassenger',
+            password='testpass',
+            user_type=2,
+        )
+        route_test = Route.objects.create(
+            name='route-test',
+            origin='origin-test',
+            destination='destination-test',
+            created_by=self.user_admin
+        )
+        bus_test = Bus.objects.create(
+            num_plate='NNNN11',
+            created_by=self.user_admin
+        )
+        self.trip_test = Trip.objects.create(
+            name='trip-test',
+            begin_at=timezone.now(),
+            created_by=self.user_admin,
+            route=route_test,
+            bus=bus_test
+        )
+        for index in range(1, 11):
+            seat = Seat.objects.create(
+                number=index,
+                created_by=self.user_admin,
+                bus=bus_test
+            )
+            Ticket.objects.create(
+                created_by=self.user_admin,
+                trip=self.trip_test,
+                seat=seat,
+                passenger=self.user_admin if index in (3, 4, 9) else None,
+                reserved=index in (3, 4, 9)
+            )
+        self.path = TRIPS_URL+str(self.trip_test.id)+'/seat-map/'
+
+    def ticket_path(self, number, action):
+        """Path of an action over the ticket of a seat number"""
+        ticket = Ticket.objects.get(seat__number=number)
+        return TICKETS_URL+str(ticket.id)+'/'+action+'/'
+
+    def test_seat_map_without_login(self):
+        """Test seat map is available without login"""
+        response = self.client.get(self.path)
+
+        bitmap = base64.b64decode(response.data['bitmap'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['seats'], 10)
+        self.assertEqual(response.data['free'], 7)
+        self.assertEqual(bitmap, bytes([0b00001100, 0b00000001]))
+        self.assertEqual(
+            response.data['free_ranges'],
+            [[1, 2], [5, 8], [10, 10]]
+        )
+
+    def test_seat_map_cached(self):
+        """Test seat map is read from the cache after the first request"""
+        with self.assertNumQueries(1):
+            self.client.get(self.path)
+        with self.assertNumQueries(0):
+            self.client.get(self.path)
+
+    def test_seat_map_updated_on_reserve_and_release(self):
+        """Test seat map changes when a ticket is reserved or released"""
+        self.client.get(self.path)
+        self.client.force_authenticate(self.user_passenger)
+
+        with on_commit_callbacks():
+            self.client.post(self.ticket_path(1, 'reserve'))
+        response = self.client.get(self.path)
+        self.assertEqual(response.data['free'], 6)
+        self.assertEqual(response.data['free_ranges'][0], [2, 2])
+
+        with on_commit_callbacks():
+            self.client.post(self.ticket_path(1, 'release'))
+        response = self.client.get(self.path)
+        self.assertEqual(response.data['free'], 7)
+
+    def test_seat_map_updated_on_expired_holds(self):
+        """Test seat map changes when expired holds are released"""
+        self.client.force_authenticate(self.user_passenger)
+        self.client.post(self.ticket_path(1, 'hold'))
+        self.assertEqual(self.client.get(self.path).data['free'], 6)
+
+        Ticket.objects.filter(seat__number=1).update(
+            hold_expires_at=timezone.now() - timedelta(minutes=1)
+        )
+        with on_commit_callbacks():
+            release_expired_holds()
+        self.assertEqual(self.client.get(self.path).data['free'], 7)
+
+    def test_seat_map_updated_on_batch_reserve(self):
+        """Test seat map changes when seats are reserved in batch"""
+        self.client.get(self.path)
+        self.client.force_authenticate(self.user_passenger)
+        with on_commit_callbacks():
+            self.client.post(
+                TICKETS_URL+'reserve/',
+                {'trip': self.trip_test.id, 'seats': [1, 2]},
+                format='json'
+            )
+
+        response = self.client.get(self.path)
+        self.assertEqual(response.data['free_ranges'][0], [5, 8])
+
+    def test_seat_map_invalidated_on_commit(self):
+        """Test seat map is kept until the reservation is committed"""
+        self.client.get(self.path)
+        ticket = Ticket.objects.get(seat__number=1)
+
+        with on_commit_callbacks():
+            reserve_ticket(ticket.id, self.user_passenger)
+            with self.assertNumQueries(0):
+                response = self.client.get(self.path)
+            self.assertEqual(response.data['free'], 7)
+
+        response = self.client.get(self.path)
+        self.assertEqual(response.data['free'], 6)
+
+    def test_invalid_seat_map(self):
+        """Test seat map of a missing trip"""
+        response = self.client.get(TRIPS_URL+'0/seat-map/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
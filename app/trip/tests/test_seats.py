@@ -97,8 +97,8 @@ class PrivateSeatTest(TestCase):
         seats = Seat.objects.all()
         serializer = SeatSerializer(seats, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data['results'], serializer.data)
+        self.assertEqual(len(response.data['results']), 2)
 
     def test_seat_list_by_driver(self):
         """Test logged driver access to list seat"""
@@ -0,0 +1,122 @@
+import json
+
+from django.urls import reverse
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from app.streaming import stream_json
+from main.models import User, Route, Bus, Seat, Trip, Ticket
+from trip.tests.helpers import clear_caches
+
+
+TRIPS_URL = reverse('trip:trip-list')
+TICKETS_URL = reverse('trip:ticket-list')
+
+
+@override_settings(STREAMING_CHUNK_SIZE=3)
+class StreamingListTest(TestCase):
+    """Test lists sent as streamed JSON arrays"""
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.user_passenger = User.objects.create(
+            username='usernamepassenger',
+            password='testpass',
+            user_type=2,
+        )
+        route_test = Route.objects.create(
+            name='route-test',
+            origin='origin-test',
+            destination='destination-test',
+            created_by=self.user_admin
+        )
+        bus_test = Bus.objects.create(
+            num_plate='NNNN11',
+            created_by=self.user_admin
+        )
+        seats = Seat.objects.bulk_create([
+            Seat(number=index, created_by=self.user_admin, bus=bus_test)
+            for index in range(1, 8)
+        ])
+        trip = Trip.objects.create(
+            name='trip-test',
+            begin_at=timezone.now(),
+            created_by=self.user_admin,
+            route=route_test,
+            bus=bus_test,
+            seats_total=len(seats)
+        )
+        Ticket.objects.bulk_create([
+            Ticket(created_by=self.user_admin, trip=trip, seat=seat)
+            for seat in Seat.objects.order_by('id')
+        ])
+
+    def get_streamed(self, path, params, queries):
+        """Send a streamed request reading its content in queries"""
+        with self.assertNumQueries(queries):
+            response = self.client.get(path, params)
+            self.assertTrue(response.streaming)
+            content = b''.join(response.streaming_content)
+        return json.loads(content)
+
+    def test_stream_tickets(self):
+        """Test every ticket is sent reading a chunk by query"""
+        self.client.force_authenticate(self.user_passenger)
+        data = self.get_streamed(TICKETS_URL, {'stream': 'true'}, 3)
+
+        self.assertEqual(len(data), 7)
+        self.assertEqual(
+            [ticket['id'] for ticket in data],
+            list(Ticket.objects.order_by('id').values_list('id', flat=True))
+        )
+
+    def test_stream_with_fieldset(self):
+        """Test streamed lists load only the relations sent"""
+        self.client.force_authenticate(self.user_admin)
+        Trip.objects.bulk_create([
+            Trip(
+                name='trip-test-{}'.format(index),
+                begin_at=timezone.now(),
+                created_by=self.user_admin,
+                route=Route.objects.get(),
+                bus=Bus.objects.get()
+            )
+            for index in range(3)
+        ])
+
+        data = self.get_streamed(TRIPS_URL, {'stream': '1'}, 4)
+        self.assertEqual(len(data), 4)
+        self.assertEqual(len(data[0]['tickets_trip']), 7)
+
+        params = {'stream': '1', 'fields': 'id,name'}
+        data = self.get_streamed(TRIPS_URL, params, 2)
+        self.assertEqual(set(data[0]), {'id', 'name'})
+
+    def test_stream_invalid_fields(self):
+        """Test invalid fields are rejected before streaming"""
+        self.client.force_authenticate(self.user_passenger)
+        response = self.client.get(TICKETS_URL, {
+            'stream': 'true',
+            'fields': 'other',
+        })
+
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stream_json_pieces(self):
+        """Test arrays are valid whatever the number of rows"""
+        for size in (0, 1, 2, 3, 7):
+            rows = [{'id': index, 'name': 'ñ'} for index in range(size)]
+            pieces = list(stream_json(iter(rows), chunk_size=2))
+
+            self.assertEqual(json.loads(b''.join(pieces)), rows)
+            self.assertEqual(len(pieces), size // 2 + 1)
@@ -1,5 +1,14 @@
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+
+from django.db import OperationalError, connection
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from rest_framework import status
@@ -7,9 +16,11 @@ from rest_framework.test import APIClient
 
 from main.models import Trip, User, Route, Bus, Seat, Ticket
 from trip.serializers import TicketSerializer
+from trip.reservations import reserve_ticket, release_expired_holds
 
 
 TICKETS_URL = reverse('trip:ticket-list')
+RESERVE_URL = reverse('trip:ticket-reserve-batch')
 
 
 class PublicTicketTest(TestCase):
@@ -119,8 +130,8 @@ class PrivateTicketTest(TestCase):
         tickets = Ticket.objects.all()
         serializer = TicketSerializer(tickets, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data['results'], serializer.data)
+        self.assertEqual(len(response.data['results']), 2)
 
     def test_ticket_list_by_driver(self):
         """Test logged driver access to list ticket"""
@@ -229,6 +240,26 @@ class PrivateTicketTest(TestCase):
         response = self.client.put(path, payload)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_ticket_update_without_reserve(self):
+        """Test updates not reserving the ticket point to release"""
+        ticket_test_1 = Ticket.objects.create(
+            created_by=self.user_admin,
+            trip=self.trip_test,
+            seat=self.seat_test
+        )
+
+        self.client.force_authenticate(self.user_passenger)
+        path = TICKETS_URL+str(ticket_test_1.id)+'/'
+        for payload in ({'reserved': False}, {}):
+            response = self.client.patch(path, payload)
+            self.assertEqual(
+                response.status_code,
+                status.HTTP_400_BAD_REQUEST
+            )
+            self.assertIn('release', response.data['reserved'])
+        ticket_test_1.refresh_from_db()
+        self.assertIsNone(ticket_test_1.passenger)
+
     def test_ticket_update_by_driver(self):
         """Test logged driver access to update ticket"""
         payload = {
@@ -266,3 +297,564 @@ class PrivateTicketTest(TestCase):
         self.client.force_authenticate(self.user_admin)
         response = self.client.delete(TICKETS_URL+'1/')
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ReserveTicketTest(TestCase):
+    """Test reservation of tickets by logged passengers"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.user_passenger = User.objects.create(
+            username='usernamepassenger',
+            password='testpass',
+            user_type=2,
+        )
+        self.user_passenger_2 = User.objects.create(
+            username='usernamepassenger2',
+            password='testpass',
+            user_type=2,
+        )
+        route_test = Route.objects.create(
+            name='route-test',
+            origin='origin-test',
+            destination='destination-test',
+            created_by=self.user_admin
+        )
+        bus_test = Bus.objects.create(
+            num_plate='NNNN11',
+            created_by=self.user_admin
+        )
+        trip_test = Trip.objects.create(
+            name='trip-test',
+            begin_at=timezone.now(),
+            created_by=self.user_admin,
+            route=route_test,
+            bus=bus_test
+        )
+        seat_test = Seat.objects.create(
+            number=1,
+            created_by=self.user_admin,
+            bus=bus_test
+        )
+        self.ticket_test = Ticket.objects.create(
+            created_by=self.user_admin,
+            trip=trip_test,
+            seat=seat_test
+        )
+        self.path = TICKETS_URL+str(self.ticket_test.id)+'/reserve/'
+
+    def test_ticket_reserve_by_passenger(self):
+        """Test logged passenger reserves a free ticket"""
+        self.client.force_authenticate(self.user_passenger)
+        response = self.client.post(self.path)
+
+        self.ticket_test.refresh_from_db()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['reserved'])
+        self.assertEqual(self.ticket_test.passenger, self.user_passenger)
+
+    def test_ticket_reserve_conflict(self):
+        """Test a second passenger gets a conflict reserving the ticket"""
+        self.client.force_authenticate(self.user_passenger)
+        self.client.post(self.path)
+        self.client.force_authenticate(self.user_passenger_2)
+        response = self.client.post(self.path)
+
+        self.ticket_test.refresh_from_db()
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.ticket_test.passenger, self.user_passenger)
+
+    def test_ticket_update_conflict(self):
+        """Test a ticket taken after the permission check conflicts"""
+        def reserve_first(ticket_id, user):
+            reserve_ticket(ticket_id, self.user_passenger)
+            return reserve_ticket(ticket_id, user)
+
+        path = TICKETS_URL+str(self.ticket_test.id)+'/'
+        self.client.force_authenticate(self.user_passenger_2)
+        with patch('trip.views.reserve_ticket', side_effect=reserve_first):
+            response = self.client.patch(path, {'reserved': True})
+
+        self.ticket_test.refresh_from_db()
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.ticket_test.passenger, self.user_passenger)
+
+    def test_invalid_ticket_reserve(self):
+        """Test reservation of a missing ticket"""
+        self.client.force_authenticate(self.user_passenger)
+        response = self.client.post(TICKETS_URL+'0/reserve/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_ticket_reserve_by_driver(self):
+        """Test logged driver access to reserve ticket"""
+        user_driver = User.objects.create(
+            username='usernamedriver',
+            password='testpass',
+            user_type=3,
+        )
+        self.client.force_authenticate(user_driver)
+        response = self.client.post(self.path)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class HoldTicketTest(TestCase):
+    """Test holds of tickets during checkout"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.user_passenger = User.objects.create(
+            username='usernamepassenger',
+            password='testpass',
+            user_type=2,
+        )
+        self.user_passenger_2 = User.objects.create(
+            username='usernamepassenger2',
+            password='testpass',
+            user_type=2,
+        )
+        route_test = Route.objects.create(
+            name='route-test',
+            origin='origin-test',
+            destination='destination-test',
+            created_by=self.user_admin
+        )
+        bus_test = Bus.objects.create(
+            num_plate='NNNN11',
+            created_by=self.user_admin
+        )
+        self.trip_test = Trip.objects.create(
+            name='trip-test',
+            begin_at=timezone.now(),
+            created_by=self.user_admin,
+            route=route_test,
+            bus=bus_test
+        )
+        seat_test = Seat.objects.create(
+            number=1,
+            created_by=self.user_admin,
+            bus=bus_test
+        )
+        self.ticket_test = Ticket.objects.create(
+            created_by=self.user_admin,
+            trip=self.trip_test,
+            seat=seat_test
+        )
+        self.path = TICKETS_URL+str(self.ticket_test.id)+'/'
+
+    def expire_holds(self):
+        """Move every hold to the past"""
+        Ticket.objects.filter(hold_expires_at__isnull=False).update(
+            hold_expires_at=timezone.now() - timedelta(minutes=1)
+        )
+
+    def test_ticket_hold_by_passenger(self):
+        """Test a held ticket is not reserved and blocks other passengers"""
+        self.client.force_authenticate(self.user_passenger)
+        response = self.client.post(self.path+'hold/', {'minutes': 5})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['reserved'])
+        self.assertIsNotNone(response.data['hold_expires_at'])
+
+        self.client.force_authenticate(self.user_passenger_2)
+        response = self.client.post(self.path+'reserve/')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_ticket_hold_confirm(self):
+        """Test a held ticket is reserved by confirming it"""
+        self.client.force_authenticate(self.user_passenger)
+        self.client.post(self.path+'hold/')
+        response = self.client.post(self.path+'confirm/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['reserved'])
+        self.assertIsNone(response.data['hold_expires_at'])
+
+    def test_ticket_hold_expired_confirm(self):
+        """Test an expired hold can not be confirmed"""
+        self.client.force_authenticate(self.user_passenger)
+        self.client.post(self.path+'hold/')
+        self.expire_holds()
+        response = self.client.post(self.path+'confirm/')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_ticket_hold_expired_reserve(self):
+        """Test an expired hold is free before being swept"""
+        self.client.force_authenticate(self.user_passenger)
+        self.client.post(self.path+'hold/')
+        self.expire_holds()
+
+        self.client.force_authenticate(self.user_passenger_2)
+        response = self.client.post(self.path+'reserve/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_ticket_release_by_other_passenger(self):
+        """Test a passenger can not release a ticket of other passenger"""
+        self.client.force_authenticate(self.user_passenger)
+        self.client.post(self.path+'hold/')
+
+        self.client.force_authenticate(self.user_passenger_2)
+        response = self.client.post(self.path+'release/')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_invalid_ticket_hold(self):
+        """Test hold minutes are limited"""
+        self.client.force_authenticate(self.user_passenger)
+        response = self.client.post(self.path+'hold/', {'minutes': 1000})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_release_expired_holds(self):
+        """Test expired holds are released in batches"""
+        seat = Seat.objects.get()
+        Ticket.objects.bulk_create([
+            Ticket(
+                created_by=self.user_admin,
+                trip=self.trip_test,
+                seat=seat,
+                passenger=self.user_passenger,
+                hold_expires_at=timezone.now() + timedelta(minutes=5)
+            )
+            for index in range(5)
+        ])
+        self.expire_holds()
+        Ticket.objects.filter(id=self.ticket_test.id).update(
+            passenger=self.user_passenger_2,
+            hold_expires_at=timezone.now() + timedelta(minutes=5)
+        )
+
+        self.assertEqual(release_expired_holds(batch_size=2), 5)
+        self.assertEqual(Ticket.objects.filter(passenger=None).count(), 5)
+        self.assertTrue(
+            Ticket.objects.filter(passenger=self.user_passenger_2).exists()
+        )
+
+    def test_release_expired_holds_command(self):
+        """Test expired holds are released on demand by command"""
+        self.client.force_authenticate(self.user_passenger)
+        self.client.post(self.path+'hold/')
+        self.expire_holds()
+
+        out = StringIO()
+        call_command('release_expired_holds', stdout=out)
+
+        self.ticket_test.refresh_from_db()
+        self.assertIn('Released 1 expired holds', out.getvalue())
+        self.assertIsNone(self.ticket_test.passenger)
+
+
+class BatchReserveTicketTest(TestCase):
+    """Test reservation of several tickets in one request"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.user_passenger = User.objects.create(
+            username='usernamepassenger',
+            password='testpass',
+            user_type=2,
+        )
+        route_test = Route.objects.create(
+            name='route-test',
+            origin='origin-test',
+            destination='destination-test',
+            created_by=self.user_admin
+        )
+        bus_test = Bus.objects.create(
+            num_plate='NNNN11',
+            created_by=self.user_admin
+        )
+        self.trip_test = Trip.objects.create(
+            name='trip-test',
+            begin_at=timezone.now(),
+            created_by=self.user_admin,
+            route=route_test,
+            bus=bus_test
+        )
+        for index in range(1, 6):
+            seat = Seat.objects.create(
+                number=index,
+                created_by=self.user_admin,
+                bus=bus_test
+            )
+            Ticket.objects.create(
+                created_by=self.user_admin,
+                trip=self.trip_test,
+                seat=seat
+            )
+        self.client.force_authenticate(self.user_passenger)
+
+    def test_batch_reserve_by_seats(self):
+        """Test several seats are reserved in one request"""
+        payload = {'trip': self.trip_test.id, 'seats': [1, 2, 3]}
+        response = self.client.post(RESERVE_URL, payload, format='json')
+
+        reserved = Ticket.objects.filter(passenger=self.user_passenger)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['status'] for item in response.data],
+            ['reserved', 'reserved', 'reserved']
+        )
+        self.assertEqual(reserved.count(), 3)
+
+    def test_batch_reserve_by_tickets(self):
+        """Test several tickets are reserved by id in one request"""
+        ticket_ids = list(Ticket.objects.values_list('id', flat=True)[:2])
+        payload = {'trip': self.trip_test.id, 'tickets': ticket_ids}
+        response = self.client.post(RESERVE_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['ticket'] for item in response.data],
+            ticket_ids
+        )
+
+    def test_batch_reserve_conflict_rollback(self):
+        """Test a taken seat rolls back the whole batch"""
+        Ticket.objects.filter(seat__number=2).update(
+            passenger=self.user_admin,
+            reserved=True
+        )
+        payload = {'trip': self.trip_test.id, 'seats': [1, 2, 9]}
+        response = self.client.post(RESERVE_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(
+            [(item['seat'], item['status']) for item in response.data],
+            [(1, 'available'), (2, 'conflict'), (9, 'not_found')]
+        )
+        self.assertFalse(
+            Ticket.objects.filter(passenger=self.user_passenger).exists()
+        )
+
+    def test_batch_reserve_locks_in_order(self):
+        """Test tickets of a batch are locked in order of id"""
+        payload = {'trip': self.trip_test.id, 'seats': [3, 1]}
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(RESERVE_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        locked = [
+            query['sql'] for query in captured
+            if '"main_ticket"."hold_expires_at"' in query['sql']
+        ]
+        self.assertTrue(locked[0].endswith('ORDER BY "main_ticket"."id" ASC'))
+
+    def test_batch_reserve_deadlock(self):
+        """Test a batch losing a lock race is a conflict"""
+        cause = Exception('deadlock detected')
+        cause.pgcode = '40P01'
+        error = OperationalError('deadlock detected')
+        error.__cause__ = cause
+
+        payload = {'trip': self.trip_test.id, 'seats': [1, 2]}
+        with patch('trip.reservations.claim_tickets', side_effect=error):
+            response = self.client.post(RESERVE_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['detail'].code, 'conflict')
+        self.assertFalse(
+            Ticket.objects.filter(passenger=self.user_passenger).exists()
+        )
+
+    def test_invalid_batch_reserve(self):
+        """Test seats or tickets are required to reserve in batch"""
+        payload = {'trip': self.trip_test.id}
+        response = self.client.post(RESERVE_URL, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SeatsCountersTicketTest(TestCase):
+    """Test seats counters of trips follow their tickets"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.user_passenger = User.objects.create(
+            username='usernamepassenger',
+            password='testpass',
+            user_type=2,
+        )
+        route_test = Route.objects.create(
+            name='route-test',
+            origin='origin-test',
+            destination='destination-test',
+            created_by=self.user_admin
+        )
+        self.bus_test = Bus.objects.create(
+            num_plate='NNNN11',
+            created_by=self.user_admin
+        )
+        self.trip_test = Trip.objects.create(
+            name='trip-test',
+            begin_at=timezone.now(),
+            created_by=self.user_admin,
+            route=route_test,
+            bus=self.bus_test,
+            seats_total=3
+        )
+        self.tickets = []
+        for index in range(1, 4):
+            seat = Seat.objects.create(
+                number=index,
+                created_by=self.user_admin,
+                bus=self.bus_test
+            )
+            self.tickets.append(Ticket.objects.create(
+                created_by=self.user_admin,
+                trip=self.trip_test,
+                seat=seat
+            ))
+        self.client.force_authenticate(self.user_passenger)
+
+    def assertCounters(self, total, reserved):
+        """Assert the seats counters of the trip"""
+        self.trip_test.refresh_from_db()
+        self.assertEqual(
+            (self.trip_test.seats_total, self.trip_test.seats_reserved),
+            (total, reserved)
+        )
+
+    def test_counters_reserve_and_release(self):
+        """Test reserving and releasing move the reserved counter"""
+        path = TICKETS_URL+str(self.tickets[0].id)+'/'
+        self.client.post(path+'reserve/')
+        self.assertCounters(3, 1)
+
+        self.client.post(path+'reserve/')
+        self.assertCounters(3, 1)
+
+        self.client.post(path+'release/')
+        self.assertCounters(3, 0)
+
+    def test_counters_hold_and_confirm(self):
+        """Test only a confirmed hold moves the reserved counter"""
+        path = TICKETS_URL+str(self.tickets[0].id)+'/'
+        self.client.post(path+'hold/')
+        self.assertCounters(3, 0)
+
+        self.client.post(path+'confirm/')
+        self.assertCounters(3, 1)
+
+    def test_counters_batch_reserve(self):
+        """Test a batch moves the counter only when it is reserved"""
+        payload = {'trip': self.trip_test.id, 'seats': [1, 2]}
+        self.client.post(RESERVE_URL, payload, format='json')
+        self.assertCounters(3, 2)
+
+        payload = {'trip': self.trip_test.id, 'seats': [2, 3]}
+        self.client.post(RESERVE_URL, payload, format='json')
+        self.assertCounters(3, 2)
+
+    def test_sync_trip_counters_command(self):
+        """Test drifted counters are reported and repaired by command"""
+        Ticket.objects.filter(id=self.tickets[0].id).update(
+            passenger=self.user_passenger,
+            reserved=True
+        )
+
+        out = StringIO()
+        call_command('sync_trip_counters', '--dry-run', stdout=out)
+        self.assertIn('Found 1 drifted trips', out.getvalue())
+        self.assertCounters(3, 0)
+
+        out = StringIO()
+        call_command('sync_trip_counters', '--batch-size', '1', stdout=out)
+        self.assertIn('Repaired 1 drifted trips', out.getvalue())
+        self.assertCounters(3, 1)
+
+
+class ConcurrentReserveTicketTest(TransactionTestCase):
+    """Test concurrent reservations never book a ticket twice"""
+
+    threads = 8
+
+    def setUp(self):
+        user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.passengers = [
+            User.objects.create(
+                username='usernamepassenger'+str(index),
+                password='testpass',
+                user_type=2,
+            )
+            for index in range(self.threads)
+        ]
+        route_test = Route.objects.create(
+            name='route-test',
+            origin='origin-test',
+            destination='destination-test',
+            created_by=user_admin
+        )
+        bus_test = Bus.objects.create(
+            num_plate='NNNN11',
+            created_by=user_admin
+        )
+        trip_test = Trip.objects.create(
+            name='trip-test',
+            begin_at=timezone.now(),
+            created_by=user_admin,
+            route=route_test,
+            bus=bus_test
+        )
+        seats = Seat.objects.bulk_create([
+            Seat(number=index, created_by=user_admin, bus=bus_test)
+            for index in range(1, 21)
+        ])
+        Ticket.objects.bulk_create([
+            Ticket(created_by=user_admin, trip=trip_test, seat=seat)
+            for seat in Seat.objects.filter(id__in=[s.id for s in seats])
+        ])
+
+    def test_concurrent_reservations_no_double_booking(self):
+        """Test every ticket is won by exactly one of the passengers"""
+        ticket_ids = list(Ticket.objects.values_list('id', flat=True))
+        barrier = threading.Barrier(self.threads)
+        wins = []
+        lock = threading.Lock()
+
+        def reserve_all(passenger):
+            barrier.wait()
+            try:
+                for ticket_id in ticket_ids:
+                    if reserve_ticket(ticket_id, passenger):
+                        with lock:
+                            wins.append((ticket_id, passenger.id))
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=reserve_all, args=(passenger,))
+            for passenger in self.passengers
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        won_tickets = [ticket_id for ticket_id, passenger_id in wins]
+        self.assertEqual(sorted(won_tickets), sorted(ticket_ids))
+        for ticket_id, passenger_id in wins:
+            ticket = Ticket.objects.get(id=ticket_id)
+            self.assertEqual(ticket.passenger_id, passenger_id)
+            self.assertTrue(ticket.reserved)
@@ -1,21 +1,31 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.db import connection
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from main.models import Trip, User, Route, Bus
+from main.models import Trip, User, Route, Bus, Seat, Ticket
 from trip.serializers import TripSerializer
+from trip.tests.helpers import clear_caches, QueryBoundMixin
+from trip.views import search_trips
 
 
 TRIPS_URL = reverse('trip:trip-list')
+TRIPS_BULK_URL = reverse('trip:trip-bulk-create')
+TRIPS_SEARCH_URL = reverse('trip:trip-search')
 
 
 class PublicTripTest(TestCase):
     """Tests public available trips requests"""
 
     def setUp(self):
+        clear_caches()
         self.client = APIClient()
         self.user_admin = User.objects.create(
             username='usernameadmin',
@@ -40,7 +50,7 @@ class PublicTripTest(TestCase):
         trips = Trip.objects.all()
         serializer = TripSerializer(trips, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data['results'], serializer.data)
 
     def test_login_not_required_trip_detail(self):
         """Test login is not required to access detail trip"""
@@ -90,6 +100,7 @@ class PrivateTripTest(TestCase):
     """Test available trip request by logged user"""
 
     def setUp(self):
+        clear_caches()
         self.client = APIClient()
         self.user_admin = User.objects.create(
             username='usernameadmin',
@@ -140,8 +151,8 @@ class PrivateTripTest(TestCase):
         trips = Trip.objects.all()
         serializer = TripSerializer(trips, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data['results'], serializer.data)
+        self.assertEqual(len(response.data['results']), 2)
 
     def test_trip_list_by_driver(self):
         """Test logged driver access to list trip"""
@@ -166,8 +177,8 @@ class PrivateTripTest(TestCase):
         trips = Trip.objects.all()
         serializer = TripSerializer(trips, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data['results'], serializer.data)
+        self.assertEqual(len(response.data['results']), 2)
 
     def test_trip_list_by_admin(self):
         """Test logged admin access to list trip"""
@@ -192,8 +203,8 @@ class PrivateTripTest(TestCase):
         trips = Trip.objects.all()
         serializer = TripSerializer(trips, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data['results'], serializer.data)
+        self.assertEqual(len(response.data['results']), 2)
 
     def test_trip_detail_by_passenger(self):
         """Test logged passenger access to detail trip"""
@@ -399,3 +410,290 @@ class PrivateTripTest(TestCase):
         self.client.force_authenticate(self.user_admin)
         response = self.client.delete(TRIPS_URL+'1/')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TicketsCreationTripTest(TestCase):
+    """Test tickets created with trips by admin"""
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.route_test = Route.objects.create(
+            name='route-test',
+            origin='origin-test',
+            destination='destination-test',
+            created_by=self.user_admin
+        )
+        self.bus_test = Bus.objects.create(
+            num_plate='NNNN11-test',
+            created_by=self.user_admin
+        )
+        Seat.objects.bulk_create([
+            Seat(number=index, created_by=self.user_admin, bus=self.bus_test)
+            for index in range(1, 41)
+        ])
+        self.client.force_authenticate(self.user_admin)
+
+    def trip_payload(self, name):
+        """Payload for create a trip"""
+        return {
+            'name': name,
+            'begin_at': '2021-01-01T10:00:00',
+            'route': self.route_test.id,
+            'bus': self.bus_test.id,
+        }
+
+    def test_trip_create_tickets_by_seat(self):
+        """Test a ticket is created for each seat of the bus"""
+        response = self.client.post(TRIPS_URL, self.trip_payload('triptest'))
+
+        trip = Trip.objects.get(id=response.data['id'])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(trip.tickets_trip.count(), 40)
+        self.assertEqual(len(response.data['tickets_trip']), 40)
+
+    def test_trip_create_seats_counters(self):
+        """Test seats counters of a new trip match its tickets"""
+        response = self.client.post(TRIPS_URL, self.trip_payload('triptest'))
+
+        self.assertEqual(response.data['seats_total'], 40)
+        self.assertEqual(response.data['seats_reserved'], 0)
+
+    def test_trip_create_queries_not_by_seat(self):
+        """Test tickets are inserted in a batch, not one by seat"""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(TRIPS_URL, self.trip_payload('triptest'))
+
+        inserts = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('INSERT INTO "main_ticket"')
+        ]
+        self.assertEqual(len(inserts), 1)
+
+    def test_trip_create_rollback_without_tickets(self):
+        """Test a failure creating tickets does not leave the trip"""
+        with patch.object(
+            Ticket.objects, 'bulk_create', side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                self.client.post(TRIPS_URL, self.trip_payload('triptest'))
+
+        self.assertFalse(Trip.objects.exists())
+
+    def test_trip_bulk_create_by_admin(self):
+        """Test several trips and their tickets are created at once"""
+        payload = [self.trip_payload('triptest-'+str(i)) for i in range(3)]
+        response = self.client.post(TRIPS_BULK_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(Trip.objects.count(), 3)
+        self.assertEqual(Ticket.objects.count(), 120)
+
+    def test_invalid_trip_bulk_create_by_admin(self):
+        """Test an invalid trip rejects the whole bulk creation"""
+        payload = [self.trip_payload('triptest'), self.trip_payload('')]
+        response = self.client.post(TRIPS_BULK_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Trip.objects.exists())
+
+    def test_trip_bulk_create_by_passenger(self):
+        """Test logged passenger access to bulk create trips"""
+        user_passenger = User.objects.create(
+            username='usernamepassenger',
+            password='testpass',
+            user_type=2,
+        )
+        payload = [self.trip_payload('triptest')]
+
+        self.client.force_authenticate(user_passenger)
+        response = self.client.post(TRIPS_BULK_URL, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class QueriesTripTest(QueryBoundMixin, TestCase):
+    """Test queries of trip requests do not grow with the rows"""
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.route_test = Route.objects.create(
+            name='route-test',
+            origin='origin-test',
+            destination='destination-test',
+            created_by=self.user_admin
+        )
+        self.bus_test = Bus.objects.create(
+            num_plate='NNNN11',
+            created_by=self.user_admin
+        )
+        self.seat_test = Seat.objects.create(
+            number=1,
+            created_by=self.user_admin,
+            bus=self.bus_test
+        )
+
+    def create_trips(self, step):
+        """Create five trips with tickets"""
+        for index in range(5):
+            trip = Trip.objects.create(
+                name='trip-test-'+str(index),
+                begin_at=timezone.now(),
+                created_by=self.user_admin,
+                route=self.route_test,
+                bus=self.bus_test
+            )
+            Ticket.objects.create(
+                created_by=self.user_admin,
+                trip=trip,
+                seat=self.seat_test
+            )
+
+    def test_trip_list_queries_bounded(self):
+        """Test trip list loads tickets of every trip in bulk"""
+        response = self.assertQueriesBounded(
+            lambda: self.client.get(TRIPS_URL),
+            self.create_trips,
+            max_queries=2
+        )
+        self.assertEqual(len(response.data['results']), 15)
+
+    def test_trip_list_no_duplicate_queries(self):
+        """Test trip list runs no query by trip"""
+        self.create_trips(0)
+        self.assertNoDuplicateQueries(lambda: self.client.get(TRIPS_URL))
+
+
+class SearchTripTest(TestCase):
+    """Test search of trips between two places"""
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.route_test = Route.objects.create(
+            name='route-test',
+            origin='Santiago',
+            destination='Valparaiso',
+            created_by=self.user_admin
+        )
+        self.route_back = Route.objects.create(
+            name='route-back',
+            origin='Valparaiso',
+            destination='Santiago',
+            created_by=self.user_admin
+        )
+        self.bus_test = Bus.objects.create(
+            num_plate='NNNN11',
+            created_by=self.user_admin
+        )
+        Seat.objects.bulk_create([
+            Seat(number=index, created_by=self.user_admin, bus=self.bus_test)
+            for index in range(1, 4)
+        ])
+        self.client.force_authenticate(self.user_admin)
+        for route, begin_at in (
+            (self.route_test, '2021-03-01T08:00:00'),
+            (self.route_test, '2021-03-01T18:00:00'),
+            (self.route_test, '2021-03-02T08:00:00'),
+            (self.route_back, '2021-03-01T10:00:00'),
+        ):
+            self.client.post(TRIPS_URL, {
+                'name': 'trip-test',
+                'begin_at': begin_at,
+                'route': route.id,
+                'bus': self.bus_test.id,
+            })
+        self.client.force_authenticate(None)
+
+    def test_search_trips_by_date(self):
+        """Test trips of a route on a date are found with free seats"""
+        response = self.client.get(TRIPS_SEARCH_URL, {
+            'origin': 'Santiago',
+            'destination': 'Valparaiso',
+            'date': '2021-03-01',
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(
+            [trip['free_seats'] for trip in response.data['results']],
+            [3, 3]
+        )
+
+    def test_search_trips_without_free_seats(self):
+        """Test full trips are excluded unless requested"""
+        trip = Trip.objects.filter(route=self.route_test).first()
+        trip.tickets_trip.update(passenger=self.user_admin, reserved=True)
+        trip.seats_reserved = trip.seats_total
+        trip.save()
+        params = {'origin': 'Santiago', 'destination': 'Valparaiso'}
+
+        response = self.client.get(TRIPS_SEARCH_URL, params)
+        self.assertEqual(len(response.data['results']), 2)
+
+        params['available'] = 'false'
+        response = self.client.get(TRIPS_SEARCH_URL, params)
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_search_trips_fully_held(self):
+        """Test trips with every seat held are excluded, expired holds not"""
+        trips = Trip.objects.filter(route=self.route_test).order_by('id')
+        now = timezone.now()
+        trips[0].tickets_trip.update(
+            passenger=self.user_admin,
+            hold_expires_at=now + timedelta(minutes=10)
+        )
+        trips[1].tickets_trip.update(
+            passenger=self.user_admin,
+            hold_expires_at=now - timedelta(minutes=10)
+        )
+        params = {'origin': 'Santiago', 'destination': 'Valparaiso'}
+
+        response = self.client.get(TRIPS_SEARCH_URL, params)
+        self.assertEqual(
+            [trip['id'] for trip in response.data['results']],
+            [trips[1].id, trips[2].id]
+        )
+        self.assertEqual(response.data['results'][0]['free_seats'], 3)
+
+        params['available'] = 'false'
+        response = self.client.get(TRIPS_SEARCH_URL, params)
+        self.assertEqual(response.data['results'][0]['free_seats'], 0)
+
+    def test_search_trips_by_range(self):
+        """Test trips are found by a range of begin dates"""
+        response = self.client.get(TRIPS_SEARCH_URL, {
+            'origin': 'Santiago',
+            'destination': 'Valparaiso',
+            'begin_from': '2021-03-01T12:00:00',
+            'begin_to': '2021-03-03T00:00:00',
+        })
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_invalid_search_trips(self):
+        """Test origin and destination are required to search"""
+        response = self.client.get(TRIPS_SEARCH_URL, {'origin': 'Santiago'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @skipUnlessDBFeature('supports_explaining_query_execution')
+    def test_search_trips_uses_indexes(self):
+        """Test search reads routes and trips through composite indexes"""
+        plan = search_trips('Santiago', 'Valparaiso', True).explain()
+        self.assertIn('main_route_origin_cfba17_idx', plan)
+        self.assertIn('main_trip_route_i_cae9b3_idx', plan)
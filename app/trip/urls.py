@@ -6,6 +6,7 @@ from trip import views
 router = DefaultRouter()
 router.register(r'routes', views.RouteViewSet)
 router.register(r'buses', views.BusViewSet)
+router.register(r'layouts', views.SeatLayoutViewSet)
 router.register(r'seats', views.SeatViewSet)
 router.register(r'trips', views.TripViewSet)
 router.register(r'tickets', views.TicketViewSet)
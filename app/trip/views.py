@@ -1,57 +1,151 @@
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from django.db.models import Q, Count
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
+from django.db.models import F, Sum, FloatField, ExpressionWrapper
+from django.db.models.functions import Coalesce, NullIf
+from django.http import Http404
+from django.utils import timezone
 
+from app.fieldsets import FieldsetQuerysetMixin
+from app.pagination import BeginAtCursorPagination
+from app.streaming import StreamingListMixin, stream_requested, \
+                          streaming_response
 from main import models
 from trip import serializers
+from trip.idempotency import IdempotentMixin, idempotent
+from trip.response_cache import CachedResponseMixin
+from trip.seat_map import get_seat_map, invalidate_seat_maps
+from trip.reservations import TicketConflict, reserve_ticket, \
+                             reserve_trip_tickets, hold_ticket, \
+                             confirm_ticket, release_ticket, tickets_count
 from trip.permissions import IsAdminRoute, IsAdminBus, \
                             IsPassengerTicket, IsAdminProfile
 
 
-def add_passenger_average(route):
-    """Complementary function for get average of passengers in route"""
-    average = 0
-    route_quantity = models.Trip.objects.filter(
-        route__id=route.get('id')
-    ).count()
-    route_passengers = models.Trip.objects.filter(
-        tickets_trip__reserved=True
-    ).count()
-
-    if route_quantity > 0:
-        average = route_passengers/route_quantity
-    route['average'] = round(average, 4)
-    return route
-
-
-def percentage_buses_use_by_route(bus, route_id, percentage):
-    """Complementary function for get percentage of usage buses"""
-    buses = []
-    pctage = models.Trip.objects.filter(
-        bus__id=bus.get('id'),
-        route__id=route_id
+def routes_passenger_average(routes):
+    """Complementary function for get average of passengers by route
+
+    Trips and reserved tickets are read from the route rollup in a single
+    grouped query, so the cost does not depend on the number of trips nor
+    on the number of tickets.
+    """
+    routes = routes.annotate(
+        trips_quantity=Coalesce(Sum('stats_route__trips'), 0),
+        passengers=Coalesce(Sum('stats_route__reserved'), 0),
+    ).order_by('id')
+
+    data = []
+    for route in routes:
+        average = 0
+        if route.trips_quantity > 0:
+            average = route.passengers/route.trips_quantity
+        data.append({
+            'id': route.id,
+            'name': route.name,
+            'origin': route.origin,
+            'destination': route.destination,
+            'average': round(average, 4),
+        })
+    return data
+
+
+def buses_use_by_route(route_ids, percentage):
+    """Complementary function for get percentage of usage buses by route
+
+    Reserved and total tickets are read from the route rollup grouped by
+    (bus, route) in one query and the percentage threshold is applied in
+    the database.
+    """
+    stats = models.RouteStats.objects.all()
+    if route_ids:
+        stats = stats.filter(route__id__in=route_ids)
+
+    pctage = stats.values(
+        'bus', 'bus__num_plate', 'bus__driver', 'route'
+    ).annotate(
+        reserved_sum=Sum('reserved'),
+        total=Sum('tickets'),
     ).annotate(
-        pctage=Count(
-            'tickets_trip',
-            filter=Q(tickets_trip__reserved=True)
-        ) * 100/Count('tickets_trip')
+        use_percentage=ExpressionWrapper(
+            F('reserved_sum') * 100.0/NullIf(F('total'), 0),
+            output_field=FloatField()
+        )
     ).filter(
-        pctage__gt=percentage
-    )
+        use_percentage__gt=percentage
+    ).order_by('route', 'bus')
+
+    for bus_per in pctage.iterator():
+        yield {
+            'id': bus_per['bus'],
+            'num_plate': bus_per['bus__num_plate'],
+            'driver': bus_per['bus__driver'],
+            'route': bus_per['route'],
+            'reserved': bus_per['reserved_sum'],
+            'total': bus_per['total'],
+            'use_percentage': round(bus_per['use_percentage'], 4),
+        }
+
 
-    for bus_per in pctage:
-        bus["use_percentage"] = bus_per.pctage
-        buses.append(bus)
+def parse_route_ids(query_params):
+    """Complementary function for read one or several route ids"""
+    route_ids = []
+    for value in query_params.getlist('route_id'):
+        route_ids.extend(item for item in value.split(',') if item)
 
-    return buses
+    try:
+        return [int(route_id) for route_id in route_ids]
+    except ValueError:
+        raise ValidationError({'route_id': 'Debe ser una lista de enteros.'})
 
 
-class RouteViewSet(viewsets.ModelViewSet):
+def parse_percentage(query_params):
+    """Complementary function for read percentage threshold"""
+    try:
+        return float(query_params.get('percentage', 0))
+    except ValueError:
+        raise ValidationError({'percentage': 'Debe ser un número.'})
+
+
+def search_trips(origin, destination, available, begin_from=None,
+                 begin_to=None):
+    """Complementary function for search trips with their free seats
+
+    Route is filtered by (origin, destination) and trips by
+    (route, begin_at), both covered by composite indexes. Free seats come
+    from the seats counters of the trip less its active holds, counted
+    over the tickets of the trip.
+    """
+    trips = models.Trip.objects.filter(
+        route__origin=origin,
+        route__destination=destination
+    )
+    if begin_from:
+        trips = trips.filter(begin_at__gte=begin_from)
+    if begin_to:
+        trips = trips.filter(begin_at__lt=begin_to)
+
+    trips = trips.select_related('route').annotate(
+        free_seats=F('seats_total') - F('seats_reserved') - tickets_count(
+            reserved=False,
+            passenger__isnull=False,
+            hold_expires_at__gt=timezone.now()
+        )
+    )
+    if available:
+        trips = trips.filter(free_seats__gt=0)
+    return trips
+
+
+class RouteViewSet(CachedResponseMixin, FieldsetQuerysetMixin,
+                   viewsets.ModelViewSet):
     """Manage route actions in database"""
     queryset = models.Route.objects.all()
     serializer_class = serializers.RouteSerializer
     permission_classes = [IsAdminRoute]
+    cache_model = 'route'
+    invalidates_models = ('trip',)
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
@@ -59,64 +153,191 @@ class RouteViewSet(viewsets.ModelViewSet):
     @action(methods=['get'], detail=False, permission_classes=[IsAdminProfile])
     def average_passengers(self, request):
         """Getting average passengers"""
-        data = []
-        serializer = self.serializer_class(self.queryset, many=True)
-        for route in serializer.data:
-            data.append(add_passenger_average(route))
-
+        data = routes_passenger_average(self.get_queryset())
         return Response(data, status=status.HTTP_200_OK)
 
 
-class BusViewSet(viewsets.ModelViewSet):
+class BusViewSet(CachedResponseMixin, FieldsetQuerysetMixin,
+                 IdempotentMixin, viewsets.ModelViewSet):
     """Manage bus actions in database"""
     queryset = models.Bus.objects.all()
     serializer_class = serializers.BusSerializer
     permission_classes = [IsAdminBus]
+    invalidates_models = ('trip', 'seat')
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
+    @action(methods=['post'], detail=False, url_path='bulk')
+    @idempotent
+    def bulk_create(self, request):
+        """Creating several buses and their seats in one request"""
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
     @action(methods=['get'], detail=False, permission_classes=[IsAdminProfile])
     def use_by_route(self, request):
-        """Getting use percentage of route"""
-        data = []
-        route_id = request.query_params.get('route_id')
-        percentage = request.query_params.get('percentage')
-        serializer = self.serializer_class(self.queryset, many=True)
-        for bus in serializer.data:
-            tmp_buses = percentage_buses_use_by_route(
-                bus,
-                route_id,
-                percentage
+        """Getting use percentage of buses by one or several routes"""
+        route_ids = parse_route_ids(request.query_params)
+        percentage = parse_percentage(request.query_params)
+        if stream_requested(request):
+            return streaming_response(
+                buses_use_by_route(route_ids, percentage)
             )
-            data = data + tmp_buses
-
+        data = list(buses_use_by_route(route_ids, percentage))
         return Response(data, status=status.HTTP_200_OK)
 
 
-class SeatViewSet(viewsets.ModelViewSet):
+class SeatLayoutViewSet(CachedResponseMixin, FieldsetQuerysetMixin,
+                        viewsets.ModelViewSet):
+    """Manage seat layout actions in database"""
+    queryset = models.SeatLayout.objects.all()
+    serializer_class = serializers.SeatLayoutSerializer
+    permission_classes = [IsAdminProfile]
+    invalidates_models = ('trip', 'seat')
+
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user)
+
+
+class SeatViewSet(StreamingListMixin, CachedResponseMixin,
+                  FieldsetQuerysetMixin, viewsets.ModelViewSet):
     """Manage seat actions in database"""
     queryset = models.Seat.objects.all()
     serializer_class = serializers.SeatSerializer
     permission_classes = [IsPassengerTicket]
+    cache_model = 'seat'
 
 
-class TripViewSet(viewsets.ModelViewSet):
+class TripViewSet(StreamingListMixin, CachedResponseMixin,
+                  FieldsetQuerysetMixin, IdempotentMixin,
+                  viewsets.ModelViewSet):
     """Manage trip actions in database"""
     queryset = models.Trip.objects.all()
     serializer_class = serializers.TripSerializer
     permission_classes = [IsAdminRoute]
+    lookup_value_regex = '[0-9]+'
+    cache_model = 'trip'
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
+    def perform_destroy(self, instance):
+        trip_id = instance.id
+        instance.delete()
+        invalidate_seat_maps([trip_id])
+
+    @action(methods=['post'], detail=False, url_path='bulk')
+    @idempotent
+    def bulk_create(self, request):
+        """Creating several trips and their tickets in one request"""
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(methods=['get'], detail=False)
+    def search(self, request):
+        """Searching trips between two places by date with free seats"""
+        serializer = serializers.TripSearchSerializer(
+            data=request.query_params
+        )
+        serializer.is_valid(raise_exception=True)
+        trips = search_trips(**serializer.validated_data)
+
+        paginator = BeginAtCursorPagination()
+        page = paginator.paginate_queryset(trips, request, view=self)
+        serializer = serializers.TripSearchResultSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(methods=['get'], detail=True, url_path='seat-map')
+    def seat_map(self, request, pk=None):
+        """Getting availability of seats of a trip"""
+        data = get_seat_map(pk)
+        if data is None:
+            raise Http404
+        return Response(data, status=status.HTTP_200_OK)
+
 
-class TicketViewSet(viewsets.ModelViewSet):
+class TicketViewSet(StreamingListMixin, FieldsetQuerysetMixin,
+                    IdempotentMixin, viewsets.ModelViewSet):
     """Manage ticket actions in database"""
     queryset = models.Ticket.objects.all()
     serializer_class = serializers.TicketSerializer
     permission_classes = [IsPassengerTicket]
+    lookup_value_regex = '[0-9]+'
 
     def perform_update(self, serializer):
-        if self.request.data.get('reserved', False):
-            serializer.save(passenger=self.request.user)
+        if not serializer.validated_data.get('reserved', False):
+            raise ValidationError({
+                'reserved': 'Solo puede reservar el ticket, para liberarlo '
+                            'use release.'
+            })
+        if not reserve_ticket(serializer.instance.id, self.request.user):
+            raise TicketConflict()
+        serializer.instance.refresh_from_db()
+
+    @action(methods=['post'], detail=True)
+    @idempotent
+    def reserve(self, request, pk=None):
+        """Reserving a free ticket for the logged passenger"""
+        if not reserve_ticket(pk, request.user):
+            get_object_or_404(self.get_queryset(), pk=pk)
+            raise TicketConflict()
+        return self.ticket_response(pk)
+
+    @action(methods=['post'], detail=True)
+    @idempotent
+    def hold(self, request, pk=None):
+        """Holding a free ticket for the logged passenger during checkout"""
+        serializer = serializers.TicketHoldSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        minutes = serializer.validated_data.get('minutes')
+
+        if not hold_ticket(pk, request.user, minutes):
+            get_object_or_404(self.get_queryset(), pk=pk)
+            raise TicketConflict()
+        return self.ticket_response(pk)
+
+    @action(methods=['post'], detail=True)
+    @idempotent
+    def confirm(self, request, pk=None):
+        """Reserving a ticket held by the logged passenger"""
+        if not confirm_ticket(pk, request.user):
+            get_object_or_404(self.get_queryset(), pk=pk)
+            raise TicketConflict('El ticket no está retenido por usted.')
+        return self.ticket_response(pk)
+
+    @action(methods=['post'], detail=True)
+    @idempotent
+    def release(self, request, pk=None):
+        """Freeing a ticket held or reserved by the logged passenger"""
+        if not release_ticket(pk, request.user):
+            get_object_or_404(self.get_queryset(), pk=pk)
+            raise TicketConflict('El ticket no pertenece a usted.')
+        return self.ticket_response(pk)
+
+    def ticket_response(self, pk):
+        """Complementary function for respond the ticket after an action"""
+        ticket = self.get_queryset().get(pk=pk)
+        serializer = self.get_serializer(ticket)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(methods=['post'], detail=False, url_path='reserve')
+    @idempotent
+    def reserve_batch(self, request):
+        """Reserving several tickets of a trip for the logged passenger"""
+        serializer = serializers.TicketBatchReserveSerializer(
+            data=request.data
+        )
+        serializer.is_valid(raise_exception=True)
+        reserved, results = reserve_trip_tickets(
+            user=request.user,
+            **serializer.validated_data
+        )
+
+        if not reserved:
+            return Response(results, status=status.HTTP_409_CONFLICT)
+        return Response(results, status=status.HTTP_200_OK)
@@ -1,5 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class UserConfig(AppConfig):
     name = 'user'
+
+    def ready(self):
+        from rest_framework.authtoken.models import Token
+        from main.models import User
+        from user.authentication import token_deleted, user_changed
+
+        post_delete.connect(token_deleted, sender=Token)
+        post_save.connect(user_changed, sender=User)
+        post_delete.connect(user_changed, sender=User)
@@ -0,0 +1,182 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from main.models import User
+
+
+USER_CACHED_FIELDS = ('id', 'user_type', 'is_active')
+
+
+class TokenCache:
+    """Bounded LRU of token keys to user data, entries expire after ttl"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def delete_user(self, user_id):
+        with self.lock:
+            keys = [
+                key for key, (expires, value) in self.entries.items()
+                if value[0] == user_id
+            ]
+            for key in keys:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+token_cache = TokenCache(
+    settings.TOKEN_AUTH_CACHE_SIZE,
+    settings.TOKEN_AUTH_CACHE_TTL
+)
+
+
+def shared_cache():
+    """Generic function for getting the optional shared cache tier"""
+    if settings.TOKEN_AUTH_SHARED_CACHE:
+        return caches[settings.TOKEN_AUTH_SHARED_CACHE]
+    return None
+
+
+def shared_cache_key(key):
+    """Generic function for naming a token in the shared cache"""
+    return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def invalidate_token(key):
+    """Generic function for removing a token from every cache tier"""
+    token_cache.delete(key)
+    cache = shared_cache()
+    if cache is not None:
+        cache.delete(shared_cache_key(key))
+
+
+def invalidate_user(user_id):
+    """Generic function for removing tokens of a user from every tier"""
+    token_cache.delete_user(user_id)
+    cache = shared_cache()
+    if cache is not None:
+        keys = Token.objects.filter(user_id=user_id).values_list(
+            'key',
+            flat=True
+        )
+        cache.delete_many([shared_cache_key(key) for key in keys])
+
+
+def build_user(values):
+    """Generic function for building a user with only the cached fields
+
+    from_db expects the values in the order of the model fields, the other
+    fields are deferred.
+    """
+    cached = dict(zip(USER_CACHED_FIELDS, values))
+    field_names = [
+        field.attname for field in User._meta.concrete_fields
+        if field.attname in cached
+    ]
+    return User.from_db(
+        DEFAULT_DB_ALIAS,
+        field_names,
+        [cached[name] for name in field_names]
+    )
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication caching the token to user mapping
+
+    The user of a token is looked up in an in-process LRU, then in the
+    optional shared cache, and only then in the database. The request user
+    is built with id, user_type and is_active loaded; any other field is
+    deferred and read from the database on first access.
+    """
+
+    def authenticate_credentials(self, key):
+        values = self.cached_user_values(key)
+
+        if values is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not values[2]:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+
+        user = build_user(values)
+        token = Token(key=key, user=user)
+        token._state.adding = False
+        return (user, token)
+
+    def cached_user_values(self, key):
+        """Getting (id, user_type, is_active) of the token user"""
+        values = token_cache.get(key)
+        if values is not None:
+            return values
+
+        cache = shared_cache()
+        if cache is not None:
+            values = cache.get(shared_cache_key(key))
+
+        if values is None:
+            values = Token.objects.filter(key=key).values_list(
+                *('user__' + field for field in USER_CACHED_FIELDS)
+            ).first()
+            if values is None:
+                return None
+            if cache is not None:
+                cache.set(
+                    shared_cache_key(key),
+                    values,
+                    settings.TOKEN_AUTH_CACHE_TTL
+                )
+
+        token_cache.set(key, tuple(values))
+        return tuple(values)
+
+
+def token_deleted(sender, instance, **kwargs):
+    """Signal receiver invalidating a deleted token"""
+    invalidate_token(instance.key)
+
+
+def user_changed(sender, instance, **kwargs):
+    """Signal receiver invalidating tokens of a changed user"""
+    invalidate_user(instance.pk)
@@ -2,6 +2,7 @@ from django.contrib.auth import password_validation, authenticate
 from rest_framework import serializers
 from rest_framework.authtoken.models import Token
 
+from app.fieldsets import FieldsetMixin
 from main.models import User
 
 
@@ -45,7 +46,7 @@ def validate_login_user(self, data, user_type):
     return data
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(FieldsetMixin, serializers.ModelSerializer):
     """Serializer for User object"""
     class Meta:
         model = User
@@ -0,0 +1,118 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from main.models import User
+from user.authentication import CachedTokenAuthentication, TokenCache, \
+                                token_cache
+
+
+ROUTES_URL = reverse('trip:route-list')
+AVERAGE_URL = reverse('trip:route-average-passengers')
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    """Test token authentication cached by process"""
+
+    def setUp(self):
+        token_cache.clear()
+        cache.clear()
+        self.client = APIClient()
+        self.user_admin = User.objects.create(
+            username='usernameadmin',
+            password='testpass',
+            user_type=1,
+        )
+        self.token = Token.objects.create(user=self.user_admin)
+        self.client.credentials(HTTP_AUTHORIZATION='Token '+self.token.key)
+
+    def test_token_cached_after_first_request(self):
+        """Test the token is read from the database only once"""
+        with self.assertNumQueries(2):
+            response = self.client.get(AVERAGE_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(AVERAGE_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_invalid_token(self):
+        """Test an unknown token is rejected"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+        response = self.client.get(AVERAGE_URL)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_deleted_invalidated(self):
+        """Test a deleted token is not accepted from the cache"""
+        self.client.get(AVERAGE_URL)
+        self.token.delete()
+
+        response = self.client.get(AVERAGE_URL)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_changed_invalidated(self):
+        """Test changes of the user are seen by cached tokens"""
+        self.client.get(AVERAGE_URL)
+        self.user_admin.user_type = 2
+        self.user_admin.save()
+
+        response = self.client.get(AVERAGE_URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user_admin.is_active = False
+        self.user_admin.save()
+        response = self.client.get(ROUTES_URL)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(TOKEN_AUTH_SHARED_CACHE='default')
+    def test_token_shared_cache(self):
+        """Test a token in the shared cache skips the database"""
+        self.client.get(AVERAGE_URL)
+        token_cache.clear()
+
+        with self.assertNumQueries(1):
+            response = self.client.get(AVERAGE_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.token.delete()
+        token_cache.clear()
+        response = self.client.get(AVERAGE_URL)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_request_user_cached_fields(self):
+        """Test the request user has the cached fields of the user"""
+        authentication = CachedTokenAuthentication()
+        user, token = authentication.authenticate_credentials(self.token.key)
+        user, token = authentication.authenticate_credentials(self.token.key)
+
+        self.assertEqual(user.pk, self.user_admin.pk)
+        self.assertEqual(user.user_type, 1)
+        self.assertTrue(user.is_active)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.username, 'usernameadmin')
+
+
+class TokenCacheTest(TestCase):
+    """Test bounded LRU of tokens"""
+
+    def test_least_recently_used_evicted(self):
+        """Test the least recently used token is evicted first"""
+        tokens = TokenCache(maxsize=2, ttl=60)
+        tokens.set('key-1', (1, 1, True))
+        tokens.set('key-2', (2, 1, True))
+        tokens.get('key-1')
+        tokens.set('key-3', (3, 1, True))
+
+        self.assertEqual(len(tokens), 2)
+        self.assertIsNone(tokens.get('key-2'))
+        self.assertEqual(tokens.get('key-1'), (1, 1, True))
+
+    def test_expired_entry(self):
+        """Test expired entries are not returned"""
+        tokens = TokenCache(maxsize=2, ttl=-1)
+        tokens.set('key-1', (1, 1, True))
+        self.assertIsNone(tokens.get('key-1'))